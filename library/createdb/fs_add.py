@@ -1,4 +1,4 @@
-import argparse, json, math, os, sys
+import argparse, json, os, sys
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
@@ -7,7 +7,7 @@ from shutil import which
 from library import usage
 from library.createdb.fs_add_metadata import extract_image_metadata_chunk, extract_metadata
 from library.createdb.subtitle import clean_up_temp_dirs
-from library.mediadb import db_media, db_playlists, playlists
+from library.mediadb import db_folders, db_journal, db_media, db_playlists, playlists
 from library.utils import (
     arg_utils,
     arggroups,
@@ -18,6 +18,7 @@ from library.utils import (
     iterables,
     objects,
     printing,
+    processes,
 )
 from library.utils.consts import SC, DBType
 from library.utils.log_utils import log
@@ -57,7 +58,7 @@ def parse_args(action, usage):
     args = parser.parse_intermixed_args()
     arggroups.args_post(args, parser, create_db=action == SC.fs_add)
 
-    if not args.profiles:
+    if not args.profiles and action == SC.fs_add:  # fs_update uses the profiles saved in extractor_config
         args.profiles = [DBType.video]
 
     if args.copy:
@@ -68,7 +69,7 @@ def parse_args(action, usage):
     if hasattr(args, "paths"):
         args.paths = iterables.conform(args.paths)
 
-    if not which("ffprobe") and (DBType.audio in args.profiles or DBType.video in args.profiles):
+    if not which("ffprobe") and (DBType.audio in (args.profiles or []) or DBType.video in (args.profiles or [])):
         log.error("ffmpeg is not installed. Install it with your package manager.")
         raise SystemExit(3)
 
@@ -105,39 +106,50 @@ def extract_chunk(args, media) -> None:
     media = [{"playlists_id": args.playlists_id, **d} for d in media]
     args.db["media"].insert_all(media, pk=["playlists_id", "path"], alter=True, replace=True)
 
-    for d in captions:
-        media_id = args.db.pop("select id from media where path = ?", [d["path"]])
-        if len(d["chapters"]) > 0:
-            args.db["captions"].insert_all([{**d, "media_id": media_id} for d in d["chapters"]], alter=True)
-        if len(d["subtitles"]) > 0:
-            args.db["captions"].insert_all([{**d, "media_id": media_id} for d in d["subtitles"]], alter=True)
-        if d.get("caption_t0"):
-            args.db["captions"].insert({**d["caption_t0"], "media_id": media_id}, alter=True)
+    captions = [d for d in captions if d["chapters"] or d["subtitles"] or d.get("captions_t0")]
+    if captions:
+        media_ids = db_media.get_ids(args, args.playlists_id, [d["path"] for d in captions])
+        caption_rows = []
+        for d in captions:
+            media_id = media_ids.get(d["path"])
+            if d.get("captions_t0"):
+                caption_rows.append({**d["captions_t0"], "media_id": media_id})
+            caption_rows.extend({**caption, "media_id": media_id} for caption in d["chapters"])
+            caption_rows.extend({**caption, "media_id": media_id} for caption in d["subtitles"])
+        db_media.add_captions(args, caption_rows)
 
 
-def find_new_files(args, path) -> list[str]:
-    if path.is_file():
-        path = str(path)
-        if db_media.exists(args, path):
-            try:
-                time_deleted = args.db.pop(
-                    f"""select time_deleted from media where path = ?""",
-                    [path],
-                )
-            except Exception as e:
-                log.debug(e)
-            else:
-                if time_deleted > 0:
-                    undeleted_count = db_media.mark_media_undeleted(args, [path])
-                    if undeleted_count > 0:
-                        print(f"[{path}] Marking as undeleted")
-        return [path]
+def get_folder_media(args, path, folders):
+    m_columns = db_utils.columns(args, "media")
+    downloaded_sql = "AND time_downloaded > 0" if "time_downloaded" in m_columns else ""
+
+    if len(folders) > 100:  # one range scan is cheaper than many small ones
+        subtree_media = args.db.query(
+            f"""select path, time_deleted from media
+            where 1=1
+                and path >= ? and path < ?
+                {downloaded_sql}
+            """,
+            db_journal.subtree_bounds(path),
+        )
+        yield from (d for d in subtree_media if os.path.dirname(d["path"]) in folders)
+    else:
+        for folder in folders:
+            lower, upper = db_journal.subtree_bounds(folder)
+            # playlists_id lets this use media_uniq_path_idx (playlists_id, path) before optimize adds a path index
+            yield from args.db.query(
+                f"""select path, time_deleted from media
+                where 1=1
+                    and playlists_id IN (select id from playlists)
+                    and path >= ? and path < ?
+                    and instr(substr(path, ?), ?) = 0
+                    {downloaded_sql}
+                """,
+                [lower, upper, len(lower) + 1, os.sep],
+            )
 
-    for s in args.profiles:
-        if getattr(DBType, s, None) is None:
-            msg = f"fs_extract for profile {s}"
-            raise NotImplementedError(msg)
 
+def scan_extensions(args):
     exts = args.ext
     if not exts:
         exts = set()
@@ -158,61 +170,94 @@ def find_new_files(args, path) -> list[str]:
                 exts |= consts.OCR_EXTENSIONS
             if args.speech_recognition:
                 exts |= consts.SPEECH_RECOGNITION_EXTENSIONS
+    return exts or None
 
-    scanned_set = file_utils.rglob(path, exts or None, args.exclude)[0]
 
-    m_columns = db_utils.columns(args, "media")
+def scan_signature(args) -> str:
+    # journal rows are only trusted by scans which would have listed the same files
+    exts = scan_extensions(args)
+    return json.dumps([sorted(exts) if exts else None, sorted(args.exclude or [])])
 
-    try:
-        deleted_set = {
-            d["path"]
-            for d in args.db.query(
-                f"""select path from media
-                where 1=1
-                    and time_deleted > 0
-                    and path like ?
-                    {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
-                """,
-                [str(path) + os.sep + "%"],
-            )
-        }
-    except Exception as e:
-        log.debug(e)
-    else:
-        undeleted_files = list(deleted_set.intersection(scanned_set))
-        undeleted_count = db_media.mark_media_undeleted(args, undeleted_files)
-        if undeleted_count > 0:
-            print(f"[{path}] Marking", undeleted_count, "metadata records as undeleted")
 
+def find_new_files(args, path, journal: dict):
+    # yields new files while the tree is walked; journal is filled in with the listed folders
+    if path.is_file():
+        path = str(path)
+        if db_media.exists(args, path):
+            try:
+                time_deleted = args.db.pop(
+                    f"""select time_deleted from media where path = ?""",
+                    [path],
+                )
+            except Exception as e:
+                log.debug(e)
+            else:
+                if time_deleted > 0:
+                    undeleted_count = db_media.mark_media_undeleted(args, [path])
+                    if undeleted_count > 0:
+                        print(f"[{path}] Marking as undeleted")
+        yield path
+        return
+
+    for s in args.profiles:
+        if getattr(DBType, s, None) is None:
+            msg = f"fs_extract for profile {s}"
+            raise NotImplementedError(msg)
+
+    exts = scan_extensions(args)
+    known_folders = {} if args.action == SC.fs_add else db_journal.get_subtree(args, path, scan_signature(args))
+    seen_folders = {}
+    scanned_set = set()
+    existing_set = set()
+    undeleted_count = 0
+    lookup_failed = False
+    for folder, folder_files in file_utils.rglob_changed(path, known_folders, exts, args.exclude, seen_folders):
+        # each folder is compared with the database as soon as it is listed so extraction can start mid-walk
+        journal[folder] = (*seen_folders[folder], len(folder_files))
+        scanned_set |= folder_files
+
+        try:
+            folder_media = list(get_folder_media(args, path, [folder]))
+        except Exception as e:
+            log.debug(e)
+            lookup_failed = True
+            folder_media = []
+
+        deleted_set = {d["path"] for d in folder_media if (d["time_deleted"] or 0) > 0}
+        undeleted_files = deleted_set & folder_files
+        undeleted_count += db_media.mark_media_undeleted(args, list(undeleted_files))
+
+        folder_existing = {d["path"] for d in folder_media if not d["time_deleted"]}
+        existing_set |= folder_existing
+        yield from sorted(folder_files - folder_existing - undeleted_files, key=len, reverse=True)
+
+    if undeleted_count > 0:
+        print(f"[{path}] Marking", undeleted_count, "metadata records as undeleted")
+
+    vanished_folders = set(known_folders) - set(seen_folders)
+    db_journal.delete(args, list(vanished_folders))
+    if lookup_failed:
+        return
+
+    # deletions can only be known once the whole tree has been listed
     try:
-        existing_set = {
-            d["path"]
-            for d in args.db.query(
-                f"""select path from media
-                where 1=1
-                    and path like ?
-                    and coalesce(time_deleted, 0) = 0
-                    {'AND time_downloaded > 0' if 'time_downloaded' in m_columns else ''}
-                """,
-                [str(path) + os.sep + "%"],
-            )
-        }
+        existing_set |= {d["path"] for d in get_folder_media(args, path, vanished_folders) if not d["time_deleted"]}
     except Exception as e:
         log.debug(e)
-        new_files = list(scanned_set)
-    else:
-        new_files = list(scanned_set - existing_set)
-
-        deleted_files = list(existing_set - scanned_set)
-        if not scanned_set and len(deleted_files) >= len(existing_set) and not args.force:
-            print(f"[{path}] Path empty or device not mounted. Rerun with -f to mark all subpaths as deleted.")
-            return []  # if path not mounted or all files deleted
-        deleted_count = db_media.mark_media_deleted(args, deleted_files)
-        if deleted_count > 0:
-            print(f"[{path}] Marking", deleted_count, "orphaned metadata records as deleted")
+        return
 
-    new_files.sort(key=len, reverse=True)
-    return new_files
+    deleted_files = list(existing_set - scanned_set)
+    path_empty = str(path) not in seen_folders or (
+        journal.get(str(path), (None, None, 1))[-1] == 0
+        and not any(os.path.dirname(s) == str(path) for s in seen_folders)
+    )
+    if path_empty and deleted_files and not args.force:
+        print(f"[{path}] Path empty or device not mounted. Rerun with -f to mark all subpaths as deleted.")
+        journal.clear()  # if path not mounted or all files deleted
+        return
+    deleted_count = db_media.mark_media_deleted(args, deleted_files)
+    if deleted_count > 0:
+        print(f"[{path}] Marking", deleted_count, "orphaned metadata records as deleted")
 
 
 def scan_path(args, path_str: str) -> int:
@@ -239,45 +284,65 @@ def scan_path(args, path_str: str) -> int:
     args.playlists_id = db_playlists.add(args, str(path), info, check_subpath=True)
 
     print(f"[{path}] Building file list...")
-    new_files = find_new_files(args, path)
-    if new_files:
-        print(f"[{path}] Adding {len(new_files)} new media")
-        # log.debug(new_files)
-
-        if getattr(args, "process", False) and n_jobs:
-            batch_count = n_jobs
-        elif DBType.text in args.profiles:
-            batch_count = int(os.cpu_count() or 4)
-        elif DBType.image in args.profiles:
-            batch_count = consts.SQLITE_PARAM_LIMIT // 20
-        else:
-            batch_count = consts.SQLITE_PARAM_LIMIT // 100
-        chunks_count = math.ceil(len(new_files) / batch_count)
-        files_chunked = iterables.chunks(new_files, batch_count)
+    if getattr(args, "process", False) and n_jobs:
+        batch_count = n_jobs
+    elif DBType.text in args.profiles:
+        batch_count = int(os.cpu_count() or 4)
+    elif DBType.image in args.profiles:
+        batch_count = consts.SQLITE_PARAM_LIMIT // 20
+    else:
+        batch_count = consts.SQLITE_PARAM_LIMIT // 100
 
-        if all(s in threadsafe for s in args.profiles):
-            pool_fn = ThreadPoolExecutor
-        else:
-            pool_fn = ProcessPoolExecutor
-
-        start_time = consts.now()
-        with pool_fn(n_jobs) as parallel:
-            for idx, chunk_paths in enumerate(files_chunked):
-                percent = (idx + 1) / chunks_count * 100
-                eta = printing.eta(idx + 1, chunks_count, start_time=start_time) if chunks_count > 2 else ""
-                printing.print_overwrite(
-                    f"[{path}] Extracting metadata chunk {idx + 1} of {chunks_count} ({percent:3.1f}%) {eta}"
-                )
+    if all(s in threadsafe for s in args.profiles):
+        pool_fn = ThreadPoolExecutor
+    else:
+        pool_fn = ProcessPoolExecutor
+
+    mp_args = argparse.Namespace(playlist_path=path, **{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+
+    journal = {}
+    file_order = {}  # new file => position in the walk
+
+    def listed_files():
+        for file_path in find_new_files(args, path, journal):
+            file_order[file_path] = len(file_order)
+            yield file_path
+
+    def save_batch(batch, done_count):
+        printing.print_overwrite(f"[{path}] Extracting metadata {done_count} of {len(file_order)} new media listed")
+        extract_chunk(args, [metadata for _i, metadata in sorted(batch, key=lambda t: t[0])])
+
+    unsaved_paths = set()
+    with pool_fn(n_jobs) as parallel:
+        # the walk and database diff run in this thread, pulled lazily as worker slots free up, so extraction
+        # starts with the first listed folder; this thread also writes each batch as it fills
+        results = processes.imap_unordered(
+            parallel, partial(extract_metadata, mp_args), listed_files(), max_in_flight=batch_count * 2
+        )
+        batch = []
+        for idx, (file_path, metadata) in enumerate(results):
+            if metadata is None:
+                unsaved_paths.add(file_path)
+            else:
+                batch.append((file_order[file_path], metadata))
 
-                mp_args = argparse.Namespace(
-                    playlist_path=path, **{k: v for k, v in args.__dict__.items() if k not in {"db"}}
-                )
-                metadata = parallel.map(partial(extract_metadata, mp_args), chunk_paths)
-                metadata = list(filter(None, metadata))
-                extract_chunk(args, metadata)
-            print()
+            if len(batch) >= batch_count:
+                save_batch(batch, idx + 1)
+                batch = []
+        if batch:
+            save_batch(batch, len(file_order))
+    if file_order:
+        printing.print_overwrite("")
+        print(f"[{path}] Added {len(file_order)} new media")
 
-    return len(new_files)
+    # only trust the listing after all new files are saved
+    for unsaved_path in unsaved_paths:
+        folder = os.path.dirname(unsaved_path)
+        if folder in journal:
+            journal[folder] = (None, *journal[folder][1:])
+    db_journal.save(args, journal, scan_signature(args))
+
+    return len(file_order)
 
 
 def extractor(args, paths) -> None:
@@ -290,6 +355,9 @@ def extractor(args, paths) -> None:
     if not args.db["media"].detect_fts() or new_files > 100000:
         db_utils.optimize(args)
 
+    db_folders.create(args)  # optimize might have rebuilt the media table without triggers
+    db_folders.refresh(args)
+
 
 def fs_add(args=None) -> None:
     if args:
@@ -299,6 +367,8 @@ def fs_add(args=None) -> None:
 
     db_playlists.create(args)
     db_media.create(args)
+    db_journal.create(args)
+    db_folders.create(args)
 
     extractor(args, args.paths)
 
@@ -308,6 +378,8 @@ def fs_update(args=None) -> None:
         sys.argv = ["lb", *args]
 
     args = parse_args(SC.fs_update, usage.fs_update)
+    db_journal.create(args)
+    db_folders.create(args)
 
     fs_playlists = list(
         args.db.query(
@@ -325,5 +397,8 @@ def fs_update(args=None) -> None:
     for playlist in fs_playlists:
         extractor_config = json.loads(playlist.get("extractor_config") or "{}")
         args_env = arg_utils.override_config(args, extractor_config)
+        args_env.extractor_config = {**extractor_config, **args.extractor_config}  # keep the saved profiles
+        if not args_env.profiles:
+            args_env.profiles = [DBType.video]
 
         extractor(args_env, [playlist["path"]])
@@ -1,7 +1,7 @@
 import argparse, asyncio, queue, sqlite3, threading
 
 from library import usage
-from library.utils import arggroups, argparse_utils, db_utils, objects, web
+from library.utils import arggroups, argparse_utils, db_utils, iterables, objects, web
 from library.utils.log_utils import log
 
 """
@@ -36,6 +36,7 @@ def parse_args(usage) -> argparse.Namespace:
     parser = argparse_utils.ArgumentParser(usage=usage)
     parser.add_argument("--oldest", action="store_true")
     parser.add_argument("--max-id", type=int)
+    parser.add_argument("--batch-size", type=int, default=5_000, help="Save up to N items per transaction")
     arggroups.requests(parser)
     arggroups.debug(parser)
     arggroups.database(parser)
@@ -46,17 +47,60 @@ def parse_args(usage) -> argparse.Namespace:
     return args
 
 
-def db_worker(args, input_queue):
-    conn = sqlite3.connect(args.database, isolation_level=None)
+def save_items(db, known_columns, items) -> None:
+    from sqlite_utils import suggest_column_types
+    from sqlite_utils.db import jsonify_if_needed
+
+    tables = {}
+    for hn_type, data in items:
+        tables.setdefault("hn_" + hn_type, []).append(data)
+
+    for table_name, rows in tables.items():
+        if not {k for d in rows for k in d}.issubset(known_columns.get(table_name, ())):
+            table = db[table_name]
+            if table.exists():
+                table.add_missing_columns(rows)
+            else:
+                table.create(suggest_column_types(rows), pk="id")
+            known_columns[table_name] = set(table.columns_dict)
+
+    with db.conn:
+        for table_name, rows in tables.items():
+            columns = list(iterables.ordered_set(k for d in rows for k in d))
+            db.conn.executemany(
+                f"""INSERT OR REPLACE INTO [{table_name}] ({','.join(f'[{c}]' for c in columns)})
+                VALUES ({','.join(['?'] * len(columns))})""",
+                ([jsonify_if_needed(d.get(c)) for c in columns] for d in rows),
+            )
+
+
+def db_worker(args, input_queue, errors):
+    # save whatever is queued, up to --batch-size items, in one transaction
+    conn = sqlite3.connect(args.database)
     db_conn = db_utils.connect(args, conn)
-    while True:
+    known_columns = {}
+    is_done = False
+    while not is_done:
+        items = []
         r = input_queue.get()
-        if r is None:
-            break
-
-        hn_type, data = r
-        log.info("Saving %s %s", hn_type, data["id"])
-        db_conn["hn_" + hn_type].insert(data, pk="id", alter=True)  # type: ignore
+        while True:
+            if r is None:
+                is_done = True
+                break
+            items.append(r)
+            if len(items) >= args.batch_size:
+                break
+            try:
+                r = input_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if items and not errors:
+            log.info("Saving %s items (%s to %s)", len(items), items[0][1]["id"], items[-1][1]["id"])
+            try:
+                save_items(db_conn, known_columns, items)
+            except Exception as e:
+                errors.append(e)  # keep taking items so that the fetchers do not wait forever
 
 
 async def get_hn_item(session, db_queue, sem, hn_id):
@@ -72,12 +116,15 @@ async def get_hn_item(session, db_queue, sem, hn_id):
             data["time_created"] = data.pop("time", None)
             data = objects.dict_filter_bool(data)
             log.debug("Saving %s", data)
-            db_queue.put((hn_type, data))
+            try:
+                db_queue.put_nowait((hn_type, data))
+            except queue.Full:  # wait for the writer without blocking the event loop
+                await asyncio.to_thread(db_queue.put, (hn_type, data))
     finally:
         sem.release()
 
 
-async def run(args, db_queue):
+async def run(args, db_queue, db_errors):
     import aiohttp
 
     N = 80
@@ -92,12 +139,15 @@ async def run(args, db_queue):
         for hn_id in hn_ids:
             log.debug("Getting item %s", hn_id)
             await sem.acquire()
+            if db_errors:  # nothing more can be saved; stop downloading the rest of the gap
+                for task in background_tasks:
+                    task.cancel()
+                break
             task = asyncio.create_task(get_hn_item(session, db_queue, sem, hn_id))
             background_tasks.add(task)
             task.add_done_callback(background_tasks.discard)
 
-        for _i in range(N):
-            await sem.acquire()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
 
 
 def hacker_news_add() -> None:
@@ -141,18 +191,23 @@ def hacker_news_add() -> None:
     if len(r) == 0:
         raise SystemExit(128)
 
-    for gap in r:
-        args.latest_id = gap["latest_id"]
-        args.oldest_id = gap["oldest_id"]
-
-        log.info("Fetching %s items (%s to %s)", args.latest_id - args.oldest_id, args.oldest_id, args.latest_id)
-
-        db_queue = queue.Queue()
-        db_thread = threading.Thread(target=db_worker, args=(args, db_queue))
-        db_thread.start()
-
-        asyncio.get_event_loop().run_until_complete(run(args, db_queue))
+    # the bounded queue makes the fetchers wait when the writer falls behind
+    db_queue = queue.Queue(maxsize=args.batch_size * 2)
+    db_errors = []
+    db_thread = threading.Thread(target=db_worker, args=(args, db_queue, db_errors))
+    db_thread.start()
+    try:
+        for gap in r:
+            args.latest_id = gap["latest_id"]
+            args.oldest_id = gap["oldest_id"]
+
+            log.info("Fetching %s items (%s to %s)", args.latest_id - args.oldest_id, args.oldest_id, args.latest_id)
+            asyncio.get_event_loop().run_until_complete(run(args, db_queue, db_errors))
+            if db_errors:
+                break
+            log.info("Imported %s rows", gap["diff"])
+    finally:
         db_queue.put(None)
         db_thread.join()
-
-        log.info("Imported %s rows", gap["diff"])
+    if db_errors:
+        raise db_errors[0]
@@ -46,6 +46,36 @@ def dedupe_rows(args, tablename, primary_keys, business_keys):
         )
 
 
+def fill_column_sql(args, tablename, col) -> str:
+    # every row of a business key group which has a missing value gets the last (by primary key) known value
+    business_keys = ",".join(args.business_keys)
+    return f"""
+        WITH fill AS (
+            SELECT {business_keys}, {col}
+            FROM (
+                SELECT
+                    {business_keys}
+                    , {col}
+                    , ROW_NUMBER() OVER (
+                        PARTITION BY {business_keys} ORDER BY {','.join(f"{s} DESC" for s in args.primary_keys)}
+                    ) AS rn
+                FROM {tablename}
+                WHERE {f'NULLIF({col}, 0)' if args.skip_0 else col} IS NOT NULL
+                AND ({business_keys}) IN (
+                    SELECT {business_keys}
+                    FROM {tablename}
+                    WHERE {col} IS NULL
+                )
+            )
+            WHERE rn = 1
+        )
+        UPDATE {tablename}
+        SET {col} = fill.{col}
+        FROM fill
+        WHERE {" AND ".join(f"{tablename}.{s} = fill.{s}" for s in args.business_keys)}
+        """
+
+
 def dedupe_db() -> None:
     args = parse_args()
 
@@ -71,33 +101,8 @@ def dedupe_db() -> None:
         log.info("Upserting data in %s", ",".join(upsert_columns))
 
         for col in upsert_columns:
-            data = list(
-                args.db.query(
-                    f"""
-                    SELECT {','.join([*args.business_keys, col])}
-                    FROM {args.target_table}
-                    WHERE {f'NULLIF({col}, 0)' if args.skip_0 else col} IS NOT NULL
-                    AND ({','.join(args.business_keys)}) IN (
-                        SELECT {','.join(args.business_keys)}
-                        FROM {args.target_table}
-                        WHERE {col} IS NULL
-                    )
-                    ORDER BY {','.join(args.primary_keys)}
-                    """,
-                ),
-            )
-            log.info("%s (%s rows)", col, len(data))
-
             with args.db.conn:
-
-                def gen_where_sql(row):
-                    return " AND ".join([f"{key} = {args.db.quote(row[key])}" for key in args.business_keys])
-
-                def gen_update_sql(row):
-                    return (
-                        f"UPDATE {args.target_table} SET {col} = {args.db.quote(row[col])} WHERE {gen_where_sql(row)};"
-                    )
-
-                args.db.conn.executescript("\n".join([gen_update_sql(row) for row in data]))
+                cursor = args.db.conn.execute(fill_column_sql(args, args.target_table, col))
+            log.info("%s (%s rows)", col, cursor.rowcount)
 
     dedupe_rows(args, args.target_table, primary_keys=args.primary_keys, business_keys=args.business_keys)
@@ -1,4 +1,6 @@
-import argparse, sys
+import argparse, io, itertools, os, sys, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from library import usage
 from library.createdb.reddit_add import slim_post_data
@@ -13,9 +15,13 @@ except ModuleNotFoundError:
 
 def parse_args(usage) -> argparse.Namespace:
     parser = argparse_utils.ArgumentParser(usage=usage)
+    parser.add_argument(
+        "--batch-size", type=int, default=10_000, help="Lines per worker batch and rows per database transaction"
+    )
     arggroups.debug(parser)
 
     arggroups.database(parser)
+    parser.add_argument("paths", nargs="*", help="JSONL or .zst files to read instead of stdin")
     args = parser.parse_args()
     arggroups.args_post(args, parser, create_db=True)
 
@@ -23,27 +29,45 @@ def parse_args(usage) -> argparse.Namespace:
 
 
 def save_data(args, reddit_posts, media) -> None:
-    if len(reddit_posts) > 0:
-        args.db["reddit_posts"].insert_all(reddit_posts, alter=True)
-        reddit_posts.clear()
-    if len(media) > 0:
-        args.db["media"].insert_all(media, alter=True)
-        media.clear()
+    with args.db.conn:
+        if len(reddit_posts) > 0:
+            args.db["reddit_posts"].insert_all(reddit_posts, alter=True)
+            reddit_posts.clear()
+        if len(media) > 0:
+            args.db["media"].insert_all(media, alter=True)
+            media.clear()
 
 
-def pushshift_extract(args=None) -> None:
-    if args:
-        sys.argv = ["lb", *args]
+def read_file(path):
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ModuleNotFoundError:
+            log.error("zstandard is required to read .zst files. Install with pip install zstandard")
+            raise
 
-    args = parse_args(usage=usage.pushshift)
+        with open(path, "rb") as f:
+            # pushshift archives are compressed with a 2GB window
+            reader = zstandard.ZstdDecompressor(max_window_size=2**31).stream_reader(f)
+            yield from io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        with open(path, encoding="utf-8") as f:
+            yield from f
 
-    args.db.enable_wal()
 
+def read_lines(args):
+    if not args.paths:
+        print("library pushshift: Reading from stdin...", file=sys.stderr)
+        yield from sys.stdin
+    for path in args.paths:
+        yield from read_file(path)
+
+
+def parse_lines(lines) -> tuple[list[dict], list[dict], int]:
     count = 0
     reddit_posts = []
     media = []
-    print("library pushshift: Reading from stdin...", file=sys.stderr)
-    for line in sys.stdin:
+    for line in lines:
         line = line.rstrip("\n")
         if line in ["", '""', "\n"]:
             continue
@@ -64,10 +88,55 @@ def pushshift_extract(args=None) -> None:
                 continue
 
         count += 1
-        remainder = count % 1_000_000
-        if remainder == 0:
-            printing.print_overwrite(f"Processing {count}")
+    return reddit_posts, media, count
+
+
+def line_batches(args, lines):
+    while batch := list(itertools.islice(lines, args.batch_size)):
+        yield batch
+
+
+def parsed_batches(args, lines):
+    # worker processes parse batches of lines while the caller writes to the database;
+    # a bounded number of batches are in flight and results come back in input order
+    max_workers = args.threads or os.cpu_count() or 1
+    if max_workers == 1:
+        yield from map(parse_lines, line_batches(args, lines))
+        return
+
+    batches = line_batches(args, lines)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque(pool.submit(parse_lines, batch) for batch in itertools.islice(batches, max_workers * 2))
+        while pending:
+            yield pending.popleft().result()
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append(pool.submit(parse_lines, batch))
+
+
+def pushshift_extract(args=None) -> None:
+    if args:
+        sys.argv = ["lb", *args]
+
+    args = parse_args(usage=usage.pushshift)
+
+    args.db.enable_wal()
+
+    start_time = time.monotonic()
+    count = 0
+    reddit_posts = []
+    media = []
+    for batch_posts, batch_media, batch_count in parsed_batches(args, read_lines(args)):
+        reddit_posts.extend(batch_posts)
+        media.extend(batch_media)
+        count += batch_count
+
+        if len(reddit_posts) + len(media) >= args.batch_size:
             save_data(args, reddit_posts, media)
+            elapsed = time.monotonic() - start_time
+            printing.print_overwrite(f"Processing {count} ({int(count / elapsed)} posts/s)")
 
     save_data(args, reddit_posts, media)
-    print("\n")
+    elapsed = time.monotonic() - start_time
+    rate = int(count / elapsed) if elapsed else count
+    print(f"\nlibrary pushshift: {count} posts in {elapsed:.1f}s ({rate} posts/s)")
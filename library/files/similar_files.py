@@ -1,3 +1,5 @@
+import math
+
 from library import usage
 from library.folders.similar_folders import cluster_folders, map_and_name
 from library.utils import arg_utils, arggroups, argparse_utils, file_utils, nums, printing, strings
@@ -50,24 +52,74 @@ def is_same_size_group(args, m0, m):
     return all(bools)
 
 
+def percentage_bucket(value, delta):
+    # percentage_difference(a, b) < delta is a fixed-width window in log space so any
+    # value which could match lands in the same or an adjacent bucket
+    if delta > 200:
+        return 0  # everything is within delta
+    if not value or value <= 0:
+        return None  # zero is only ever similar to zero
+    r = delta / 200
+    if r >= 1:
+        return 0  # every non-zero value is within delta
+    width = math.log((1 + r) / (1 - r)) * (1 + 1e-9)
+    return math.floor(math.log(value) / width)
+
+
+def neighbor_buckets(bucket):
+    if bucket is None:
+        return [None]
+    return [bucket - 1, bucket, bucket + 1]
+
+
 def cluster_by_size(args, media):
-    group_id = 0
-    temp_groups = []
+    # each media joins the earliest group whose first media is similar; otherwise it starts a new group
+    # group leaders are indexed by size/duration bucket so only neighboring buckets need to be compared
+    leaders = []
+    size_index = {}
+    duration_index = {}
+    size_duration_index = {}
     media_groups = []
     for m in media:
-        grouped = False
-        for i, group in enumerate(temp_groups):
-            m0 = group[0]
-            if is_same_size_group(args, m0, m):
-                group.append(m)
-                media_groups.append(i)
-                grouped = True
-                break
-
-        if not grouped:
-            temp_groups.append([m])
-            media_groups.append(group_id)
-            group_id += 1
+        check_duration = bool(args.filter_durations and m.get("duration"))
+        size_bucket = percentage_bucket(m["size"], args.sizes_delta) if args.filter_sizes else 0
+        duration_bucket = percentage_bucket(m.get("duration"), args.durations_delta) if check_duration else 0
+
+        if args.filter_sizes and check_duration:
+            candidate_lists = [
+                size_duration_index.get((sb, db), [])
+                for sb in neighbor_buckets(size_bucket)
+                for db in neighbor_buckets(duration_bucket)
+            ]
+        elif args.filter_sizes:
+            candidate_lists = [size_index.get(sb, []) for sb in neighbor_buckets(size_bucket)]
+        elif check_duration:
+            candidate_lists = [duration_index.get(db, []) for db in neighbor_buckets(duration_bucket)]
+        else:
+            candidate_lists = [range(len(leaders))]  # nothing to compare; joins the first group
+
+        group_id = None
+        for candidates in candidate_lists:
+            for i in candidates:  # leader ids are in creation order
+                if group_id is not None and i > group_id:
+                    break
+                if is_same_size_group(args, leaders[i], m):
+                    group_id = i
+                    break
+
+        if group_id is None:
+            group_id = len(leaders)
+            leaders.append(m)
+
+            leader_size_bucket = percentage_bucket(m["size"], args.sizes_delta) if args.filter_sizes else 0
+            leader_duration_bucket = (
+                percentage_bucket(m.get("duration"), args.durations_delta) if args.filter_durations else 0
+            )
+            size_index.setdefault(leader_size_bucket, []).append(group_id)
+            duration_index.setdefault(leader_duration_bucket, []).append(group_id)
+            size_duration_index.setdefault((leader_size_bucket, leader_duration_bucket), []).append(group_id)
+
+        media_groups.append(group_id)
 
     assert len(media_groups) == len(media)
     return media_groups
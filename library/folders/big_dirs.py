@@ -3,6 +3,7 @@ from collections import Counter, defaultdict
 from pathlib import Path
 
 from library import usage
+from library.mediadb import db_folders
 from library.playback import media_printer
 from library.tablefiles import mcda
 from library.utils import arg_utils, arggroups, argparse_utils, file_utils, iterables, nums, sqlgroups
@@ -33,7 +34,143 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+def use_columnar(args, media) -> bool:
+    columnar = getattr(args, "columnar", None)
+    if columnar is None:
+        if len(media) < 100_000:
+            return False
+        try:
+            import pandas  # noqa: F401
+        except ModuleNotFoundError:
+            return False
+        return True
+    return columnar
+
+
+def media_columns(media):
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(media, columns=["path", "size", "duration", "time_deleted", "time_last_played"])
+    size = pd.to_numeric(df["size"], errors="coerce")
+    duration = pd.to_numeric(df["duration"], errors="coerce")
+    deleted = pd.to_numeric(df["time_deleted"], errors="coerce").fillna(0) != 0
+    exists = ~deleted
+
+    columns = pd.DataFrame(
+        {
+            "size": size.fillna(0).where(exists, 0),
+            "median_size": size.where(exists & (size > 0)),
+            "duration": duration.fillna(0).where(exists, 0),
+            "median_duration": duration.where(exists & (duration > 0)),
+            "exists": exists,
+            "deleted": deleted,
+            "deleted_size": size.fillna(0).where(deleted, 0),
+            "deleted_duration": duration.fillna(0).where(deleted, 0),
+            "played": pd.to_numeric(df["time_last_played"], errors="coerce").fillna(0) != 0,
+        }
+    )
+    return df["path"].astype(str), columns
+
+
+SUM_COLUMNS = ["size", "duration", "exists", "deleted", "deleted_size", "deleted_duration", "played"]
+
+
+def folder_records(agg, paths) -> list[dict]:
+    agg = agg.astype({"exists": int, "deleted": int, "played": int, "total": int})
+    agg = agg.astype(object).where(agg.notna(), None)  # NaN medians -> None
+    return [{**d, "path": path} for path, d in zip(paths, agg.to_dict(orient="records"), strict=True)]
+
+
+def group_files_by_parent_columnar(args, media) -> list[dict]:
+    # all stats from one groupby over arrays instead of many passes over lists of dicts
+    import pandas as pd
+
+    paths, columns = media_columns(media)
+    parts = paths.str.rpartition(os.sep)
+    raw_codes, raw_parents = pd.factorize(parts[0] + parts[1])
+    normalized = pd.Index([str(Path(s)) if s else "." for s in raw_parents])
+    codes, parents = pd.factorize(normalized[raw_codes])
+
+    agg = columns.groupby(codes, sort=False).agg(
+        total=("exists", "size"),
+        **{k: (k, "sum") for k in SUM_COLUMNS},
+        median_size=("median_size", "median"),
+        median_duration=("median_duration", "median"),
+    )
+    folders = folder_records(agg, parents[agg.index])
+
+    parent_counts = Counter(str(Path(d["path"]).parent) for d in folders)
+    for d in folders:
+        d["folders"] = parent_counts[d["path"]]
+    return folders
+
+
+def group_files_by_parents_columnar(args, media) -> list[dict]:
+    import numpy as np
+    import pandas as pd
+
+    paths, columns = media_columns(media)
+    parts = paths.str.rpartition(os.sep)
+    codes, parents = pd.factorize(parts[0] + os.sep)
+
+    # each direct parent and all of its ancestors
+    ancestor_ids = {}
+    edge_codes = []
+    edge_ancestors = []
+    parent_parts = []
+    for code, parent in enumerate(parents):
+        p = parent.split(os.sep)
+        p.pop()
+        parent_parts.append(len(p) + 1)
+        while p:
+            ancestor = os.sep.join(p) + os.sep
+            edge_codes.append(code)
+            edge_ancestors.append(ancestor_ids.setdefault(ancestor, len(ancestor_ids)))
+            p.pop()
+    ancestors = list(ancestor_ids)
+    edges = pd.DataFrame({"code": edge_codes, "ancestor": edge_ancestors})
+
+    # like the python path, the first file seen under each folder is not counted in its stats
+    first_rows = pd.Series(np.arange(len(codes))).groupby(codes).min()
+    first_row = edges.assign(row=first_rows[edges["code"]].to_numpy()).groupby("ancestor")["row"].min()
+    first = columns[SUM_COLUMNS].iloc[first_row.to_numpy()].set_axis(first_row.index).astype(int)
+
+    # additive stats: sum by direct parent then roll up
+    direct = columns[SUM_COLUMNS].groupby(codes).sum()
+    direct["total"] = np.bincount(codes, minlength=len(parents))[direct.index]
+    rolled = edges.merge(direct, left_on="code", right_index=True).groupby("ancestor").sum()
+    rolled[SUM_COLUMNS] = rolled[SUM_COLUMNS] - first
+    rolled["total"] -= 1
+
+    # medians need every value under each ancestor
+    values = columns[["median_size", "median_duration"]].assign(code=codes, row=np.arange(len(codes)))
+    values = values.dropna(how="all", subset=["median_size", "median_duration"]).merge(edges, on="code")
+    values = values[values["row"].to_numpy() != first_row[values["ancestor"]].to_numpy()]
+    medians = values.groupby("ancestor")[["median_size", "median_duration"]].median()
+
+    agg = rolled.drop(columns="code").join(medians)
+    min_parts = min(10, *parent_parts) if parent_parts else 10
+    agg = agg[[len(ancestors[i].split(os.sep)) >= min_parts for i in agg.index]]
+    folders = folder_records(agg, [ancestors[i] for i in agg.index])
+
+    parent_counts = Counter(str(Path(d["path"]).parent) for d in folders)
+    for d in folders:
+        d["folders"] = parent_counts[d["path"]]
+    return folders
+
+
+def index_by_parent(media) -> dict[str, list[dict]]:
+    # folder path, with a trailing os.sep like group_files_by_parents => files directly in that folder
+    folders = defaultdict(list)
+    for m in media:
+        folders[m["path"].rpartition(os.sep)[0] + os.sep].append(m)
+    return folders
+
+
 def group_files_by_parents(args, media) -> list[dict]:
+    if use_columnar(args, media):
+        return group_files_by_parents_columnar(args, media)
+
     p_media = {}
     min_parts = 10
     for m in media:
@@ -43,7 +180,7 @@ def group_files_by_parents(args, media) -> list[dict]:
             p.pop()
             parent = os.sep.join(p) + os.sep
 
-            if parent not in p_media:
+            if parent not in p_media:  # the first file seen under each folder is not counted
                 p_media[parent] = []
             else:
                 p_media[parent].append(m)
@@ -75,6 +212,9 @@ def group_files_by_parents(args, media) -> list[dict]:
 
 
 def group_files_by_parent(args, media) -> list[dict]:
+    if use_columnar(args, media):
+        return group_files_by_parent_columnar(args, media)
+
     p_media = defaultdict(list)
     for m in media:
         p_media[str(Path(m["path"]).parent)].append(m)
@@ -101,6 +241,33 @@ def group_files_by_parent(args, media) -> list[dict]:
     return [{"path": k, **v} for k, v in d.items()]
 
 
+def group_files_from_folders_table(args) -> list[dict]:
+    # group_files_by_parent but from the folders rollup table; medians and play counts are not available
+    d = {}
+    for f in db_folders.get_folders(args):
+        exists = 0 if args.only_deleted else f["direct_count"]
+        deleted = 0 if args.hide_deleted else f["direct_deleted"]
+        if not exists and not deleted:
+            continue
+
+        d[str(Path(f["path"]))] = {
+            "size": 0 if args.only_deleted else f["direct_size"],
+            "duration": 0 if args.only_deleted else f["direct_duration"],
+            "total": exists + deleted,
+            "exists": exists,
+            "deleted": deleted,
+            "deleted_size": 0 if args.hide_deleted else f["direct_deleted_size"],
+            "deleted_duration": 0 if args.hide_deleted else f["direct_deleted_duration"],
+            "played": 0,
+        }
+
+    parent_counts = Counter(str(Path(p).parent) for p in d.keys())
+    for parent, data in d.items():
+        data["folders"] = parent_counts[parent]
+
+    return [{**v, "path": k} for k, v in d.items()]
+
+
 def reaggregate_at_depth(args, folders) -> list[dict]:
     d = {}
     for f in folders:
@@ -153,9 +320,25 @@ def collect_media(args) -> list[dict]:
     return media
 
 
+def prints_only_rollup_columns(args) -> bool:
+    # the folders rollup has no medians or play counts so it is only used when those columns are not printed
+    if args.to_json or "f" not in args.print or "a" in args.print:
+        return False
+    cols = args.cols or ["path"]
+    return not any(s == "*" or s.startswith("median_") or "played" in s for s in cols)
+
+
 def big_dirs() -> None:
     args = parse_args()
-    media = collect_media(args)
+    use_folders_table = (
+        not args.cluster_sort
+        and not args.limit
+        and not args.parents  # group_files_by_parents leaves out the first file of each folder
+        and not any(s in (args.sort_groups_by or "") for s in ["median", "played", "deleted_ratio"])
+        and prints_only_rollup_columns(args)
+        and db_folders.usable(args)
+    )
+    media = [] if use_folders_table else collect_media(args)
 
     if args.cluster_sort and len(media) > 2:
         from library.text.cluster_sort import cluster_paths
@@ -199,6 +382,8 @@ def big_dirs() -> None:
             }
             for group in groups
         ]
+    elif use_folders_table:
+        folders = group_files_from_folders_table(args)
     elif args.parents:
         folders = group_files_by_parents(args, media)
     else:
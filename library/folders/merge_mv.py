@@ -1,4 +1,5 @@
-import argparse, concurrent.futures, os, shutil
+import argparse, concurrent.futures, functools, os, queue, shutil, threading
+from collections import Counter, deque
 from fnmatch import fnmatch
 from pathlib import Path
 
@@ -30,6 +31,7 @@ def parse_args(defaults_override=None):
 
 MOVED_COUNT = 0
 MOVED_SIZE = 0
+MOVED_LOCK = threading.Lock()
 
 
 def print_stats(args, dest_path=None, file_size=None):
@@ -53,10 +55,12 @@ def print_stats(args, dest_path=None, file_size=None):
 
 def track_moved(func):
     def wrapper(*args, **kwargs):
+        global MOVED_COUNT, MOVED_SIZE
         if args[0].verbose == 0:
             func(*args, **kwargs)
+            with MOVED_LOCK:
+                MOVED_COUNT += 1
         else:
-            global MOVED_COUNT, MOVED_SIZE
             try:
                 file_size = Path(args[1]).stat().st_size
             except FileNotFoundError:
@@ -66,8 +70,9 @@ def track_moved(func):
                 print_stats(args[0], args[2], file_size)
             try:
                 func(*args, **kwargs)
-                MOVED_SIZE += file_size
-                MOVED_COUNT += 1
+                with MOVED_LOCK:
+                    MOVED_SIZE += file_size
+                    MOVED_COUNT += 1
             finally:
                 print_stats(args[0])
 
@@ -90,7 +95,7 @@ def mcp_file(args, source, destination):
         print(source)
         print("==>", destination)
     else:
-        out = shutil.copy2(source, destination)
+        out = file_utils.fast_copy(source, destination)
         log.debug("copied %s\t%s", source, out)
 
 
@@ -201,10 +206,7 @@ def gen_src_dest(args, sources, destination, shortcut_allowed=False):
 
                 file_dest = os.path.join(folder_dest, relpath)
                 log.debug("rglob-file file_dest %s", file_dest)
-
-                src, dest = devices.clobber(args, p, file_dest)
-                if src:
-                    yield src, dest
+                yield p, file_dest
         else:  # source is a file
             if filter_src(args, source) is False:
                 log.debug("rglob-file skipped %s", source)
@@ -226,12 +228,14 @@ def gen_src_dest(args, sources, destination, shortcut_allowed=False):
                     file_dest = os.path.join(file_dest, path_utils.basename(source))
                     log.debug("file append basename %s", file_dest)
 
-            src, dest = devices.clobber(args, source, file_dest)
-            if src:
-                yield src, dest
+            yield source, file_dest
 
 
 def mmv_folders(args, mv_fn, sources, destination, shortcut_allowed=False):
+    global MOVED_COUNT, MOVED_SIZE
+    MOVED_COUNT = 0
+    MOVED_SIZE = 0
+
     destination = os.path.realpath(destination) + (os.sep if destination.endswith(os.sep) else "")
 
     if args.bsd:
@@ -240,13 +244,107 @@ def mmv_folders(args, mv_fn, sources, destination, shortcut_allowed=False):
     else:
         sources = (os.path.realpath(s) for s in sources)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as ex:
-        for f in (
-            ex.submit(mv_fn, args, src, dest)
-            for src, dest in gen_src_dest(args, sources, destination, shortcut_allowed=shortcut_allowed)
-        ):
+    run_pipelined(args, mv_fn, gen_src_dest(args, sources, destination, shortcut_allowed=shortcut_allowed))
+
+
+@functools.lru_cache(maxsize=4096)
+def folder_device(path) -> int | None:
+    # the destination folder might not exist yet
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def transfer_device(mv_fn, src, dest) -> int | None:
+    dest_device = folder_device(os.path.dirname(dest))
+    if mv_fn is mmv_file:
+        try:
+            if os.stat(src).st_dev == dest_device:
+                return None  # rename: no data is copied
+        except OSError:
+            pass
+    return dest_device
+
+
+def run_pipelined(args, mv_fn, src_dests) -> None:
+    # keep up to --threads moves in flight with at most --same-device-threads copies to each destination device.
+    # Files start in order; file-over-file conflicts are resolved when a file starts and never while another file
+    # with the same destination is in flight. The --limit check counts moves that are still in flight
+    max_workers = 1 if args.simulate else (args.threads or 1)
+    max_device_threads = max(1, args.same_device_threads or 1)
+    if max_workers == 1:  # without --threads files are moved one at a time, in order
+        for src, dest in src_dests:
+            src, dest = devices.clobber(args, src, dest)
+            if src:
+                mv_fn(args, src, dest)
+        return
+
+    waiting = deque()  # (device, src, dest)
+    running = {}  # future => (device, dest)
+    finished = queue.SimpleQueue()
+    active = Counter()  # device => running copies
+    is_exhausted = False
+    stop = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+        while True:
+            while not is_exhausted and len(waiting) < max_workers:
+                try:
+                    src, dest = next(src_dests)
+                except StopIteration:
+                    is_exhausted = True
+                    break
+                except SystemExit as e:  # --timeout-size or --limit reached while listing files
+                    is_exhausted = True
+                    stop = e
+                    break
+                waiting.append((transfer_device(mv_fn, src, dest), src, dest))
+
+            busy_dests = {dest for _device, dest in running.values()}
+            for item in list(waiting):
+                if len(running) >= max_workers:
+                    break
+                if args.limit and MOVED_COUNT + len(running) >= args.limit:
+                    break
+
+                device, src, dest = item
+                if dest in busy_dests:
+                    break  # wait so the conflict is seen
+                if device is not None and active[device] >= max_device_threads:
+                    continue
+                waiting.remove(item)
+
+                src, clobber_dest = devices.clobber(args, src, dest)
+                if not src:
+                    continue
+                busy_dests.add(dest)
+                if device is not None:
+                    active[device] += 1
+                f = ex.submit(mv_fn, args, src, clobber_dest)
+                running[f] = (device, dest)
+                f.add_done_callback(finished.put)
+
+            if not running:
+                if waiting and args.limit and MOVED_COUNT >= args.limit:
+                    print(f"\nReached file moved limit... ({args.limit})")
+                    raise SystemExit(124)
+                if is_exhausted and not waiting:
+                    break
+                continue
+
+            f = finished.get()
+            device, _dest = running.pop(f)
+            if device is not None:
+                active[device] -= 1
             f.result()
 
+    if stop is not None:
+        raise stop
+
 
 def merge_mv(defaults_override=None):
     args = parse_args(defaults_override)
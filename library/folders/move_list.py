@@ -3,6 +3,7 @@ from copy import deepcopy
 from pathlib import Path
 
 from library import usage
+from library.mediadb import db_folders
 from library.utils import arggroups, argparse_utils, consts, devices, iterables, printing, sqlgroups, strings
 
 
@@ -53,10 +54,27 @@ def group_by_folder(args, media) -> list[dict]:
     return [{**v, "path": k} for k, v in d.items()]
 
 
-def get_table(args) -> list[dict]:
-    media = list(args.db.query(*sqlgroups.fs_sql(args, limit=None)))
+def group_by_folder_from_folders_table(args) -> list[dict]:
+    folders = []
+    for f in db_folders.get_folders(args, min_depth=2):
+        if f["path"].startswith("http"):
+            continue
+
+        count, size, _duration = db_folders.selected_stats(args, f)
+        if not count:
+            continue
+        if args.folder_counts and not args.folder_counts(count):
+            continue
+        folders.append({"size": size, "count": count, "path": f["path"]})
+    return folders
+
 
-    folders = group_by_folder(args, media)
+def get_table(args) -> list[dict]:
+    if db_folders.usable(args):
+        folders = group_by_folder_from_folders_table(args)
+    else:
+        media = list(args.db.query(*sqlgroups.fs_sql(args, limit=None)))
+        folders = group_by_folder(args, media)
     return sorted(folders, key=lambda x: x["size"] / x["count"])
 
 
@@ -1,6 +1,7 @@
-import os
+import argparse, os
 
 from library import usage
+from library.mediadb import db_folders
 from library.playback import media_printer
 from library.utils import arg_utils, arggroups, argparse_utils, file_utils, path_utils, processes, sqlgroups
 
@@ -81,13 +82,51 @@ def get_subset(args, level=None, prefix=None) -> list[dict]:
     )
 
 
+def get_subset_from_folders(args, level=None, prefix=None) -> list[dict]:
+    # same as get_subset but from the folders rollup table instead of every media row
+    d = {}
+    for f in db_folders.get_folders(args, depth=level, prefix=prefix):
+        count, size, _duration = db_folders.selected_stats(args, f)
+        if count and f["path"] != os.sep:
+            d[f["path"]] = {"size": size, "count": count}
+
+    # files at this level are directly inside folders one level up
+    if any(
+        db_folders.selected_stats(args, f, direct=True)[0]
+        for f in db_folders.get_folders(args, depth=level - 1, prefix=prefix)
+    ):
+        query_args = argparse.Namespace(**vars(args))
+        query_args.filter_sql = [
+            *args.filter_sql,
+            f"AND length(m.path) - length(replace(m.path, '{os.sep}', '')) = :file_depth",
+        ]
+        query_args.filter_bindings = {**args.filter_bindings, "file_depth": level - 1}
+        if prefix:
+            query_args.filter_sql.append("AND m.path >= :prefix AND m.path < :prefix_end")
+            query_args.filter_bindings.update(prefix=prefix, prefix_end=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+        for m in args.db.query(*sqlgroups.fs_sql(query_args, limit=None)):
+            d[m["path"]] = m
+
+    reverse = True
+    if args.sort_groups_by and " desc" in args.sort_groups_by:
+        reverse = False
+
+    return sorted([{"path": k, **v} for k, v in d.items()], key=sort_by(args), reverse=reverse)
+
+
 def load_subset(args):
+    if args.use_folders_table:
+        get_subset_fn = get_subset_from_folders
+    else:
+        get_subset_fn = get_subset
+
     if not args.group_by_extensions and args.depth == 0:
         while len(args.subset) < 2:
             args.depth += 1
-            args.subset = get_subset(args, level=args.depth, prefix=args.cwd)
+            args.subset = get_subset_fn(args, level=args.depth, prefix=args.cwd)
     else:
-        args.subset = get_subset(args, level=args.depth, prefix=args.cwd)
+        args.subset = get_subset_fn(args, level=args.depth, prefix=args.cwd)
 
     if not args.subset:
         processes.no_media_found()
@@ -112,7 +151,12 @@ def get_data(args) -> list[dict]:
 
 def disk_usage(defaults_override=None):
     args = parse_args(defaults_override)
-    args.data = get_data(args)
+    args.use_folders_table = not args.group_by_extensions and db_folders.usable(args)
+    if args.use_folders_table:
+        if not any(db_folders.selected_stats(args, f)[0] for f in db_folders.get_folders(args, depth=1)):
+            processes.no_media_found()
+    else:
+        args.data = get_data(args)
     args.subset = []
     args.cwd = None
 
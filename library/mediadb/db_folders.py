@@ -0,0 +1,281 @@
+import os, sqlite3
+from collections import defaultdict
+
+from library.utils import consts, iterables
+from library.utils.log_utils import log
+
+"""
+folders table: totals for every folder which contains media, rolled up from media rows
+    path = Folder with a trailing os.sep
+    depth = Number of os.sep in path
+    count, size, duration = Files which are not deleted; recursive
+    deleted, deleted_size, deleted_duration = Files which are marked deleted; recursive
+    direct_* = The same but only for files directly inside the folder
+
+folders_dirty table: folders with changed media rows since the last refresh; filled by triggers on media
+"""
+
+STATS = ["count", "size", "duration", "deleted", "deleted_size", "deleted_duration"]
+DIRECT_STATS = ["direct_" + s for s in STATS]
+
+TRIGGERS = ["folders_media_insert", "folders_media_delete", "folders_media_update"]
+
+
+def parent_sql(column):
+    # everything up to and including the last os.sep
+    return f"rtrim({column}, replace({column}, '{os.sep}', ''))"
+
+
+STATS_SQL = """
+    SUM(COALESCE(time_deleted, 0) = 0) AS count
+    , SUM(CASE WHEN COALESCE(time_deleted, 0) = 0 THEN COALESCE(size, 0) ELSE 0 END) AS size
+    , SUM(CASE WHEN COALESCE(time_deleted, 0) = 0 THEN COALESCE(duration, 0) ELSE 0 END) AS duration
+    , SUM(COALESCE(time_deleted, 0) != 0) AS deleted
+    , SUM(CASE WHEN COALESCE(time_deleted, 0) != 0 THEN COALESCE(size, 0) ELSE 0 END) AS deleted_size
+    , SUM(CASE WHEN COALESCE(time_deleted, 0) != 0 THEN COALESCE(duration, 0) ELSE 0 END) AS deleted_duration
+"""
+
+
+def exists(args) -> bool:
+    names = {
+        name
+        for (name,) in args.db.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'folders%'"
+        ).fetchall()
+    }
+    return {"folders", "folders_dirty", *TRIGGERS}.issubset(names)
+
+
+def create(args):
+    if "media" not in args.db.table_names():
+        return
+    if not {"path", "size", "duration", "time_deleted"}.issubset(args.db["media"].columns_dict):
+        return
+
+    needs_rebuild = not exists(args)  # changes were not tracked
+
+    args.db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS folders (
+            path TEXT PRIMARY KEY,
+            depth INTEGER NOT NULL,
+            {", ".join(f"{s} NUMERIC NOT NULL DEFAULT 0" for s in STATS + DIRECT_STATS)}
+        );
+        """
+    )
+    args.db.execute("CREATE INDEX IF NOT EXISTS folders_depth_idx ON folders (depth);")
+    args.db.execute("CREATE TABLE IF NOT EXISTS folders_dirty (path TEXT PRIMARY KEY) WITHOUT ROWID;")
+
+    args.db.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS folders_media_insert AFTER INSERT ON media BEGIN
+            INSERT OR IGNORE INTO folders_dirty (path) VALUES ({parent_sql("NEW.path")});
+        END;
+        """
+    )
+    args.db.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS folders_media_delete AFTER DELETE ON media BEGIN
+            INSERT OR IGNORE INTO folders_dirty (path) VALUES ({parent_sql("OLD.path")});
+        END;
+        """
+    )
+    args.db.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS folders_media_update AFTER UPDATE OF path, size, duration, time_deleted ON media
+        BEGIN
+            INSERT OR IGNORE INTO folders_dirty (path) VALUES ({parent_sql("OLD.path")}), ({parent_sql("NEW.path")});
+        END;
+        """
+    )
+
+    if needs_rebuild:
+        rebuild(args)
+
+
+def parent_folders(folder):
+    # all folders which contain folder, including itself
+    while folder:
+        yield folder
+        folder = folder[:-1]
+        idx = folder.rfind(os.sep)
+        if idx == -1:
+            break
+        folder = folder[: idx + 1]
+
+
+def direct_stats(args, folders=None) -> dict[str, tuple]:
+    if folders is None:
+        rows = args.db.execute(
+            f"SELECT {parent_sql('path')} AS parent, {STATS_SQL} FROM media GROUP BY parent"
+        ).fetchall()
+        return {parent: tuple(stats) for parent, *stats in rows}
+
+    d = {}
+    if any(index.columns[0] == "path" for index in args.db["media"].indexes):
+        for folder in folders:
+            # direct children of folder: within the subtree and no more os.sep
+            stats = args.db.execute(
+                f"""SELECT {STATS_SQL} FROM media
+                WHERE path >= ? AND path < ? AND instr(substr(path, ?), '{os.sep}') = 0""",
+                [folder, folder[:-1] + chr(ord(os.sep) + 1), len(folder) + 1],
+            ).fetchone()
+            if stats[0] is not None:
+                d[folder] = tuple(stats)
+    else:
+        for chunk_folders in iterables.chunks(list(folders), consts.SQLITE_PARAM_LIMIT):
+            rows = args.db.execute(
+                f"""SELECT {parent_sql('path')} AS parent, {STATS_SQL} FROM media
+                WHERE {parent_sql('path')} IN ({",".join(["?"] * len(chunk_folders))})
+                GROUP BY parent""",
+                chunk_folders,
+            ).fetchall()
+            d.update({parent: tuple(stats) for parent, *stats in rows})
+    return d
+
+
+def save(args, folders: dict[str, list]) -> None:
+    deleted = [path for path, v in folders.items() if not any(v)]
+    updated = [(path, path.count(os.sep), *v) for path, v in folders.items() if any(v)]
+
+    columns = ["path", "depth", *STATS, *DIRECT_STATS]
+    args.db.conn.executemany(
+        f"INSERT OR REPLACE INTO folders ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", updated
+    )
+    for chunk_paths in iterables.chunks(deleted, consts.SQLITE_PARAM_LIMIT):
+        args.db.conn.execute(
+            "DELETE FROM folders WHERE path IN (" + ",".join(["?"] * len(chunk_paths)) + ")", chunk_paths
+        )
+
+
+def rebuild(args) -> None:
+    log.info("Rebuilding folders table")
+
+    folders = defaultdict(lambda: [0] * len(STATS + DIRECT_STATS))
+    for parent, stats in direct_stats(args).items():
+        for folder in parent_folders(parent):
+            v = folders[folder]
+            for i, n in enumerate(stats):
+                v[i] += n or 0
+        if parent in folders:
+            folders[parent][len(STATS) :] = [n or 0 for n in stats]
+
+    with args.db.conn:
+        args.db.conn.execute("DELETE FROM folders")
+        args.db.conn.execute("DELETE FROM folders_dirty")
+        save(args, folders)
+
+
+def refresh(args) -> None:
+    if not args.db.execute("SELECT 1 FROM folders_dirty LIMIT 1").fetchone():
+        return
+
+    with args.db.conn:
+        if not args.db.conn.in_transaction:
+            args.db.conn.execute("BEGIN IMMEDIATE")  # no new changes between reading and clearing folders_dirty
+        _refresh(args)
+
+
+def _refresh(args) -> None:
+    dirty = {path for (path,) in args.db.execute("SELECT path FROM folders_dirty").fetchall()}
+    dirty.discard("")  # media without any os.sep
+    log.info("Updating folders table: %s changed folders", len(dirty))
+
+    old_stats = load(args, dirty)
+    new_stats = direct_stats(args, dirty)
+
+    # apply the difference between the old and new direct totals to the folder and each of its parents
+    deltas = defaultdict(lambda: [0] * len(STATS))
+    for folder in dirty:
+        old = old_stats[folder][len(STATS) :] if folder in old_stats else [0] * len(STATS)
+        new = new_stats.get(folder) or [0] * len(STATS)
+        delta = [(n or 0) - (o or 0) for n, o in zip(new, old, strict=True)]
+        if any(delta):
+            for parent in parent_folders(folder):
+                deltas[parent] = [a + b for a, b in zip(deltas[parent], delta, strict=True)]
+
+    folders = load(args, deltas.keys())
+    for path, delta in deltas.items():
+        v = folders.get(path) or [0] * len(STATS + DIRECT_STATS)
+        v[: len(STATS)] = [a + b for a, b in zip(v[: len(STATS)], delta, strict=True)]
+        if path in dirty:
+            v[len(STATS) :] = [n or 0 for n in (new_stats.get(path) or [0] * len(STATS))]
+        folders[path] = v
+
+    save(args, folders)
+    args.db.conn.execute("DELETE FROM folders_dirty")
+
+
+def load(args, paths) -> dict[str, list]:
+    d = {}
+    for chunk_paths in iterables.chunks(list(paths), consts.SQLITE_PARAM_LIMIT):
+        rows = args.db.execute(
+            f"""SELECT path, {", ".join(STATS + DIRECT_STATS)} FROM folders
+            WHERE path IN ({",".join(["?"] * len(chunk_paths))})""",
+            chunk_paths,
+        ).fetchall()
+        d.update({path: list(v) for path, *v in rows})
+    return d
+
+
+def usable(args) -> bool:
+    # the rollup only has totals of all media; search terms and other filters need the media rows
+    if not getattr(args, "database", None):
+        return False
+    if args.include or args.exclude or args.aggregate_filter_sql:
+        return False
+    if any(s not in (deleted_filter_sql(True), deleted_filter_sql(False)) for s in args.filter_sql):
+        return False
+
+    try:
+        if not exists(args):
+            return False
+        if args.db.execute("SELECT 1 FROM folders_dirty LIMIT 1").fetchone():
+            log.info("folders table is out of date; run fsupdate to refresh it")
+            return False
+    except sqlite3.OperationalError as e:
+        log.debug(e)
+        return False
+    return True
+
+
+def deleted_filter_sql(hide_deleted):
+    # as in arggroups.sql_fs_post
+    return f"AND COALESCE(m.time_deleted,0) {'=' if hide_deleted else '>'} 0"
+
+
+def selected_stats(args, d, direct=False) -> tuple:
+    # count, size, and duration of the media which the sql_fs deleted filters would select
+    p = "direct_" if direct else ""
+    if getattr(args, "only_deleted", False):
+        return d[p + "deleted"], d[p + "deleted_size"], d[p + "deleted_duration"]
+    elif getattr(args, "hide_deleted", False):
+        return d[p + "count"], d[p + "size"], d[p + "duration"]
+    else:
+        return (
+            d[p + "count"] + d[p + "deleted"],
+            d[p + "size"] + d[p + "deleted_size"],
+            d[p + "duration"] + d[p + "deleted_duration"],
+        )
+
+
+def get_folders(args, depth=None, min_depth=None, prefix=None) -> list[dict]:
+    where = []
+    bindings = {}
+    if depth is not None:
+        where.append("depth = :depth")
+        bindings["depth"] = depth
+    if min_depth is not None:
+        where.append("depth >= :min_depth")
+        bindings["min_depth"] = min_depth
+    if prefix:
+        where.append("path >= :prefix AND path < :prefix_end")
+        bindings["prefix"] = prefix
+        bindings["prefix_end"] = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    return list(
+        args.db.query(
+            f"SELECT * FROM folders WHERE 1=1 {' '.join('AND ' + s for s in where)} ORDER BY path",
+            bindings,
+        )
+    )
@@ -33,30 +33,76 @@ def exists(args, media_id) -> bool:
     return True
 
 
+def fill_paths_table(args, paths) -> None:
+    # paths are resolved to media ids by joining with media instead of one query per path
+    args.db.execute("CREATE TEMP TABLE IF NOT EXISTS history_paths (path TEXT)")
+    with args.db.conn:
+        args.db.conn.execute("DELETE FROM temp.history_paths")
+        args.db.conn.executemany("INSERT INTO temp.history_paths (path) VALUES (?)", [(path,) for path in paths])
+
+
+def add_from_query(args, query, bindings=None) -> int:
+    # query should select path, time_played, playhead, done
+    # like the old path lookup, a path that exists under several playlists resolves to a single media id
+    if "history" not in args.db.table_names():
+        create(args)
+
+    with args.db.conn:
+        cursor = args.db.conn.execute(
+            f"""
+            INSERT INTO history (media_id, time_played, playhead, done)
+            SELECT * FROM (
+                SELECT
+                    (SELECT MIN(m.id) FROM main.media m WHERE m.path = s.path) AS media_id
+                    , COALESCE(NULLIF(s.time_played, 0), :now)
+                    , COALESCE(s.playhead, 0)
+                    , s.done
+                FROM ({query}) s
+            )
+            WHERE media_id IS NOT NULL
+            """,
+            {**(bindings or {}), "now": consts.now()},
+        )
+    return cursor.rowcount
+
+
 def add(args, paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None):
     media_ids = media_ids or []
-    if paths:
-        media_ids.extend([args.db.pop("select id from media where path = ?", [path]) for path in paths])
-
-    rows = [
-        {
-            "media_id": media_id,
-            "time_played": time_played or consts.now(),
-            "playhead": playhead or 0,
-            "done": mark_done,
-        }
-        for media_id in media_ids
-        if media_id
-    ]
-    args.db["history"].insert_all(iterables.list_dict_filter_bool(rows), alter=True)
-    return len(media_ids)
+    paths = paths or []
+    if "history" not in args.db.table_names():
+        create(args)
+
+    if paths and "media" in args.db.table_names():
+        fill_paths_table(args, paths)
+        add_from_query(
+            args,
+            "SELECT path, :time_played AS time_played, :playhead AS playhead, :done AS done FROM temp.history_paths",
+            {"time_played": time_played, "playhead": playhead, "done": mark_done},
+        )
+
+    rows = [(media_id, time_played or consts.now(), playhead or 0, mark_done) for media_id in media_ids if media_id]
+    with args.db.conn:
+        args.db.conn.executemany(
+            "INSERT INTO history (media_id, time_played, playhead, done) VALUES (?, ?, ?, ?)", rows
+        )
+    return len(media_ids) + len(paths)
 
 
 def remove(args, paths=None, media_ids=None):
     media_ids = media_ids or []
-    if paths:
-        media_ids.extend([args.db.pop("SELECT id from media WHERE path = ?", [path]) for path in paths])
 
     with args.db.conn:
-        for media_id in media_ids:
-            args.db.conn.execute("DELETE from history WHERE media_id = ?", [media_id])
+        if paths and "media" in args.db.table_names():
+            fill_paths_table(args, paths)
+            args.db.conn.execute(
+                """
+                DELETE FROM history WHERE media_id IN (
+                    SELECT m.id FROM temp.history_paths p JOIN media m ON m.path = p.path
+                )
+                """
+            )
+
+        for chunk_ids in iterables.chunks(media_ids, consts.SQLITE_PARAM_LIMIT):
+            args.db.conn.execute(
+                "DELETE FROM history WHERE media_id IN (" + ",".join(["?"] * len(chunk_ids)) + ")", chunk_ids
+            )
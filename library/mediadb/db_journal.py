@@ -0,0 +1,74 @@
+import os, sqlite3
+
+from library.utils import consts, db_utils, iterables
+from library.utils.log_utils import log
+
+"""
+fs_journal table
+    path = Folder which was listed during fs_add or fs_update
+    mtime_ns = st_mtime_ns of the folder when it was listed; NULL when the listing might be stale
+    inode = st_ino of the folder
+    file_count = Number of matching files directly inside the folder
+    scan_signature = Extensions and excludes of the listing; rows from a different signature are not trusted
+"""
+
+
+def create(args):
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fs_journal (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            file_count INTEGER,
+            scan_signature TEXT
+        ) STRICT;
+        """
+    )
+    if "scan_signature" not in db_utils.columns(args, "fs_journal"):
+        args.db.execute("ALTER TABLE fs_journal ADD COLUMN scan_signature TEXT")
+
+
+def subtree_bounds(path) -> list[str]:
+    # all paths within path: x >= path/ and x < path0 (the character after os.sep)
+    path = str(path).rstrip(os.sep)
+    return [path + os.sep, path + chr(ord(os.sep) + 1)]
+
+
+def get_subtree(args, path, scan_signature) -> dict[str, tuple[int | None, int]]:
+    try:
+        rows = args.db.execute(
+            """SELECT path, mtime_ns, inode FROM fs_journal
+            WHERE (path = ? OR (path >= ? AND path < ?)) AND scan_signature = ?""",
+            [str(path), *subtree_bounds(path), scan_signature],
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        log.debug(e)
+        return {}
+    return {p: (mtime_ns, inode) for p, mtime_ns, inode in rows}
+
+
+def save(args, folders: dict[str, tuple[int | None, int, int]], scan_signature) -> None:
+    if not folders:
+        return
+
+    with args.db.conn:
+        args.db.conn.executemany(
+            """INSERT OR REPLACE INTO fs_journal (path, mtime_ns, inode, file_count, scan_signature)
+            VALUES (?, ?, ?, ?, ?)""",
+            ((path, *v, scan_signature) for path, v in folders.items()),
+        )
+
+
+def delete(args, paths) -> int:
+    paths = iterables.conform(paths)
+
+    deleted_count = 0
+    for chunk_paths in iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT):
+        with args.db.conn:
+            cursor = args.db.conn.execute(
+                "DELETE FROM fs_journal WHERE path IN (" + ",".join(["?"] * len(chunk_paths)) + ")",
+                (*chunk_paths,),
+            )
+            deleted_count += cursor.rowcount
+    return deleted_count
@@ -232,6 +232,40 @@ def add(args, entry):
         args.db["captions"].insert_all([{**d, "media_id": media_id} for d in subtitles], alter=True)
 
 
+def get_ids(args, playlists_id, paths) -> dict[str, int]:
+    path_ids = {}
+    for chunk_paths in iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT - 1):
+        path_ids.update(
+            args.db.execute(
+                "select path, id from media where playlists_id = ? and path in ("
+                + ",".join(["?"] * len(chunk_paths))
+                + ")",
+                [playlists_id, *chunk_paths],
+            ).fetchall()
+        )
+    return path_ids
+
+
+def add_captions(args, captions: list[dict]) -> None:
+    if not captions:
+        return
+
+    from sqlite_utils import suggest_column_types
+
+    table = args.db["captions"]
+    if table.exists():
+        table.add_missing_columns(captions)
+    else:
+        table.create(suggest_column_types(captions))
+
+    columns = list(iterables.ordered_set(k for d in captions for k in d))
+    with args.db.conn:
+        args.db.conn.executemany(
+            f"INSERT INTO captions ({','.join(f'[{c}]' for c in columns)}) VALUES ({','.join(['?'] * len(columns))})",
+            ([d.get(c) for c in columns] for d in captions),
+        )
+
+
 def mark_media_undeleted(args, paths) -> int:
     paths = iterables.conform(paths)
 
@@ -1,9 +1,11 @@
-import sys
+import concurrent.futures, sys, time
+from collections import deque
 
 import requests
 
 from library import usage
 from library.createdb import gallery_backend, tube_backend
+from library.data.http_errors import HTTPTooManyRequests
 from library.mediadb import db_media
 from library.mediafiles import process_ffmpeg, process_image
 from library.playback import media_printer
@@ -15,6 +17,7 @@ from library.utils import (
     consts,
     db_utils,
     iterables,
+    path_utils,
     processes,
     sql_utils,
     strings,
@@ -46,6 +49,13 @@ def parse_args():
     parser.add_argument("--gifs", action="store_true", help="Image: Only download MP4 and GIFs")
 
     parser.add_argument("--links", action="store_true", help="Download media linked within pages")
+    parser.add_argument(
+        "--max-host-downloads",
+        "--per-host",
+        type=int,
+        default=1,
+        help="Filesystem: Download at most N files from the same host at the same time",
+    )
 
     parser.add_argument("--process", action="store_true", help="Transcode images to AVIF and video/audio to AV1/Opus")
     arggroups.clobber(parser)
@@ -111,55 +121,14 @@ def download(args=None) -> None:
         media_printer.media_printer(args, media)
         return
 
-    get_inner_urls = iterables.return_unique(extract_links.get_inner_urls, lambda d: d["link"])
-    for m in media:
-        if args.blocklist_rules and sql_utils.is_blocked_dict_like_sql(m, args.blocklist_rules):
-            continue
+    media = [m for m in media if is_allowed(args, m)]
 
-        if args.safe:
-            if (args.profile in (DBType.audio, DBType.video) and not tube_backend.is_supported(m["path"])) or (
-                args.profile in (DBType.image,) and not gallery_backend.is_supported(args, m["path"])
-            ):
-                log.info("[%s]: Skipping unsupported URL (safe_mode)", m["path"])
-                continue
-
-        # check if download already attempted recently by another process
-        previous_time_attempted = m.get("time_modified") or consts.APPLICATION_START  # 0 is nullified
-        if not args.force and "time_modified" in m_columns:
-            d = args.db.pop_dict(
-                f"""
-                SELECT
-                    time_modified
-                    , time_deleted
-                    {", download_attempts" if 'download_attempts' in m_columns else ', 0 as download_attempts'}
-                FROM media
-                WHERE path=?
-                """,
-                [m["path"]],
-            )
-            log.debug(d)
-            if d:
-                if d["time_deleted"]:
-                    log.info(
-                        "[%s]: Download was marked as deleted %s ago. Skipping!",
-                        m["path"],
-                        strings.duration(consts.now() - d["time_deleted"]),
-                    )
-                    continue
-                elif d.get("time_modified") and d["time_modified"] > int(previous_time_attempted):
-                    log.info(
-                        "[%s]: Download already attempted %s ago. Skipping!",
-                        m["path"],
-                        strings.duration(consts.now() - d["time_modified"]),
-                    )
-                    continue
-                elif d.get("download_attempts") and d["download_attempts"] > args.download_retries:
-                    log.info(
-                        "[%s]: Download attempts exceed download retries limit. Skipping!",
-                        m["path"],
-                    )
-                    continue
+    if args.profile == DBType.filesystem:
+        get_inner_urls = iterables.return_unique(extract_links.get_inner_urls, lambda d: d["link"])
+        schedule_downloads(args, unattempted(args, m_columns, media), get_inner_urls)
+        return
 
+    for m in unattempted(args, m_columns, media):
         try:  # attempt to download
             log.debug(m)
 
@@ -167,73 +136,235 @@ def download(args=None) -> None:
                 tube_backend.download(args, m)
             elif args.profile == DBType.image:
                 gallery_backend.download(args, m)
-            elif args.profile == DBType.filesystem:
-                original_path = m["path"]
-
-                dl_paths = [original_path]
-                if args.links:
-                    dl_paths = []
-                    try:
-                        for link_dict in get_inner_urls(args, original_path):
-                            dl_paths.append(link_dict["link"])
-                    except requests.HTTPError as e:
-                        log.warning(
-                            "HTTPError %s. Recording download attempt: %s", e.response.status_code, original_path
-                        )
-                        db_media.download_add(
-                            args,
-                            webpath=original_path,
-                            info=m,
-                            error=str(e),
-                            mark_deleted=e.response.status_code == 404,
-                            delete_webpath_entry=False,
-                        )
-                        web.post_download(args)
-                        continue
-
-                if not dl_paths:
-                    log.info("No relevant links in page. Recording download attempt: %s", original_path)
-                    db_media.download_add(args, original_path, m, error="No relevant links in page")
-                    web.post_download(args)
-                    continue
-
-                any_error = False
-                for i, dl_path in enumerate(dl_paths):
-                    error = None
-                    try:
-                        local_path = web.download_url(args, dl_path)
-                    except RuntimeError as e:
-                        local_path = None
-                        error = str(e)
-
-                    if local_path and args.process:
-                        extension = local_path.rsplit(".", 1)[-1].lower()
-                        if extension in consts.AUDIO_ONLY_EXTENSIONS | consts.VIDEO_EXTENSIONS:
-                            result = process_ffmpeg.process_path(args, local_path)
-                        elif extension in consts.IMAGE_EXTENSIONS:
-                            result = process_image.process_path(args, local_path)
-
-                        if result is not None:
-                            local_path = str(result)
-
-                    is_not_found = error is not None and "HTTPNotFound" in error
-                    if error is not None and "HTTPNotFound" not in error:
-                        any_error = True
-
-                    db_media.download_add(
-                        args,
-                        webpath=original_path,
-                        info=m,
-                        local_path=local_path,
-                        error=error,
-                        mark_deleted=is_not_found,
-                        delete_webpath_entry=(
-                            not any_error if i == len(dl_paths) - 1 else False
-                        ),  # only check after last download link was saved
-                    )
             else:
                 raise NotImplementedError
 
         except Exception:
             print("db:", args.database)
             raise
+
+
+def is_allowed(args, m) -> bool:
+    if args.blocklist_rules and sql_utils.is_blocked_dict_like_sql(m, args.blocklist_rules):
+        return False
+
+    if args.safe:
+        if (args.profile in (DBType.audio, DBType.video) and not tube_backend.is_supported(m["path"])) or (
+            args.profile in (DBType.image,) and not gallery_backend.is_supported(args, m["path"])
+        ):
+            log.info("[%s]: Skipping unsupported URL (safe_mode)", m["path"])
+            return False
+    return True
+
+
+def previous_attempts(args, m_columns, paths) -> dict[str, dict]:
+    d = {}
+    for chunk_paths in iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT):
+        d.update(
+            (row["path"], row)
+            for row in args.db.query(
+                f"""
+                SELECT
+                    path
+                    , time_modified
+                    , time_deleted
+                    {", download_attempts" if 'download_attempts' in m_columns else ', 0 as download_attempts'}
+                FROM media
+                WHERE path IN ({",".join(["?"] * len(chunk_paths))})
+                """,
+                chunk_paths,
+            )
+        )
+    return d
+
+
+def is_attempted(args, m, d) -> bool:
+    previous_time_attempted = m.get("time_modified") or consts.APPLICATION_START  # 0 is nullified
+    if d["time_deleted"]:
+        log.info(
+            "[%s]: Download was marked as deleted %s ago. Skipping!",
+            m["path"],
+            strings.duration(consts.now() - d["time_deleted"]),
+        )
+        return True
+    elif d.get("time_modified") and d["time_modified"] > int(previous_time_attempted):
+        log.info(
+            "[%s]: Download already attempted %s ago. Skipping!",
+            m["path"],
+            strings.duration(consts.now() - d["time_modified"]),
+        )
+        return True
+    elif d.get("download_attempts") and d["download_attempts"] > args.download_retries:
+        log.info(
+            "[%s]: Download attempts exceed download retries limit. Skipping!",
+            m["path"],
+        )
+        return True
+    return False
+
+
+def unattempted(args, m_columns, media):
+    # check if download already attempted recently by another process
+    if args.force or "time_modified" not in m_columns:
+        yield from media
+        return
+
+    for chunk_media in iterables.chunks(media, consts.SQLITE_PARAM_LIMIT):
+        attempts = previous_attempts(args, m_columns, [m["path"] for m in chunk_media])
+        for m in chunk_media:
+            d = attempts.get(m["path"])
+            log.debug(d)
+            if d and is_attempted(args, m, d):
+                continue
+            yield m
+
+
+def fetch_path(args, m, get_inner_urls) -> list[dict]:
+    # network and file work only; the returned download_add kwargs are written to the database by the caller
+    original_path = m["path"]
+
+    dl_paths = [original_path]
+    if args.links:
+        dl_paths = []
+        try:
+            for link_dict in get_inner_urls(args, original_path):
+                dl_paths.append(link_dict["link"])
+        except requests.HTTPError as e:
+            log.warning("HTTPError %s. Recording download attempt: %s", e.response.status_code, original_path)
+            web.post_download(args)
+            return [
+                {
+                    "webpath": original_path,
+                    "info": m,
+                    "error": str(e),
+                    "mark_deleted": e.response.status_code == 404,
+                    "delete_webpath_entry": False,
+                }
+            ]
+
+    if not dl_paths:
+        log.info("No relevant links in page. Recording download attempt: %s", original_path)
+        web.post_download(args)
+        return [{"webpath": original_path, "info": m, "error": "No relevant links in page"}]
+
+    results = []
+    any_error = False
+    for i, dl_path in enumerate(dl_paths):
+        error = None
+        try:
+            local_path = web.download_url(args, dl_path)
+        except RuntimeError as e:
+            local_path = None
+            error = str(e)
+
+        if local_path and args.process:
+            result = None
+            extension = local_path.rsplit(".", 1)[-1].lower()
+            if extension in consts.AUDIO_ONLY_EXTENSIONS | consts.VIDEO_EXTENSIONS:
+                result = process_ffmpeg.process_path(args, local_path)
+            elif extension in consts.IMAGE_EXTENSIONS:
+                result = process_image.process_path(args, local_path)
+
+            if result is not None:
+                local_path = str(result)
+
+        is_not_found = error is not None and "HTTPNotFound" in error
+        if error is not None and "HTTPNotFound" not in error:
+            any_error = True
+
+        results.append(
+            {
+                "webpath": original_path,
+                "info": m,
+                "local_path": local_path,
+                "error": error,
+                "mark_deleted": is_not_found,
+                # only check after last download link was saved
+                "delete_webpath_entry": not any_error if i == len(dl_paths) - 1 else False,
+            }
+        )
+    return results
+
+
+def schedule_downloads(args, media, get_inner_urls) -> None:
+    # downloads run in a thread pool, at most --max-host-downloads per host, with --sleep-requests between starts
+    # and an exponential pause of the host after HTTP 429; all database writes happen in this thread
+    max_workers = 1 if args.verbose >= consts.LOG_DEBUG else (args.threads or 4)
+    max_host_downloads = max(1, args.max_host_downloads)
+    min_interval = getattr(args, "sleep_interval_requests", None) or 0
+
+    media = iter(media)
+    queues: dict[str, deque] = {}  # host => media, in the original order
+    active = web.host_connections  # host => open connections, including extra segments of web.download_segmented
+    next_start = {}  # host => earliest time.monotonic() of the next download
+    throttled = {}  # path => times rate limited
+    running = {}  # future => (host, media)
+
+    def queue_more() -> bool:
+        m = next(media, None)
+        if m is None:
+            return False
+        queues.setdefault(path_utils.domain_from_url(m["path"]), deque()).append(m)
+        return True
+
+    def waiting_hosts():
+        return [host for host, q in queues.items() if q and active[host] < max_host_downloads]
+
+    def ready_host():
+        now = time.monotonic()
+        return next((host for host in waiting_hosts() if next_start.get(host, 0) <= now), None)
+
+    def seconds_until_ready():
+        waiting = [next_start.get(host, 0) for host in waiting_hosts()]
+        return max(0, min(waiting) - time.monotonic()) if waiting else None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        exhausted = False
+        while True:
+            while len(running) < max_workers:
+                host = ready_host()
+                while host is None and not exhausted:
+                    exhausted = not queue_more()
+                    host = ready_host()
+                if host is None:
+                    break
+
+                m = queues[host].popleft()
+                log.debug(m)
+                with web.host_connections_lock:
+                    active[host] += 1
+                next_start[host] = time.monotonic() + min_interval
+                running[executor.submit(fetch_path, args, m, get_inner_urls)] = (host, m)
+
+            timeout = seconds_until_ready() if len(running) < max_workers else None
+            if not running:
+                if timeout is None:
+                    break
+                time.sleep(timeout)
+                continue
+
+            done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                host, m = running.pop(future)
+                with web.host_connections_lock:
+                    active[host] -= 1
+                try:
+                    results = future.result()
+                except HTTPTooManyRequests:
+                    throttled[m["path"]] = throttled.get(m["path"], 0) + 1
+                    if throttled[m["path"]] > args.http_download_retries:
+                        results = [{"webpath": m["path"], "info": m, "error": "HTTPTooManyRequests"}]
+                    else:
+                        delay = max(min_interval, 1) * 2 ** throttled[m["path"]]
+                        log.warning(
+                            "[%s]: Too many requests. Pausing %s for %s", m["path"], host, strings.duration(delay)
+                        )
+                        next_start[host] = max(next_start.get(host, 0), time.monotonic() + delay)
+                        queues[host].appendleft(m)
+                        continue
+                except Exception:
+                    print("db:", args.database)
+                    raise
+
+                for kwargs in results:
+                    db_media.download_add(args, **kwargs)
@@ -24,7 +24,7 @@ def parse_args():
 def decode_quick_scan(path, scans, scan_duration=3, audio_scan=False):
     assert which("ffmpeg")
 
-    def decode(scan):
+    def decode_cmd(scan):
         opts = []
         if audio_scan:
             opts += [
@@ -76,20 +76,17 @@ def decode_quick_scan(path, scans, scan_duration=3, audio_scan=False):
             "null",
             os.devnull,
         ]
+        return cmd
 
-        proc = processes.cmd(*cmd)
-        # I wonder if something like this would be faster: -map 0:v:0 -filter:v "select=eq(pict_type\,I)" -frames:v 1
-        if proc.stderr != "":
-            raise RuntimeError
-
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        futures = [pool.submit(decode, scan) for scan in scans]
+    # I wonder if something like this would be faster: -map 0:v:0 -filter:v "select=eq(pict_type\,I)" -frames:v 1
+    procs = processes.subprocess_scheduler.run_many(
+        [decode_cmd(scan) for scan in scans], resource="cpu", priority=10, **processes.os_bg_kwargs()
+    )
 
     fail_count = 0
-    for future in futures:
-        try:
-            future.result()
-        except (RuntimeError, subprocess.CalledProcessError):
+    for proc in procs:
+        if proc.returncode != 0 or proc.stderr:
+            log.debug("[%s] exited %s %s", shlex.join(proc.args), proc.returncode, proc.stderr)
             fail_count += 1
 
     return fail_count / len(scans)
@@ -119,6 +116,8 @@ def decode_full_scan(path, audio_scan=False, frames="frames", threads=None):
                     "-1",
                     "-y",
                     temp_output.name,
+                    resource="cpu",
+                    priority=10,
                 )
                 actual_duration = processes.FFProbe(temp_output.name).duration or 0
         except subprocess.CalledProcessError:
@@ -140,7 +139,7 @@ def decode_full_scan(path, audio_scan=False, frames="frames", threads=None):
             path,
         ]
 
-        r_frames = processes.cmd(*ffprobe_cmd)
+        r_frames = processes.cmd(*ffprobe_cmd, resource="cpu", priority=10)
         data = strings.safe_json_loads(r_frames.stdout)["streams"][0]
 
         r_frame_rate = fractions.Fraction(data["r_frame_rate"])
@@ -47,6 +47,7 @@ def is_animation_from_probe(probe) -> bool:
                 "-of",
                 "default=nokey=1:noprint_wrappers=1",
                 probe.path,
+                resource="cpu",
             )
             frames = nums.safe_int(r.stdout)
             if frames is None:
@@ -180,6 +181,7 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
                         "-of",
                         "default=noprint_wrappers=1:nokey=1",
                         path,
+                        resource="cpu",
                     ).stdout
                 )
                 if frames and probe.duration:
@@ -242,29 +244,29 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
 
         if is_split:
             try:
-                result = subprocess.check_output(
-                    [
-                        "ffmpeg",
-                        "-hide_banner",
-                        "-v",
-                        "warning",
-                        "-i",
-                        path,
-                        "-af",
-                        "silencedetect=-55dB:d=0.3,ametadata=mode=print:file=-:key=lavfi.silence_start",
-                        "-vn",
-                        "-sn",
-                        "-f",
-                        "s16le",
-                        "-y",
-                        "/dev/null",
-                    ]
+                result = processes.cmd(
+                    "ffmpeg",
+                    "-hide_banner",
+                    "-v",
+                    "warning",
+                    "-i",
+                    path,
+                    "-af",
+                    "silencedetect=-55dB:d=0.3,ametadata=mode=print:file=-:key=lavfi.silence_start",
+                    "-vn",
+                    "-sn",
+                    "-f",
+                    "s16le",
+                    "-y",
+                    "/dev/null",
+                    resource="cpu",
+                    priority=10,
                 )
             except subprocess.CalledProcessError:
                 log.error("Splits could not be identified. Likely broken file: %s", path)
                 is_split = False
             else:
-                splits = result.decode().split("\n")
+                splits = result.stdout.split("\n")
                 splits = [line.split("=")[1] for line in splits if "lavfi.silence_start" in line]
 
                 prev = 0.0
@@ -327,7 +329,7 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
 
     is_file_error = False
     try:
-        processes.cmd(*command)
+        processes.cmd(*command, resource="cpu", priority=20)
     except subprocess.CalledProcessError as e:
         error_log = e.stderr.splitlines()
         is_unsupported_subtitle = any(ffmpeg_errors.unsupported_subtitle_error.match(l) for l in error_log)
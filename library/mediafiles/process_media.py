@@ -1,5 +1,6 @@
-import argparse, concurrent.futures, math, os, sqlite3
-from contextlib import suppress
+import argparse, concurrent.futures, math, os, queue, sqlite3, time
+from collections import Counter, deque
+from contextlib import closing, suppress
 from pathlib import Path
 from shutil import which
 
@@ -30,7 +31,7 @@ def parse_args() -> argparse.Namespace:
     parser.set_defaults(
         local_media_only=True,
         hide_deleted=True,
-        cols=["path", "type", "duration", "size", "video_count", "video_codecs", "audio_codecs"],
+        cols=["path", "type", "duration", "size", "width", "height", "video_count", "video_codecs", "audio_codecs"],
     )
     arggroups.history(parser)
 
@@ -74,8 +75,18 @@ def parse_args() -> argparse.Namespace:
         "--transcoding-audio-rate", type=float, default=70, help="Ratio of duration eg. 100x realtime speed"
     )
     parser.add_argument("--transcoding-image-time", type=float, default=1.5, metavar="SECONDS")
+    parser.add_argument(
+        "--stats-db",
+        default=str(Path("~/.local/share/process_media.db").expanduser()),
+        help="Record processing times here and use them to estimate future processing times",
+    )
 
     parser.add_argument("--continue-from", help="Skip media until specific file path is seen")
+    parser.add_argument("--max-savings", type=nums.human_to_bytes, help="Stop starting new jobs after freeing SIZE")
+    parser.add_argument("--video-threads", type=int, default=1, help="Transcode N videos in parallel")
+    parser.add_argument("--audio-threads", type=int, default=2, help="Transcode N audio files in parallel")
+    parser.add_argument("--image-threads", type=int, default=4, help="Convert N images in parallel")
+    parser.add_argument("--text-threads", type=int, default=1, help="Convert N ebooks in parallel")
 
     arggroups.process_ffmpeg(parser)
     arggroups.clobber(parser)
@@ -134,6 +145,74 @@ def collect_media(args) -> list[dict]:
     return media
 
 
+STATS_MIN_SAMPLES = 3
+
+
+def create_stats(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS process_media_stats (
+            media_type TEXT NOT NULL,
+            ext TEXT,
+            codec TEXT,
+            width INTEGER,
+            height INTEGER,
+            duration REAL,
+            size INTEGER NOT NULL,
+            new_size INTEGER NOT NULL,
+            processing_time REAL NOT NULL,
+            time_created INTEGER DEFAULT (strftime('%s', 'now'))
+        ) STRICT;
+        """
+    )
+
+
+def job_work(m) -> float:
+    # audio and video take time per second of media; images and ebooks per byte
+    if m["media_type"] in ("Audio", "Video"):
+        return m.get("duration") or 0
+    return m.get("size") or 0
+
+
+def load_processing_rates(args) -> dict:
+    # seconds of processing per unit of job_work, by (media_type, ext) and by media_type
+    if not args.stats_db or not os.path.exists(args.stats_db):
+        return {}
+
+    with closing(sqlite3.connect(args.stats_db)) as conn:
+        create_stats(conn)
+        rows = conn.execute(
+            """
+            SELECT
+                media_type
+                , ext
+                , SUM(processing_time)
+                , SUM(CASE WHEN media_type IN ('Audio', 'Video') THEN duration ELSE size END)
+                , COUNT(*)
+            FROM process_media_stats
+            WHERE processing_time > 0
+            GROUP BY media_type, ext
+            """
+        ).fetchall()
+
+    totals = {}
+    for media_type, ext, processing_time, work, count in rows:
+        for key in [(media_type, ext), media_type]:
+            t = totals.setdefault(key, [0, 0, 0])
+            t[0] += processing_time
+            t[1] += work or 0
+            t[2] += count
+    return {k: t / work for k, (t, work, count) in totals.items() if count >= STATS_MIN_SAMPLES and work > 0}
+
+
+def estimate_processing_time(args, m, default) -> float:
+    rates = getattr(args, "processing_rates", None) or {}
+    rate = rates.get((m["media_type"], m["ext"])) or rates.get(m["media_type"])
+    if rate:
+        return rate * job_work(m)
+    return default
+
+
 def check_shrink(args, m) -> list:
     m["ext"] = path_utils.ext(m["path"])
     filetype = (m.get("type") or "").lower()
@@ -174,7 +253,9 @@ def check_shrink(args, m) -> list:
 
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = math.ceil(m["duration"] / args.transcoding_audio_rate)
+        m["processing_time"] = estimate_processing_time(
+            args, m, math.ceil(m["duration"] / args.transcoding_audio_rate)
+        )
 
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
@@ -198,7 +279,7 @@ def check_shrink(args, m) -> list:
         m["media_type"] = "Image"
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = args.transcoding_image_time
+        m["processing_time"] = estimate_processing_time(args, m, args.transcoding_image_time)
 
         if can_shrink:
             return [m]
@@ -235,7 +316,9 @@ def check_shrink(args, m) -> list:
 
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = math.ceil(m["duration"] / args.transcoding_video_rate)
+        m["processing_time"] = estimate_processing_time(
+            args, m, math.ceil(m["duration"] / args.transcoding_video_rate)
+        )
 
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
@@ -253,7 +336,7 @@ def check_shrink(args, m) -> list:
         m["media_type"] = "Text"
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = args.transcoding_image_time * 12
+        m["processing_time"] = estimate_processing_time(args, m, args.transcoding_image_time * 12)
         if can_shrink:
             return [m]
         else:
@@ -273,8 +356,217 @@ def check_shrink(args, m) -> list:
     return []
 
 
+def media_type_limits(args) -> dict[str, int]:
+    return {
+        "Video": args.video_threads,
+        "Audio": args.audio_threads,
+        "Image": args.image_threads,
+        "Text": args.text_threads,
+    }
+
+
+def prepare_media(args, m, uncompressed_archives, results) -> bool:
+    # unarchiving and missing files are handled in the main thread before a job starts
+    if m.get("compressed_size"):
+        if os.path.exists(m["archive_path"]):
+            if m["archive_path"] in uncompressed_archives:
+                return False
+            uncompressed_archives.add(m["archive_path"])
+
+            if args.simulate:
+                log.info("Unarchiving %s", m["archive_path"])
+            else:
+                processes.unar_delete(m["archive_path"])
+
+        if not os.path.exists(m["path"]):
+            log.error("[%s]: FileNotFoundError from archive %s", m["path"], m["archive_path"])
+            return False
+    elif not os.path.exists(m["path"]):
+        log.error("[%s]: FileNotFoundError", m["path"])
+        m["time_deleted"] = consts.APPLICATION_START
+        results.append(m)
+        return False
+    return True
+
+
+def process_path(args, m) -> dict | None:
+    start_time = time.monotonic()
+    if m["media_type"] in ("Audio", "Video"):
+        new_path = process_ffmpeg.process_path(args, m["path"])
+    elif m["media_type"] == "Image":
+        new_path = process_image.process_path(args, m["path"])
+    elif m["media_type"] == "Text":
+        new_path = process_text.process_path(args, m["path"])
+    else:
+        raise NotImplementedError
+
+    if new_path is None:
+        m["time_deleted"] = consts.APPLICATION_START
+        return m
+    elif new_path == m["path"]:
+        return None
+
+    if m["media_type"] in ("Audio", "Video", "Image"):
+        m["new_path"] = str(new_path)
+        m["new_size"] = os.stat(new_path).st_size
+    elif m["media_type"] in ("Text",):
+        m["new_path"] = str(new_path)
+        for p in [
+            os.path.join(new_path, "index.html"),
+            os.path.join(new_path, "OEBPS"),
+        ]:
+            if os.path.exists(p):
+                m["new_path"] = p
+                break
+
+        m["new_size"] = path_utils.folder_size(new_path)
+    m["elapsed"] = time.monotonic() - start_time
+
+    if m["media_type"] in ("Audio", "Video"):
+        try:
+            m["duration"] = processes.FFProbe(new_path).duration
+        except processes.UnplayableFile:
+            if args.delete_unplayable:
+                Path(new_path).unlink(missing_ok=True)
+                return None
+    return m
+
+
+def save_results(args, results) -> None:
+    if args.database and results:
+        with args.db.conn:
+            for m in results:
+                with suppress(sqlite3.OperationalError):
+                    if m.get("time_deleted"):
+                        args.db.conn.execute(
+                            "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
+                        )
+                    elif m.get("new_path") and m.get("new_path") != m["path"]:
+                        args.db.conn.execute("DELETE FROM media where path = ?", [m["new_path"]])
+                        args.db.conn.execute(
+                            "UPDATE media SET path = ?, size = ?, duration = ? WHERE path = ?",
+                            [m["new_path"], m["new_size"], nums.safe_int(m.get("duration")), m["path"]],
+                        )
+    save_stats(args, results)
+    results.clear()
+
+
+def save_stats(args, results) -> None:
+    rows = [
+        (
+            m["media_type"],
+            m["ext"],
+            m.get("video_codecs") if m["media_type"] == "Video" else m.get("audio_codecs"),
+            m.get("width"),
+            m.get("height"),
+            m.get("duration"),
+            m["size"],
+            m["new_size"],
+            m["elapsed"],
+        )
+        for m in results
+        if m.get("elapsed")
+    ]
+    if not args.stats_db or not rows:
+        return
+
+    os.makedirs(os.path.dirname(args.stats_db) or ".", exist_ok=True)
+    with closing(sqlite3.connect(args.stats_db)) as conn, conn:
+        create_stats(conn)
+        conn.executemany(
+            """INSERT INTO process_media_stats
+            (media_type, ext, codec, width, height, duration, size, new_size, processing_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
+
+
+def freed_size(m) -> int:
+    if m.get("new_path") and not os.path.exists(m["path"]):
+        return (m.get("compressed_size") or m["size"]) - m["new_size"]
+    return 0
+
+
+def run_jobs(args, media) -> None:
+    # jobs start in media order with at most --{video,audio,image,text}-threads of each type running.
+    # The main thread writes finished jobs to the database in batches and, after --timeout or --max-savings,
+    # waits for running jobs instead of starting new ones
+    limits = media_type_limits(args)
+    max_workers = 1 if args.simulate else (args.threads or sum(limits.values()))
+
+    waiting = {media_type: deque() for media_type in limits}
+    for i, m in enumerate(media):
+        waiting[m["media_type"]].append((i, m))
+
+    results = []
+    uncompressed_archives = set()
+    new_free_space = 0
+    last_save = time.monotonic()
+    running = {}  # future => media_type
+    finished = queue.SimpleQueue()
+    active = Counter()  # media_type => running jobs
+    stop = None
+    is_stopping = False
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as ex:
+            while True:
+                try:
+                    while not is_stopping and len(running) < max_workers:
+                        if args.max_savings and new_free_space >= args.max_savings:
+                            print(f"\nReached savings limit... ({strings.file_size(args.max_savings)})")
+                            is_stopping = True
+                            break
+
+                        ready = [q for t, q in waiting.items() if q and active[t] < limits[t]]
+                        if not ready:
+                            break
+                        _i, m = min(ready, key=lambda q: q[0][0]).popleft()
+                        if not prepare_media(args, m, uncompressed_archives, results):
+                            continue
+
+                        log.info(
+                            "%s freed. Processing %s (%s)",
+                            strings.file_size(new_free_space),
+                            m["path"],
+                            strings.file_size(m["size"]),
+                        )
+                        if args.simulate:
+                            program = {"Audio": "FFMPEG", "Video": "FFMPEG", "Image": "ImageMagick", "Text": "Calibre"}
+                            log.info("%s processing %s", program[m["media_type"]], m["path"])
+                            new_free_space += (m.get("compressed_size") or m["size"]) - m["future_size"]
+                            continue
+
+                        active[m["media_type"]] += 1
+                        f = ex.submit(process_path, args, m)
+                        running[f] = m["media_type"]
+                        f.add_done_callback(finished.put)
+
+                    if not running:
+                        break
+
+                    f = finished.get()
+                    active[running.pop(f)] -= 1
+                    m = f.result()
+                    if m:
+                        new_free_space += freed_size(m)
+                        results.append(m)
+
+                    if len(results) >= 100 or time.monotonic() - last_save > 5:
+                        save_results(args, results)
+                        last_save = time.monotonic()
+                except SystemExit as e:  # --timeout
+                    stop = e
+                    is_stopping = True
+    finally:
+        save_results(args, results)
+
+    if stop is not None:
+        raise stop
+
+
 def process_media() -> None:
     args = parse_args()
+    args.processing_rates = load_processing_rates(args)
     media = collect_media(args)
 
     mp_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
@@ -343,103 +635,5 @@ def process_media() -> None:
     print("Estimated savings:", strings.file_size(savings))
     print("Estimated processing time:", strings.duration(processing_time))
 
-    uncompressed_archives = set()
-    new_free_space = 0
     if args.no_confirm or devices.confirm(f"Proceed?"):
-        for m in media:
-            log.info(
-                "%s freed. Processing %s (%s)",
-                strings.file_size(new_free_space),
-                m["path"],
-                strings.file_size(m["size"]),
-            )
-
-            if m.get("compressed_size"):
-                if os.path.exists(m["archive_path"]):
-                    if m["archive_path"] in uncompressed_archives:
-                        continue
-                    uncompressed_archives.add(m["archive_path"])
-
-                    if args.simulate:
-                        log.info("Unarchiving %s", m["archive_path"])
-                    else:
-                        processes.unar_delete(m["archive_path"])
-
-                if not os.path.exists(m["path"]):
-                    log.error("[%s]: FileNotFoundError from archive %s", m["path"], m["archive_path"])
-                    continue
-            else:
-                if not os.path.exists(m["path"]):
-                    log.error("[%s]: FileNotFoundError", m["path"])
-                    m["time_deleted"] = consts.APPLICATION_START
-                    if args.database:
-                        with suppress(sqlite3.OperationalError), args.db.conn:
-                            args.db.conn.execute(
-                                "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
-                            )
-                    continue
-
-            if args.simulate:
-                if m["media_type"] in ("Audio", "Video"):
-                    log.info("FFMPEG processing %s", m["path"])
-                elif m["media_type"] == "Image":
-                    log.info("ImageMagick processing %s", m["path"])
-                elif m["media_type"] == "Text":
-                    log.info("Calibre processing %s", m["path"])
-                else:
-                    raise NotImplementedError
-
-                new_free_space += (m.get("compressed_size") or m["size"]) - m["future_size"]
-            else:
-                if m["media_type"] in ("Audio", "Video"):
-                    new_path = process_ffmpeg.process_path(args, m["path"])
-                elif m["media_type"] == "Image":
-                    new_path = process_image.process_path(args, m["path"])
-                elif m["media_type"] == "Text":
-                    new_path = process_text.process_path(args, m["path"])
-                else:
-                    raise NotImplementedError
-
-                if new_path is None:
-                    m["time_deleted"] = consts.APPLICATION_START
-                elif new_path == m["path"]:
-                    continue
-                else:
-                    if m["media_type"] in ("Audio", "Video", "Image"):
-                        m["new_path"] = str(new_path)
-                        m["new_size"] = os.stat(new_path).st_size
-                    elif m["media_type"] in ("Text",):
-                        m["new_path"] = str(new_path)
-                        for p in [
-                            os.path.join(new_path, "index.html"),
-                            os.path.join(new_path, "OEBPS"),
-                        ]:
-                            if os.path.exists(p):
-                                m["new_path"] = p
-                                break
-
-                        m["new_size"] = path_utils.folder_size(new_path)
-
-                    if m["media_type"] in ("Audio", "Video"):
-                        try:
-                            m["duration"] = processes.FFProbe(new_path).duration
-                        except processes.UnplayableFile:
-                            if args.delete_unplayable:
-                                Path(new_path).unlink(missing_ok=True)
-                                continue
-
-                    if not os.path.exists(m["path"]):
-                        new_free_space += (m.get("compressed_size") or m["size"]) - m["new_size"]
-
-                if args.database:
-                    with suppress(sqlite3.OperationalError), args.db.conn:
-                        if m.get("time_deleted"):
-                            args.db.conn.execute(
-                                "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
-                            )
-                        elif m.get("new_path") and m.get("new_path") != m["path"]:
-                            args.db.conn.execute("DELETE FROM media where path = ?", [m["new_path"]])
-                            args.db.conn.execute(
-                                "UPDATE media SET path = ?, size = ?, duration = ? WHERE path = ?",
-                                [m["new_path"], m["new_size"], nums.safe_int(m.get("duration")), m["path"]],
-                            )
+        run_jobs(args, media)
@@ -3,7 +3,7 @@ import argparse
 from library import usage
 from library.editdb import dedupe_db
 from library.mediadb import db_history
-from library.utils import arggroups, argparse_utils, db_utils
+from library.utils import arggroups, argparse_utils
 from library.utils.log_utils import log
 
 
@@ -22,38 +22,35 @@ def parse_args() -> argparse.Namespace:
 
 
 def copy_play_count(args, source_db) -> None:
-    s_db = db_utils.connect(argparse.Namespace(database=source_db, verbose=args.verbose))
-    m_columns = s_db["media"].columns_dict
-
-    copy_counts = list(
-        s_db.query(
+    # the path rewrite and the path => id lookup both happen in SQL
+    args.db.attach("source", source_db)
+    try:
+        copied = db_history.add_from_query(
+            args,
             """
             SELECT
-                path
+                CASE WHEN instr(m.path, :source_prefix) > 0
+                    THEN substr(m.path, 1, instr(m.path, :source_prefix) - 1)
+                        || :target_prefix
+                        || substr(m.path, instr(m.path, :source_prefix) + length(:source_prefix))
+                    ELSE m.path
+                END AS path
                 , h.time_played
                 , h.playhead
-                , done
+                , h.done
             FROM
-                media m
-            JOIN history h on h.media_id = m.rowid
+                source.media m
+            JOIN source.history h on h.media_id = m.rowid
             WHERE
                 h.time_played > 0
                 OR
                 h.playhead > 0
             """,
-        ),
-    )
-
-    log.info(len(copy_counts))
-    for d in copy_counts:
-        renamed_path = d["path"].replace(args.source_prefix, args.target_prefix, 1)
-        db_history.add(
-            args,
-            [renamed_path],
-            time_played=d.get("time_played"),
-            playhead=d.get("playhead") or 0,
-            mark_done=d["done"],
+            {"source_prefix": args.source_prefix, "target_prefix": args.target_prefix},
         )
+    finally:
+        args.db.execute("DETACH DATABASE source")
+    log.info("%s: copied %s history rows", source_db, copied)
 
 
 def copy_play_counts() -> None:
@@ -1,8 +1,8 @@
-import argparse, sqlite3
+import argparse, contextlib, sqlite3
 from pathlib import Path
 
 from library import usage
-from library.utils import arggroups, argparse_utils, db_utils
+from library.utils import arggroups, argparse_utils, db_utils, log_utils
 from library.utils.log_utils import log
 
 
@@ -27,6 +27,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--skip-columns", action=argparse_utils.ArgparseList)
 
     parser.add_argument("--where", "-w", nargs="+", action="extend")
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Load each source db in one transaction, in primary key order, rebuilding non-unique indexes afterwards",
+    )
 
     arggroups.debug(parser)
 
@@ -38,51 +43,167 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+def unique_columns(table) -> list[set]:
+    uniques = [{o.name for o in table.columns if o.is_pk}]
+    uniques.extend(set(index.columns) for index in table.indexes if index.unique)
+    return [s for s in uniques if s]
+
+
+def transaction(args):
+    # with --bulk-load merge_db commits once per source db
+    return contextlib.nullcontext() if args.bulk_load else args.db.conn
+
+
+@contextlib.contextmanager
+def source_transaction(args):
+    if not args.bulk_load:
+        yield
+        return
+
+    with args.db.conn:
+        args.db.conn.execute("BEGIN")  # explicit so that DROP INDEX / CREATE INDEX are part of it too
+        yield
+
+
+@contextlib.contextmanager
+def without_secondary_indexes(args, table):
+    # non-unique indexes are rebuilt once after the load instead of being updated row by row;
+    # if the load fails the transaction is rolled back, DROP INDEX included
+    names = {o.name for o in args.db[table].indexes if not o.unique and o.origin == "c"}
+    index_sql = [
+        sql
+        for name, sql in args.db.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", [table]
+        ).fetchall()
+        if name in names
+    ]
+    for name in names:
+        args.db.execute(f"DROP INDEX [{name}]")
+    yield
+    for sql in index_sql:
+        args.db.execute(sql)
+
+
+def merge_table_sql(args, source_table, table, selected_columns, pk) -> int | None:
+    # INSERT ... SELECT from the attached source; returns None when only row-by-row insert_all can do it
+    target = args.db[table]
+    if target.exists():
+        target_columns = target.columns_dict
+        if pk and not set(pk).issubset(target_columns):
+            return None
+        for col in selected_columns:
+            if col not in target_columns:  # alter=True
+                target.add_column(col, source_table.columns_dict[col])
+    else:
+        target.create({col: source_table.columns_dict[col] for col in selected_columns}, pk=pk)
+
+    columns_sql = ", ".join(f"[{s}]" for s in selected_columns)
+    where_sql = " AND ".join(args.where) if args.where else "true"
+    select_sql = f"SELECT {columns_sql} FROM source.[{table}] WHERE {where_sql}"
+    if args.bulk_load:
+        # rows arrive in index order so the primary key b-tree is appended to instead of split at random pages
+        key_columns = [s for s in (pk or [o.name for o in target.columns if o.is_pk]) if s in selected_columns]
+        if key_columns:
+            select_sql += " ORDER BY " + ", ".join(f"[{s}]" for s in key_columns)
+
+    if args.upsert:
+        pk = pk or [o.name for o in target.columns if o.is_pk]
+        if not pk or set(pk) not in unique_columns(target) or not set(pk).issubset(selected_columns):
+            return None
+
+        # keep the existing value when the source value is NULL
+        update_columns = [s for s in selected_columns if s not in pk]
+        if update_columns:
+            on_conflict = "DO UPDATE SET " + ", ".join(
+                f"[{s}] = COALESCE(excluded.[{s}], [{s}])" for s in update_columns
+            )
+        else:
+            on_conflict = "DO NOTHING"
+        sql = f"""INSERT INTO main.[{table}] ({columns_sql}) {select_sql}
+            ON CONFLICT ({", ".join(f"[{s}]" for s in pk)}) {on_conflict}"""
+    else:
+        sql = f"INSERT OR {'IGNORE' if args.ignore else 'REPLACE'} INTO main.[{table}] ({columns_sql}) {select_sql}"
+
+    if args.bulk_load:
+        with without_secondary_indexes(args, table):
+            return args.db.conn.execute(sql).rowcount
+    with args.db.conn:
+        return args.db.conn.execute(sql).rowcount
+
+
+def merge_table_rows(args, s_db, table, selected_columns, kwargs) -> int:
+    row_count = 0
+
+    def counted(data):
+        nonlocal row_count
+        for d in data:
+            row_count += 1
+            yield d
+
+    data = s_db[table].rows_where(where=" AND ".join(args.where) if args.where else None)
+    data = ({k: v for k, v in d.items() if k in selected_columns} for d in data)
+    with transaction(args):
+        args.db[table].insert_all(
+            counted(data),
+            alter=True,
+            ignore=args.ignore,
+            replace=not args.ignore,
+            upsert=args.upsert,
+            **kwargs,
+        )
+    return row_count
+
+
 def merge_db(args, source_db) -> None:
     source_db = str(Path(source_db).resolve())
 
     s_db = db_utils.connect(args, conn=sqlite3.connect(source_db))
-    for table in [s for s in s_db.table_names() if "_fts" not in s and not s.startswith("sqlite_")]:
-        if args.only_tables and table not in args.only_tables:
-            log.info("[%s]: Skipping %s", source_db, table)
-            continue
-        else:
-            log.info("[%s]: %s", source_db, table)
-
-        skip_columns = args.skip_columns
-        primary_keys = args.primary_keys
-        if args.business_keys:
-            if not primary_keys:
-                primary_keys = list(o.name for o in args.db[table].columns if o.is_pk)
-
-            skip_columns = [*(args.skip_columns or []), *primary_keys]
-
-        selected_columns = s_db[table].columns_dict
-        if args.only_target_columns:
-            target_columns = args.db[table].columns_dict
-            selected_columns = [s for s in selected_columns if s in target_columns]
-        if skip_columns:
-            selected_columns = [s for s in selected_columns if s not in skip_columns]
-
-        log.info("[%s]: %s", table, selected_columns)
-        kwargs = {}
-        if args.business_keys or primary_keys:
-            source_table_pks = [s for s in (args.business_keys or primary_keys) if s in selected_columns]
-            if source_table_pks:
-                log.info("[%s]: Using %s as primary key(s)", table, ", ".join(source_table_pks))
-                kwargs["pk"] = source_table_pks
-
-        data = s_db[table].rows_where(where=" AND ".join(args.where) if args.where else None)
-        data = ({k: v for k, v in d.items() if k in selected_columns} for d in data)
-        with args.db.conn:
-            args.db[table].insert_all(
-                data,
-                alter=True,
-                ignore=args.ignore,
-                replace=not args.ignore,
-                upsert=args.upsert,
-                **kwargs,
-            )
+    args.db.attach("source", source_db)
+    try:
+        with source_transaction(args):
+            for table in [s for s in s_db.table_names() if "_fts" not in s and not s.startswith("sqlite_")]:
+                if args.only_tables and table not in args.only_tables:
+                    log.info("[%s]: Skipping %s", source_db, table)
+                    continue
+                else:
+                    log.info("[%s]: %s", source_db, table)
+
+                skip_columns = args.skip_columns
+                primary_keys = args.primary_keys
+                if args.business_keys:
+                    if not primary_keys:
+                        primary_keys = list(o.name for o in args.db[table].columns if o.is_pk)
+
+                    skip_columns = [*(args.skip_columns or []), *primary_keys]
+
+                selected_columns = s_db[table].columns_dict
+                if args.only_target_columns:
+                    target_columns = args.db[table].columns_dict
+                    selected_columns = [s for s in selected_columns if s in target_columns]
+                if skip_columns:
+                    selected_columns = [s for s in selected_columns if s not in skip_columns]
+                selected_columns = list(selected_columns)
+
+                log.info("[%s]: %s", table, selected_columns)
+                kwargs = {}
+                if args.business_keys or primary_keys:
+                    source_table_pks = [s for s in (args.business_keys or primary_keys) if s in selected_columns]
+                    if source_table_pks:
+                        log.info("[%s]: Using %s as primary key(s)", table, ", ".join(source_table_pks))
+                        kwargs["pk"] = source_table_pks
+
+                t = log_utils.Timer()
+                row_count = None
+                if selected_columns:
+                    row_count = merge_table_sql(args, s_db[table], table, selected_columns, kwargs.get("pk"))
+                if row_count is None:
+                    log.info("[%s]: Falling back to row-by-row insert", table)
+                    row_count = merge_table_rows(args, s_db, table, selected_columns, kwargs)
+                elapsed = float(t.elapsed())
+                rows_per_second = int(row_count / elapsed) if elapsed else row_count
+                print(f"[{source_db}]: {table} {row_count} rows ({rows_per_second} rows/s)")
+    finally:
+        args.db.execute("DETACH DATABASE source")
 
 
 def merge_dbs() -> None:
@@ -1,4 +1,4 @@
-import os, shutil, subprocess, threading, time
+import os, shutil, sqlite3, subprocess, threading, time
 from argparse import Namespace
 from collections import deque
 from concurrent.futures import ThreadPoolExecutor
@@ -204,8 +204,6 @@ def transcode(args, path) -> str:
     if Path(temp_video).exists():
         Path(path).unlink()
         shutil.move(temp_video, transcode_dest)
-        with args.db.conn:
-            args.db.conn.execute("UPDATE media SET path = ? where path = ?", [transcode_dest, path])
         return transcode_dest
     else:
         return path
@@ -375,23 +373,44 @@ class MediaPrefetcher:
         self.remaining = len(media)
         self.ignore_paths = set()
         self.futures = deque()
+        self.executor = None
+        self.db_lock = threading.Lock()
+
+    def connect(self):
+        # one connection shared by the prefetch workers instead of one per media
+        if getattr(self.args, "db", None) is None:
+            conn = None
+            if self.args.database and ":memory:" not in self.args.database:
+                conn = sqlite3.connect(self.args.database, check_same_thread=False)
+            self.args.db = db_utils.connect(self.args, conn=conn)
+        return self.args.db
 
     def fetch(self):
+        # submit without waiting: the workers prepare the next media while the current one plays
         if self.media:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                fill_count = 0
-                while self.media and len(self.futures) < max(1, self.args.prefetch):
-                    m = self.media.pop()
-                    if m["path"] in self.ignore_paths:
-                        continue
-
-                    future = executor.submit(self.prep_media, m)  # if self.args.prefetch > 1 else []
-                    self.ignore_paths.add(m["path"])
-                    self.futures.append(future)
-                    fill_count += 1
-                log.debug("prefetch full (inserted %s)", fill_count)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.args.prefetch or 1), thread_name_prefix="prefetch"
+                )
+
+            fill_count = 0
+            while self.media and len(self.futures) < max(1, self.args.prefetch or 1):
+                m = self.media.pop()
+                if m["path"] in self.ignore_paths:
+                    continue
+
+                future = self.executor.submit(self.prep_media, m)
+                self.ignore_paths.add(m["path"])
+                self.futures.append(future)
+                fill_count += 1
+            log.debug("prefetch full (inserted %s)", fill_count)
         return self
 
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
     def infer_command(self, m) -> tuple[list[str], bool]:
         args = self.args
 
@@ -475,7 +494,6 @@ class MediaPrefetcher:
 
     def prep_media(self, m: dict):
         t = log_utils.Timer()
-        self.args.db = db_utils.connect(self.args)
 
         m["original_path"] = m["path"]
         if not m["path"].startswith("http"):
@@ -484,11 +502,19 @@ class MediaPrefetcher:
 
             if not media_path.exists():
                 log.warning("[%s]: Does not exist. Skipping...", m["path"])
-                db_media.mark_media_deleted(self.args, m["original_path"])
+                with self.db_lock:
+                    self.connect()
+                    db_media.mark_media_deleted(self.args, m["original_path"])
                 return {}
 
             if self.args.transcode or self.args.transcode_audio:
-                m["path"] = m["original_path"] = transcode(self.args, m["path"])
+                transcode_dest = transcode(self.args, m["path"])
+                if transcode_dest != m["path"]:
+                    with self.db_lock:
+                        db = self.connect()
+                        with db.conn:
+                            db.conn.execute("UPDATE media SET path = ? where path = ?", [transcode_dest, m["path"]])
+                m["path"] = m["original_path"] = transcode_dest
                 log.debug("transcode: %s", t.elapsed())
 
         if self.args.folders:
@@ -690,6 +716,7 @@ def play(args, m, media_len) -> None:
 
 
 def play_list(args, media):
+    playlist = None
     try:
         playlist = MediaPrefetcher(args, media)
         playlist.fetch()
@@ -703,6 +730,8 @@ def play_list(args, media):
                     play(args, m, playlist.remaining)
 
     finally:
+        if playlist:
+            playlist.close()
         Path(args.mpv_socket).unlink(missing_ok=True)
         if args.chromecast:
             Path(consts.CAST_NOW_PLAYING).unlink(missing_ok=True)
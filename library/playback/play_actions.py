@@ -1,4 +1,4 @@
-import argparse, os
+import argparse
 from pathlib import Path
 
 from library import usage
@@ -385,7 +385,6 @@ def process_playqueue(args) -> None:
         log.debug("player.get_related_media: %s", t.elapsed())
 
     if args.big_dirs:
-        media_keyed = {d["path"]: d for d in media}
         folders = big_dirs.group_files_by_parents(args, media)
         folders = big_dirs.process_big_dirs(args, folders)
         folders = mcda.group_sort_by(args, folders)
@@ -395,20 +394,9 @@ def process_playqueue(args) -> None:
             media = db_media.get_dir_media(args, folders)
             log.debug("get_dir_media: %s", t.elapsed())
         else:
-            media = []
-            media_set = set()
-            for folder in folders:
-                if len(folder) == 1:
-                    continue
-
-                for key in media_keyed:
-                    if key in media_set:
-                        continue
-
-                    if os.sep not in key.replace(folder, "") and key.startswith(folder):
-                        media_set.add(key)
-                        media.append(media_keyed[key])
-            log.debug("double for loop compare_block_strings: %s", t.elapsed())
+            files_by_folder = big_dirs.index_by_parent({d["path"]: d for d in media}.values())
+            media = [m for folder in dict.fromkeys(folders) if len(folder) > 1 for m in files_by_folder.get(folder, [])]
+            log.debug("big_dirs.index_by_parent: %s", t.elapsed())
 
     if args.partial:
         media = history_sort(args, media)
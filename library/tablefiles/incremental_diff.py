@@ -1,4 +1,6 @@
-import argparse
+import argparse, itertools, numbers, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from library import usage
 from library.utils import arggroups, argparse_utils, consts, file_utils, web
@@ -20,6 +22,12 @@ def parse_args():
     parser.add_argument("--start-row", "--skiprows", type=int, default=None)
     parser.add_argument("--batch-size", "--batch-rows", default=str(consts.DEFAULT_FILE_ROWS_READ_LIMIT))
     parser.add_argument("--join-keys", action=ArgparseList, help="Comma separated join keys")
+    parser.add_argument(
+        "--partitions",
+        "--hash-partitions",
+        type=int,
+        help="Hash-partition both files by join keys into N temporary partitions; for unsorted files",
+    )
     parser.add_argument(
         "--join-tables",
         "--concat",
@@ -38,6 +46,9 @@ def parse_args():
 
     # TODO: add an option to load from df2 where ids (select ids from df1)
 
+    if args.partitions and not args.join_keys:
+        parser.error("--partitions requires --join-keys")
+
     if args.batch_size.lower() in ("inf", "none", "all"):
         args.batch_size = None
     else:
@@ -46,86 +57,203 @@ def parse_args():
     return args
 
 
-def process_chunks(args):
-    chunk_start_row = args.start_row
-    chunk_end_row = args.batch_size
+def read_chunks(args, path, table_name, table_index, encoding, mimetype):
+    order_by = args.sort
+    if order_by is None and args.join_keys and not args.partitions:
+        order_by = ", ".join(f"[{k}]" for k in args.join_keys)
+
+    return file_utils.read_file_to_dataframe_chunks(
+        path,
+        table_name=table_name,
+        table_index=table_index,
+        start_row=args.start_row,
+        batch_size=args.batch_size,
+        order_by=order_by,
+        encoding=encoding,
+        mimetype=mimetype,
+        join_tables=args.join_tables,
+        transpose=args.transpose,
+    )
+
+
+def sort_key(value):
+    # same order as SQLite ORDER BY: NULL (and NaN), numbers, text, blobs
+    import pandas as pd
+
+    if value is None or pd.isna(value):
+        return (0, 0)
+    elif isinstance(value, numbers.Number):
+        return (1, value)
+    elif isinstance(value, bytes):
+        return (3, value)
+    elif isinstance(value, str):
+        return (2, value)
+    return (2, str(value))
+
+
+def key_tuples(args, df):
+    return [tuple(sort_key(v) for v in t) for t in df[args.join_keys].itertuples(index=False, name=None)]
+
+
+def last_key(args, df):
+    return key_tuples(args, df.iloc[-1:])[0]
+
+
+def sorted_chunk_pairs(args, chunks1, chunks2):
+    # both sides are sorted by the join keys so any row with a key lower than
+    # the last key read from each side can not have a match in a later chunk
+    import pandas as pd
+
+    iterators = [iter(chunks1), iter(chunks2)]
+    buffers = [pd.DataFrame(), pd.DataFrame()]
+    exhausted = [False, False]
     while True:
-        dfs1 = file_utils.read_file_to_dataframes(
-            args.path1,
-            table_name=args.table1_name,
-            table_index=args.table1_index,
-            start_row=chunk_start_row,
-            end_row=chunk_end_row,
-            order_by=args.sort,
-            encoding=args.encoding1,
-            mimetype=args.mimetype1,
-            join_tables=args.join_tables,
-            transpose=args.transpose,
-        )
-        dfs2 = file_utils.read_file_to_dataframes(
-            args.path2,
-            table_name=args.table2_name,
-            table_index=args.table2_index,
-            start_row=chunk_start_row,
-            end_row=chunk_end_row,
-            order_by=args.sort,
-            encoding=args.encoding2,
-            mimetype=args.mimetype2,
-            join_tables=args.join_tables,
-            transpose=args.transpose,
-        )
-
-        # TODO: https://github.com/ICRAR/ijson
-
-        tables1 = {df.df_name for df in dfs1}
-        tables2 = {df.df_name for df in dfs2}
-        common_tables = tables1.intersection(tables2)
-        dfs1 = sorted(dfs1, key=lambda df: (df.df_name in common_tables, df.df_name), reverse=True)
-        dfs2 = sorted(dfs2, key=lambda df: (df.df_name in common_tables, df.df_name), reverse=True)
-
-        empty_dfs = set()
-        for df_idx in range(len(dfs1)):
-            df1 = dfs1[df_idx].df
-            df2 = dfs2[df_idx].df
-            df1_name = dfs1[df_idx].df_name
-            df2_name = dfs2[df_idx].df_name
-
-            # drop cols with all nulls to allow merging "X" and object columns
-            df1 = df1.drop(columns=df1.columns[df1.isnull().all()])
-            df2 = df2.drop(columns=df2.columns[df2.isnull().all()])
-
-            if df1.empty and df2.empty:
-                empty_dfs.add(df_idx)
+        for i, j in ((0, 1), (1, 0)):
+            if exhausted[i]:
                 continue
-            elif df1.empty:
-                log.warning("df1 has no more rows")
-            elif df2.empty:
-                log.warning("df2 has no more rows")
+            if (
+                buffers[i].empty
+                or buffers[j].empty
+                or exhausted[j]
+                or last_key(args, buffers[i]) <= last_key(args, buffers[j])
+            ):
+                try:
+                    df = next(iterators[i])
+                except StopIteration:
+                    exhausted[i] = True
+                else:
+                    buffers[i] = df if buffers[i].empty else pd.concat([buffers[i], df], ignore_index=True)
 
-            df_diff = df1.merge(df2, on=args.join_keys, how="outer", indicator=True)
-            df_diff = df_diff[df_diff["_merge"] != "both"]
+        if all(exhausted):
+            yield buffers
+            break
 
-            if len(df_diff) > 0:
-                print(f"## Diff {args.path1}:{df1_name} and {args.path2}:{df2_name}")
-                print_df(df_diff)
-            del df1
-            del df2
+        last_keys = [last_key(args, df) for df, done in zip(buffers, exhausted) if not done and not df.empty]
+        if not last_keys:
+            continue
+        watermark = min(last_keys)
 
-        if len(empty_dfs) == len(dfs1):
-            break
+        ready = []
+        for i in (0, 1):
+            if buffers[i].empty:
+                ready.append(buffers[i])
+                continue
+            mask = [k < watermark for k in key_tuples(args, buffers[i])]
+            ready.append(buffers[i][mask])
+            buffers[i] = buffers[i][[not b for b in mask]]
+        if not (ready[0].empty and ready[1].empty):
+            yield ready
+
+
+def chunk_pairs(args, chunks1, chunks2):
+    import pandas as pd
+
+    if args.join_keys:
+        yield from sorted_chunk_pairs(args, chunks1, chunks2)
+    else:
+        for df1, df2 in itertools.zip_longest(chunks1, chunks2):
+            yield (pd.DataFrame() if df1 is None else df1), (pd.DataFrame() if df2 is None else df2)
 
-        del dfs1
-        del dfs2
 
-        if args.batch_size:
-            if chunk_start_row is None:
-                chunk_start_row = 0
-            chunk_start_row += args.batch_size
-            chunk_end_row += args.batch_size
-            log.debug(chunk_end_row)
+def diff_dataframes(args, df1, df2):
+    # drop cols with all nulls to allow merging "X" and object columns; a chunk of NULL join keys keeps its keys
+    join_keys = args.join_keys or []
+    df1 = df1.drop(columns=[s for s in df1.columns[df1.isnull().all()] if s not in join_keys])
+    df2 = df2.drop(columns=[s for s in df2.columns[df2.isnull().all()] if s not in join_keys])
+
+    if df1.empty and df2.empty:
+        return None
+    elif df1.empty:
+        log.info("df1 has no more rows")
+        return df2.assign(_merge="right_only")
+    elif df2.empty:
+        log.info("df2 has no more rows")
+        return df1.assign(_merge="left_only")
+
+    df_diff = df1.merge(df2, on=args.join_keys, how="outer", indicator=True)
+    return df_diff[df_diff["_merge"] != "both"]
+
+
+def partition_keys(args, df):
+    # a key read as int in one chunk and as float in another ("5" vs "5.0") must hash the same
+    import pandas as pd
+
+    keys = pd.DataFrame(
+        {
+            k: (
+                df[k].astype("float64")
+                if pd.api.types.is_numeric_dtype(df[k]) and not pd.api.types.is_bool_dtype(df[k])
+                else df[k].astype(str)
+            )
+            for k in args.join_keys
+        }
+    )
+    return pd.util.hash_pandas_object(keys, index=False) % args.partitions
+
+
+def partition_chunks(args, chunks, partition_dir):
+    for chunk_idx, df in enumerate(chunks):
+        if df.empty:
             continue
-        else:
-            break
+        for partition, df_partition in df.groupby(partition_keys(args, df).to_numpy()):
+            os.makedirs(os.path.join(partition_dir, str(partition)), exist_ok=True)
+            df_partition.to_pickle(os.path.join(partition_dir, str(partition), f"{chunk_idx}.pkl"))
+
+
+def read_partition(partition_dir, partition):
+    import pandas as pd
+
+    try:
+        dfs = [pd.read_pickle(entry.path) for entry in os.scandir(os.path.join(partition_dir, str(partition)))]
+    except FileNotFoundError:  # no rows hashed to this partition
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
+def diff_partition(args, partition_dir1, partition_dir2, partition):
+    df1 = read_partition(partition_dir1, partition)
+    df2 = read_partition(partition_dir2, partition)
+    return diff_dataframes(args, df1, df2)
+
+
+def process_partitions(args, t1, t2):
+    # rows with the same join keys always land in the same partition so partitions can be compared independently
+    with tempfile.TemporaryDirectory(prefix="library_incremental_diff_") as temp_dir:
+        partition_dir1 = os.path.join(temp_dir, "1")
+        partition_dir2 = os.path.join(temp_dir, "2")
+        os.mkdir(partition_dir1)
+        os.mkdir(partition_dir2)
+        partition_chunks(args, t1.chunks, partition_dir1)
+        partition_chunks(args, t2.chunks, partition_dir2)
+
+        with ProcessPoolExecutor(max_workers=args.threads) as pool:
+            for df_diff in pool.map(
+                partial(diff_partition, args, partition_dir1, partition_dir2), range(args.partitions)
+            ):
+                if df_diff is not None and len(df_diff) > 0:
+                    print(f"## Diff {args.path1}:{t1.df_name} and {args.path2}:{t2.df_name}")
+                    print_df(df_diff)
+
+
+def process_chunks(args):
+    # TODO: https://github.com/ICRAR/ijson
+    tables1 = read_chunks(args, args.path1, args.table1_name, args.table1_index, args.encoding1, args.mimetype1)
+    tables2 = read_chunks(args, args.path2, args.table2_name, args.table2_index, args.encoding2, args.mimetype2)
+
+    common_tables = {t.df_name for t in tables1}.intersection(t.df_name for t in tables2)
+    tables1 = sorted(tables1, key=lambda t: (t.df_name in common_tables, t.df_name), reverse=True)
+    tables2 = sorted(tables2, key=lambda t: (t.df_name in common_tables, t.df_name), reverse=True)
+
+    for t1, t2 in zip(tables1, tables2):
+        if args.partitions:
+            process_partitions(args, t1, t2)
+            continue
+
+        for df1, df2 in chunk_pairs(args, t1.chunks, t2.chunks):
+            df_diff = diff_dataframes(args, df1, df2)
+            if df_diff is not None and len(df_diff) > 0:
+                print(f"## Diff {args.path1}:{t1.df_name} and {args.path2}:{t2.df_name}")
+                print_df(df_diff)
 
 
 def incremental_diff():
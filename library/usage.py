@@ -183,6 +183,10 @@ download = r"""library download DATABASE [--prefix /mnt/d/] --video [--subs] [--
     Download checked videos
 
         library download --fs open_dir.db --prefix ~/d/dump/video/ -w 'id in (select media_id from history)'
+
+    Filesystem downloads run in parallel; limit how hard each host is hit
+
+        library download --fs open_dir.db --threads 16 --per-host 2 --sleep-requests 1
 """
 
 block = r"""library block DATABASE URL ...
@@ -292,6 +296,11 @@ fs_update = """library fs-update DATABASE
     Update each path previously saved
 
         library fsupdate video.db
+
+    Only folders which changed since the last scan are listed again (detected via folder mtime and inode).
+    If you changed files without changing their folders' mtime run fs-add on the path to do a full rescan
+
+        library fsadd video.db ./tv/
 """
 
 places_import = """library places-import DATABASE PATH ...
@@ -645,6 +654,8 @@ big_dirs = """library big-dirs PATH ... [--limit (4000)] [--depth (0)] [--sort-g
 
 disk_usage = """library disk-usage DATABASE [--sort-groups-by size | count] [--depth DEPTH] [PATH / SUBSTRING SEARCH]
 
+    Databases created by fsadd keep a table of folder totals so unfiltered queries don't need to read every media row
+
     Only include files smaller than 1kib
 
         library disk-usage du.db --size=-1Ki
@@ -876,6 +887,10 @@ merge_dbs = """library merge-dbs SOURCE_DB ... DEST_DB [--only-target-columns] [
      Split DBs using --where
 
          library merge-dbs --pk path big.db specific-site.db -v --only-new-rows -t media,playlists -w 'path like "https://specific-site%"'
+
+     Merge large DBs with one transaction per source db, rows in primary key order, and indexes rebuilt afterwards
+
+         library merge-dbs --bulk-load --pk path disk1.db disk2.db disk3.db all.db
 """
 
 merge_folders = """library merge-folders [--replace] [--no-replace] [--simulate] SOURCES ... DESTINATION
@@ -1169,7 +1184,7 @@ surf = """library surf [--count COUNT] [--target-hosts TARGET_HOSTS] < stdin
     If you prefer GUI, check out https://unli.xyz/tabsender/
 """
 
-pushshift = """library pushshift DATABASE < stdin
+pushshift = """library pushshift DATABASE [PATH ...] < stdin
 
     Download data (about 600GB jsonl.zst; 6TB uncompressed)
 
@@ -1179,6 +1194,10 @@ pushshift = """library pushshift DATABASE < stdin
 
         unzstd --memory=2048MB --stdout RS_2005-07.zst | library pushshift pushshift.db
 
+    Or read .zst files directly (requires zstandard). Lines are parsed by --threads worker processes
+
+        library pushshift pushshift.db RS_2005-07.zst RS_2005-08.zst
+
     Or multiple (output is about 1.5TB SQLite fts-searchable)
 
         for f in psaw/files.pushshift.io/reddit/submissions/*.zst
@@ -1327,15 +1346,20 @@ mcda = """library mcda PATH ... [--table STR] [--end-row INT]
         |  591 | Gandhi                                                                  |   1982 |        8 |            11 | 0.755312    | 1.13663  | 0.243509    | 4116.86 |
 """
 
-incremental_diff = """library incremental-diff PATH1 PATH2 [--join-keys JOIN_KEYS] [--table1 TABLE1] [--table2 TABLE2] [--table1-index TABLE1_INDEX] [--table2-index TABLE2_INDEX] [--start-row START_ROW] [--batch-size BATCH_SIZE]
+incremental_diff = """library incremental-diff PATH1 PATH2 [--join-keys JOIN_KEYS] [--partitions N] [--table1 TABLE1] [--table2 TABLE2] [--table1-index TABLE1_INDEX] [--table2-index TABLE2_INDEX] [--start-row START_ROW] [--batch-size BATCH_SIZE]
 
     See data differences in an incremental way to quickly see how two different files differ.
 
     Data (PATH1, PATH2) can be two different files of different file formats (CSV, Excel) or it could even be the same file with different tables.
 
     If files are unsorted you may need to use `--join-keys id,name` to specify ID columns. Rows that have the same ID will then be compared.
+    With `--join-keys` both files are read as sorted streams: SQLite tables are read in join key order; other files should already be sorted by the join keys.
     If you are comparing SQLite files you may be able to use `--sort id,name` to achieve the same effect.
 
+    Each file is only read once; memory use is bounded by `--batch-size`.
+
+    For large unsorted files use `--partitions N` with `--join-keys`. Both files are hash-partitioned by the join keys into temporary files and then each pair of partitions is diffed in parallel (`--threads`)
+
     To diff everything at once run with `--batch-size inf`
 """
 
@@ -1855,6 +1879,13 @@ process_media = """library process-media DATABASE_OR_PATH
 
         library process-media --invalid --no-valid --delete-unplayable video.db
 
+    Convert more images in parallel and stop starting new jobs after freeing 50GB or after 8 hours
+
+        library process-media --image-threads 8 --max-savings 50GB --timeout 8h video.db
+
+    Processing times are recorded to ~/.local/share/process_media.db and after a few files of each type
+    they are used instead of --transcoding-*-rate and --transcoding-image-time to estimate processing time
+
     If not installed, related file extensions will be skipped during scan:
 
         - FFmpeg is required for shrinking video and audio
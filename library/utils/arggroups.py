@@ -663,6 +663,12 @@ def mmv_folders(parent_parser):
 -S+5GB -S-7GB  # between 5 and 7 GB""",
     )
     parser.add_argument("--limit", "-n", "-l", "-L", type=int, help="Limit number of files transferred")
+    parser.add_argument(
+        "--same-device-threads",
+        type=int,
+        default=1,
+        help="Copy at most N files to the same destination device at once (renames are not limited)",
+    )
     parser.add_argument("--relative", "--rel", action="store_true", help="Shortcut: --relative-to=/")
     parser.add_argument(
         "--relative-to",
@@ -965,6 +971,11 @@ Recommended to use with -L inf and --duration or --depth filters; see `lb big-di
     )
     parser.add_argument("--depth", "-D", type=int, help="Folder depth of files")
     parser.add_argument("--parents", action="store_true", help="Include recursive sub-files in folder statistics")
+    parser.add_argument(
+        "--columnar",
+        action=argparse.BooleanOptionalAction,
+        help="Aggregate folder statistics with pandas (default: when there are more than 100,000 files)",
+    )
 
     parser.add_argument(
         "--folder-sizes",
@@ -1450,6 +1461,13 @@ def download(parent_parser):
         "--http-download-retries", type=int, default=10, help="Use N retries for downloads (current session)"
     )
     parser.add_argument("--download-chunk-size", type=nums.human_to_bytes, default="8MB")
+    parser.add_argument(
+        "--download-segments",
+        "--segments",
+        type=int,
+        default=1,
+        help="Filesystem: Download large files over N connections in parallel (byte ranges)",
+    )
     parser.add_argument(
         "--force",
         action="store_true",
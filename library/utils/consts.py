@@ -31,6 +31,11 @@ TEMP_DIR = str(Path(gettempdir()).resolve())
 TEMP_SCRIPT_DIR = os.getenv("XDG_RUNTIME_DIR") or TEMP_DIR
 CAST_NOW_PLAYING = str(Path(TEMP_DIR) / "catt_playing")
 SUB_TEMP_DIR = str(Path(TEMP_DIR) / "library_temp_subtitles" / random_string())
+CACHE_DIR = (
+    str(Path(TEMP_DIR) / "library_cache")
+    if PYTEST_RUNNING
+    else str(Path(os.getenv("XDG_CACHE_HOME") or "~/.cache").expanduser().resolve() / "library")
+)
 DEFAULT_MPV_LISTEN_SOCKET = str(Path(TEMP_SCRIPT_DIR) / "mpv_socket")
 DEFAULT_MPV_WATCH_SOCKET = str(Path("~/.config/mpv/socket").expanduser().resolve())
 
@@ -55,6 +60,11 @@ DIRS_NO_FILTER = 2
 DEFAULT_PLAYLIST_LIMIT = 20_000
 DEFAULT_FILE_ROWS_READ_LIMIT = 500_000
 SQLITE_PARAM_LIMIT = 32766
+FFPROBE_CACHE_SIZE = 512 * 1024 * 1024  # bytes
+SUBPROCESS_LIMITS = {  # max concurrent subprocesses per resource; see processes.SubprocessScheduler
+    "cpu": os.cpu_count() or 4,  # decoding / encoding
+    "io": (os.cpu_count() or 4) * 4,  # probing metadata
+}
 DEFAULT_PLAY_QUEUE = 120
 DEFAULT_MULTIPLE_PLAYBACK = -1
 DEFAULT_SUBTITLE_MIX = 0.35
@@ -107,7 +107,8 @@ def clobber(args, source, destination) -> tuple[str | None, str]:
         log.info("Destination is the same as source\t%s", destination)
         return None, destination
 
-    if getattr(args, "skip_open", False) and file_utils.is_file_open(source):
+    # a snapshot of open files is reused for OPEN_FILES_TTL seconds while clobbering many files
+    if getattr(args, "skip_open", False) and file_utils.is_file_open(source, max_age=file_utils.OPEN_FILES_TTL):
         log.info("Source already has an open file handler\t%s", destination)
         return None, destination
 
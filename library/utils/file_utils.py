@@ -1,4 +1,4 @@
-import errno, mimetypes, os, shlex, shutil, subprocess, tempfile, time
+import errno, mimetypes, os, shlex, shutil, sqlite3, subprocess, tempfile, threading, time
 from collections import Counter, namedtuple
 from fnmatch import fnmatch
 from functools import wraps
@@ -89,6 +89,85 @@ def rglob(
     return files, filtered_files, folders
 
 
+def rglob_changed(
+    base_dir: str | Path,
+    known_folders: dict,  # {path: (st_mtime_ns, st_ino)}
+    extensions=None,  # None | Iterable[str]
+    exclude=None,  # None | Iterable[str]
+    seen_folders=None,  # dict filled in as the walk goes: {path: (st_mtime_ns | None, st_ino)}
+    quiet=False,
+):
+    # only list folders whose (st_mtime_ns, st_ino) differ from known_folders
+    # and yield (folder, files) as soon as each one is listed
+    # unchanged folders are descended into using the subfolders recorded in known_folders
+    if extensions:
+        extensions = tuple(s if s.startswith(".") else f".{s}" for s in extensions)
+    if seen_folders is None:
+        seen_folders = {}
+
+    known_subfolders = {}
+    for p in known_folders:
+        known_subfolders.setdefault(os.path.dirname(p), []).append(p)
+
+    # a folder modified within the timestamp granularity of the filesystem can change again
+    # without its mtime changing so it is not trusted on the next run
+    racy_ns = time.time_ns() - 2_000_000_000
+
+    listed_count = 0
+    files_count = 0
+    stack = [str(base_dir)]
+    while stack:
+        current_dir = stack.pop()
+        try:
+            stat = os.stat(current_dir)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        mtime_ns = stat.st_mtime_ns if stat.st_mtime_ns < racy_ns else None
+        known = known_folders.get(current_dir)
+        if known and known[0] is not None and known == (stat.st_mtime_ns, stat.st_ino):
+            seen_folders[current_dir] = known
+            stack.extend(known_subfolders.get(current_dir) or [])
+            continue
+
+        try:
+            scanned_dir = os.scandir(current_dir)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        except OSError as e:
+            if e.errno == 5:  # Input/output error
+                log.exception("Input/output error: check dmesg. Skipping folder %s", current_dir)
+            raise
+
+        files = set()
+        with scanned_dir:
+            for entry in scanned_dir:
+                if entry.is_dir(follow_symlinks=False):
+                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                        continue
+                    stack.append(entry.path)
+                elif entry.is_symlink():
+                    continue
+                else:  # file or close enough
+                    if extensions and not entry.path.lower().endswith(extensions):
+                        continue
+                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                        continue
+                    files.add(entry.path)
+
+        seen_folders[current_dir] = (mtime_ns, stat.st_ino)
+        listed_count += 1
+        files_count += len(files)
+
+        if not quiet:
+            printing.print_overwrite(f"[{base_dir}] {scan_stats(files_count, 0, listed_count, 0)} listed")
+        yield current_dir, files
+
+    if not consts.PYTEST_RUNNING and not quiet:
+        unchanged_count = len(seen_folders) - listed_count
+        print(f"\r[{base_dir}] {scan_stats(files_count, 0, listed_count, 0)} listed [{unchanged_count} unchanged]")
+
+
 def rglob_gen(
     base_dir: str | Path,
     extensions=None,  # None | Iterable[str]
@@ -209,7 +288,43 @@ def trash(args, path: Path | str, detach=True) -> None:
             Path(path).unlink(missing_ok=True)
 
 
-def is_file_open(path):
+OPEN_FILES_TTL = 2.0  # seconds a /proc snapshot is trusted
+OPEN_FILES_LOCK = threading.Lock()
+open_files_snapshot = (float("-inf"), frozenset())
+
+
+def scan_open_files() -> frozenset[str]:
+    paths = set()
+    for proc in os.listdir("/proc"):
+        if not proc.isdigit():
+            continue
+        fd_dir = os.path.join("/proc", proc, "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if link.startswith("/"):
+                paths.add(link)
+    return frozenset(paths)
+
+
+def open_files(max_age=OPEN_FILES_TTL) -> frozenset[str]:
+    # files opened after the snapshot was taken are not seen for up to max_age seconds
+    global open_files_snapshot
+    with OPEN_FILES_LOCK:
+        scanned_at, paths = open_files_snapshot
+        if time.monotonic() - scanned_at > max_age:
+            paths = scan_open_files()
+            open_files_snapshot = (time.monotonic(), paths)
+    return paths
+
+
+def is_file_open(path, max_age=0):
     if os.name == "nt":
         try:
             os.open(path, os.O_RDWR | os.O_EXCL)
@@ -217,17 +332,7 @@ def is_file_open(path):
         except OSError:
             return True
     else:
-        open_files = set()
-        for proc in os.listdir("/proc"):
-            try:
-                fd_dir = os.path.join("/proc", proc, "fd")
-                for fd in os.listdir(fd_dir):
-                    link = os.readlink(os.path.join(fd_dir, fd))
-                    if link.startswith("/") and link == path:
-                        open_files.add(link)
-            except OSError:
-                continue
-        return path in open_files
+        return path in open_files(max_age)
 
 
 def filter_file(path, sieve) -> None:
@@ -278,16 +383,106 @@ def fast_glob(path_dir, limit=100):
     return sorted(files)
 
 
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+UNSUPPORTED_COPY_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF)
+
+
+def data_segments(fd, size) -> list[tuple[int, int]]:
+    # (offset, length) of each run of data; holes in sparse files are skipped
+    segments = []
+    offset = 0
+    try:
+        while offset < size:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            offset = os.lseek(fd, start, os.SEEK_HOLE)
+            segments.append((start, offset - start))
+    except OSError as e:
+        if e.errno != errno.ENXIO:  # ENXIO: no more data after offset
+            return [(0, size)]
+    return segments
+
+
+def copy_segment(method, fd_src, fd_dest, offset, length) -> int:
+    if method == "copy_file_range":
+        return os.copy_file_range(
+            fd_src, fd_dest, min(length, COPY_CHUNK_SIZE), offset_src=offset, offset_dst=offset
+        )
+    elif method == "sendfile":
+        os.lseek(fd_dest, offset, os.SEEK_SET)
+        return os.sendfile(fd_dest, fd_src, offset, min(length, COPY_CHUNK_SIZE))
+    else:
+        data = os.pread(fd_src, min(length, 1024 * 1024), offset)
+        return os.pwrite(fd_dest, data, offset)
+
+
+def copy_file_data(fd_src, fd_dest) -> str:
+    # try a reflink, then copy_file_range, then sendfile, then read/write; returns the method which copied the data
+    try:
+        import fcntl
+
+        fcntl.ioctl(fd_dest, FICLONE, fd_src)
+        return "reflink"
+    except (ImportError, OSError):
+        pass
+
+    methods = ["copy_file_range", "sendfile", "buffered"]
+    if not hasattr(os, "copy_file_range"):
+        methods.remove("copy_file_range")
+
+    size = os.fstat(fd_src).st_size
+    end = size
+    for offset, length in data_segments(fd_src, size):
+        while length > 0:
+            try:
+                copied = copy_segment(methods[0], fd_src, fd_dest, offset, length)
+            except OSError as e:
+                if e.errno in UNSUPPORTED_COPY_ERRNOS and len(methods) > 1:
+                    methods.pop(0)
+                    continue
+                raise
+            if copied == 0:
+                if len(methods) > 1:  # some filesystems return 0 before EOF
+                    methods.pop(0)
+                    continue
+                end = offset  # source file got shorter
+                break
+            offset += copied
+            length -= copied
+        if end < size:
+            break
+    os.ftruncate(fd_dest, end)  # trailing hole
+    return methods[0]
+
+
+def fast_copy(source_file, destination_file) -> str:
+    # shutil.copy2 which lets the kernel copy the data
+    if os.path.isdir(destination_file):
+        destination_file = os.path.join(destination_file, os.path.basename(source_file))
+    if not consts.IS_LINUX:
+        return shutil.copy2(source_file, destination_file)
+
+    if os.path.exists(destination_file) and os.path.samefile(source_file, destination_file):
+        msg = f"{source_file} and {destination_file} are the same file"
+        raise shutil.SameFileError(msg)
+
+    with open(source_file, "rb") as fsrc, open(destination_file, "wb") as fdest:
+        method = copy_file_data(fsrc.fileno(), fdest.fileno())
+    shutil.copystat(source_file, destination_file)
+    log.debug("%s: %s", method, destination_file)
+    return destination_file
+
+
 def copy_file(source_file, destination_file, simulate=False):
     if simulate:
         print("cp", source_file, destination_file)
     else:
         try:
-            shutil.copy2(source_file, destination_file)
+            fast_copy(source_file, destination_file)
         except OSError as e:
             if e.errno in (errno.ENOENT, errno.EXDEV):
                 os.makedirs(os.path.dirname(destination_file), exist_ok=True)
-                shutil.copy2(source_file, destination_file)  # try again
+                fast_copy(source_file, destination_file)  # try again
             else:
                 raise
 
@@ -312,11 +507,11 @@ def rename_move_file(source_file, destination_file, simulate=False):
                     os.rename(source_file, destination_file)  # try again
                 except OSError as e:
                     if e.errno == errno.EXDEV:  # Cross-device
-                        shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                        shutil.move(source_file, destination_file, copy_function=fast_copy)  # Fallback to shutil.move
                     else:
                         raise
             elif e.errno == errno.EXDEV:  # Cross-device
-                shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                shutil.move(source_file, destination_file, copy_function=fast_copy)  # Fallback to shutil.move
             else:
                 raise
 
@@ -748,6 +943,159 @@ def read_file_to_dataframes(
     return dfs
 
 
+NDFChunks = namedtuple("NamedDataFrameChunks", ["df_name", "chunks"])
+
+
+def sqlite_table_chunks(path, table, batch_size=None, start_row=None, order_by=None):
+    import pandas as pd
+    from sqlite_utils import Database
+
+    db = Database(path)
+    try:
+        try:
+            db.execute(f"SELECT _rowid_ FROM [{table}] LIMIT 0")
+            has_rowid = True
+        except sqlite3.OperationalError:  # views and WITHOUT ROWID tables
+            has_rowid = False
+
+        if order_by or not has_rowid or not batch_size:
+            # one cursor which is read in batches
+            cursor = db.execute(
+                f"SELECT * FROM [{table}] {'ORDER BY ' + order_by if order_by else ''} LIMIT -1 OFFSET ?",
+                [start_row or 0],
+            )
+            columns = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size) if batch_size else cursor.fetchall()
+                yield pd.DataFrame(rows, columns=columns)
+                if not batch_size or len(rows) < batch_size:
+                    break
+        else:
+            # keyset pagination: each page is an index seek instead of re-reading OFFSET rows
+            last_rowid = None
+            while True:
+                if last_rowid is None:
+                    cursor = db.execute(
+                        f"SELECT _rowid_ AS __keyset_rowid, * FROM [{table}] ORDER BY _rowid_ LIMIT ? OFFSET ?",
+                        [batch_size, start_row or 0],
+                    )
+                else:
+                    cursor = db.execute(
+                        f"""SELECT _rowid_ AS __keyset_rowid, * FROM [{table}]
+                        WHERE _rowid_ > ? ORDER BY _rowid_ LIMIT ?""",
+                        [last_rowid, batch_size],
+                    )
+                columns = [d[0] for d in cursor.description]
+                rows = cursor.fetchall()
+                df = pd.DataFrame(rows, columns=columns)
+                if rows:
+                    last_rowid = rows[-1][0]
+                yield df.drop(columns="__keyset_rowid")
+                if len(rows) < batch_size:
+                    break
+    finally:
+        db.close()
+
+
+def dataframe_slices(df, batch_size=None):
+    if not batch_size:
+        yield df
+        return
+    for start in range(0, max(len(df), 1), batch_size):
+        yield df.iloc[start : start + batch_size]
+
+
+def read_file_to_dataframe_chunks(
+    path,
+    table_name=None,
+    table_index=None,
+    start_row=None,
+    batch_size=None,
+    order_by=None,
+    encoding=None,
+    mimetype=None,
+    join_tables=False,
+    transpose=False,
+) -> list[NDFChunks]:
+    # like read_file_to_dataframes but each table is an iterator of DataFrames which reads the file only once
+    import pandas as pd
+
+    if mimetype is None:
+        mimetype = file_utils.mimetype(path)
+    if mimetype is not None:
+        mimetype = mimetype.strip().lower()
+    log.info(mimetype)
+
+    if mimetype is None:
+        msg = f"{path}: File type could not be determined. Pass in --filetype"
+        raise ValueError(msg)
+
+    if join_tables or transpose:
+        pass  # these need the whole table
+    elif mimetype in ("sqlite", "sqlite3", "sqlite database file"):
+        from sqlite_utils import Database
+
+        db = Database(path)
+        if table_name:
+            tables = [table_name]
+        else:
+            tables = [
+                s
+                for s in db.table_names() + db.view_names()
+                if not any(["_fts_" in s, s.endswith("_fts"), s.startswith("sqlite_")])
+            ]
+            if table_index is not None:
+                tables = [tables[table_index]]
+        db.close()
+
+        return [
+            NDFChunks(table, sqlite_table_chunks(path, table, batch_size, start_row=start_row, order_by=order_by))
+            for table in tables
+        ]
+    elif mimetype in ("csv", "text/csv", "tsv", "text/tsv", "text/tab-separated-values"):
+        reader = pd.read_csv(
+            path,
+            delimiter="\t" if "tsv" in mimetype or "tab-separated" in mimetype else ",",
+            chunksize=batch_size,
+            skiprows=range(1, (start_row or 0) + 1),
+            encoding=encoding,
+        )
+        return [NDFChunks("0", [reader] if batch_size is None else reader)]
+    elif mimetype in ("jsonl", "json lines", "geojson lines"):
+        reader = pd.read_json(path, lines=True, chunksize=batch_size, encoding=encoding)
+        if batch_size is None:
+            return [NDFChunks("0", dataframe_slices(reader.iloc[start_row or 0 :]))]
+        return [NDFChunks("0", (df.iloc[max((start_row or 0) - df.index[0], 0) :] for df in reader))]
+    elif mimetype in ("parq", "parquet", "application/parquet"):
+        import pyarrow.parquet as pq
+
+        def parquet_chunks():
+            skip = start_row or 0
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size or 65536):
+                if skip >= batch.num_rows:
+                    skip -= batch.num_rows
+                    continue
+                yield batch.slice(skip).to_pandas()
+                skip = 0
+
+        if batch_size is None:
+            return [NDFChunks("0", [pd.read_parquet(path).iloc[start_row or 0 :]])]
+        return [NDFChunks("0", parquet_chunks())]
+
+    dfs = read_file_to_dataframes(
+        path,
+        table_name=table_name,
+        table_index=table_index,
+        start_row=start_row,
+        order_by=order_by,
+        encoding=encoding,
+        mimetype=mimetype,
+        join_tables=join_tables,
+        transpose=transpose,
+    )
+    return [NDFChunks(t.df_name, dataframe_slices(t.df, batch_size)) for t in dfs]
+
+
 def get_filesize(d):
     try:
         stat = Path(d["path"]).stat()
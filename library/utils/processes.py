@@ -1,4 +1,5 @@
-import contextlib, functools, importlib, json, multiprocessing, os, shlex, signal, subprocess, sys, threading
+import asyncio, concurrent.futures, contextlib, functools, heapq, importlib, itertools, json, multiprocessing, os, shlex, signal, sqlite3, subprocess, sys, threading, time
+from collections.abc import Iterable
 from contextlib import suppress
 from pathlib import Path
 from shutil import which
@@ -125,6 +126,120 @@ def timeout_thread(seconds):
     yield run
 
 
+def imap_unordered(executor, fn, items: Iterable, max_in_flight: int):
+    # like executor.map but yields (item, result) in completion order
+    # and only pulls the next item from the iterable when a slot frees up
+    items = iter(items)
+    future_to_item = {}
+    for item in itertools.islice(items, max_in_flight):
+        future_to_item[executor.submit(fn, item)] = item
+
+    while future_to_item:
+        done, _pending = concurrent.futures.wait(future_to_item, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            item = future_to_item.pop(future)
+            for next_item in itertools.islice(items, 1):
+                future_to_item[executor.submit(fn, next_item)] = next_item
+            yield item, future.result()
+
+
+class PrioritySemaphore:
+    # asyncio.Semaphore but waiters with a lower priority number are woken first
+    def __init__(self, value: int):
+        self.value = value
+        self.waiters = []
+        self.counter = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # woken but cancelled before running; pass the slot on
+            raise
+
+    def release(self):
+        while self.waiters:
+            _priority, _count, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class SubprocessScheduler:
+    # runs subprocesses on one asyncio loop so every thread pool in the process shares the same budget
+    # ProcessPoolExecutor workers each get their own scheduler
+    def __init__(self, limits: dict[str, int]):
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.pid = None
+        self.loop = None
+        self.semaphores = {}
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.semaphores = {resource: PrioritySemaphore(n) for resource, n in self.limits.items()}
+                threading.Thread(target=self.loop.run_forever, name="SubprocessScheduler", daemon=True).start()
+                self.pid = os.getpid()
+        return self.loop  # type: ignore
+
+    async def run_async(self, command, resource="cpu", priority=0, **kwargs) -> subprocess.CompletedProcess:
+        async with self.semaphores[resource].slot(priority):
+            proc = await asyncio.create_subprocess_exec(
+                *command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+            )
+            try:
+                stdout, stderr = await proc.communicate()
+            except asyncio.CancelledError:
+                with suppress(ProcessLookupError):
+                    proc.kill()
+                raise
+        return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)  # type: ignore
+
+    def run(self, command, resource="cpu", priority=0, **kwargs) -> subprocess.CompletedProcess:
+        future = asyncio.run_coroutine_threadsafe(
+            self.run_async(command, resource=resource, priority=priority, **kwargs), self.get_loop()
+        )
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def run_many(self, commands, resource="cpu", priority=0, **kwargs) -> list[subprocess.CompletedProcess]:
+        async def gather():
+            return await asyncio.gather(
+                *(self.run_async(command, resource=resource, priority=priority, **kwargs) for command in commands)
+            )
+
+        future = asyncio.run_coroutine_threadsafe(gather(), self.get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+
+subprocess_scheduler = SubprocessScheduler(consts.SUBPROCESS_LIMITS)
+
+
 def os_bg_kwargs() -> dict:
     # prevent ctrl-c from affecting subprocesses first
 
@@ -138,7 +253,15 @@ def os_bg_kwargs() -> dict:
 
 
 def cmd(
-    *command, strict=True, cwd=None, quiet=True, error_verbosity=1, ignore_regexps=None, **kwargs
+    *command,
+    strict=True,
+    cwd=None,
+    quiet=True,
+    error_verbosity=1,
+    ignore_regexps=None,
+    resource=None,
+    priority=0,
+    **kwargs,
 ) -> subprocess.CompletedProcess:
     def print_std(s, is_success):
         if ignore_regexps is not None:
@@ -159,15 +282,22 @@ def cmd(
         return s
 
     try:
-        r = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            cwd=cwd,
-            errors=sys.getfilesystemencodeerrors(),
-            **os_bg_kwargs(),
-            **kwargs,
-        )
+        if resource:  # wait for a slot in the shared subprocess budget
+            r = subprocess_scheduler.run(
+                command, resource=resource, priority=priority, cwd=cwd, **os_bg_kwargs(), **kwargs
+            )
+            r.stdout = r.stdout.decode(errors=sys.getfilesystemencodeerrors())
+            r.stderr = r.stderr.decode(errors=sys.getfilesystemencodeerrors())
+        else:
+            r = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                cwd=cwd,
+                errors=sys.getfilesystemencodeerrors(),
+                **os_bg_kwargs(),
+                **kwargs,
+            )
     except UnicodeDecodeError:
         print(repr(command))
         raise
@@ -281,37 +411,96 @@ def is_album_art(s):
     return traverse_obj(s, ["disposition", "attached_pic"]) == 1
 
 
+ffprobe_cache = threading.local()
+
+
+def ffprobe_cache_db() -> sqlite3.Connection:
+    if getattr(ffprobe_cache, "pid", None) != os.getpid():  # sqlite connections can't be shared with forks
+        Path(consts.CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(Path(consts.CACHE_DIR) / "ffprobe.db", timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ffprobe (
+                dev INTEGER,
+                inode INTEGER,
+                size INTEGER,
+                mtime_ns INTEGER,
+                args TEXT,
+                time_used INTEGER,
+                json TEXT,
+                PRIMARY KEY (dev, inode, size, mtime_ns, args)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ffprobe_time_used_idx ON ffprobe (time_used);")
+        ffprobe_cache.conn = conn
+        ffprobe_cache.pid = os.getpid()
+    return ffprobe_cache.conn
+
+
+def ffprobe_cache_key(path, args) -> list | None:
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):  # URLs, etc
+        return None
+    if stat.st_mtime_ns > time.time_ns() - 2_000_000_000:  # still being written or racy mtime
+        return None
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, json.dumps(args)]
+
+
+def ffprobe_cache_get(key) -> str | None:
+    try:
+        conn = ffprobe_cache_db()
+        row = conn.execute(
+            "SELECT json, time_used FROM ffprobe WHERE dev=? AND inode=? AND size=? AND mtime_ns=? AND args=?", key
+        ).fetchone()
+        if row is None:
+            return None
+
+        out, time_used = row
+        if time_used < consts.today_stamp():  # avoid a write for every cache hit
+            conn.execute(
+                "UPDATE ffprobe SET time_used=? WHERE dev=? AND inode=? AND size=? AND mtime_ns=? AND args=?",
+                [consts.now(), *key],
+            )
+        return out
+    except sqlite3.Error as e:
+        log.debug("ffprobe cache: %s", e)
+        return None
+
+
+def ffprobe_cache_set(key, out: str) -> None:
+    try:
+        conn = ffprobe_cache_db()
+        conn.execute("INSERT OR REPLACE INTO ffprobe VALUES (?, ?, ?, ?, ?, ?, ?)", [*key, consts.now(), out])
+
+        ffprobe_cache.writes = getattr(ffprobe_cache, "writes", 0) + 1
+        if ffprobe_cache.writes % 1000 == 0:
+            page_size, page_count, freelist_count = (
+                conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                for pragma in ["page_size", "page_count", "freelist_count"]
+            )
+            if (page_count - freelist_count) * page_size > consts.FFPROBE_CACHE_SIZE:
+                # evict the least recently used quarter
+                conn.execute(
+                    """DELETE FROM ffprobe WHERE time_used <= (
+                        SELECT time_used FROM ffprobe ORDER BY time_used LIMIT 1 OFFSET (SELECT count(*) / 4 FROM ffprobe)
+                    )"""
+                )
+    except sqlite3.Error as e:
+        log.debug("ffprobe cache: %s", e)
+
+
 class FFProbe:
     def __init__(self, path, *args):
-        args = [
-            "ffprobe",
-            "-hide_banner",
-            "-rw_timeout",
-            "100000000",
-            "-timeout",
-            "45000000",
-            "-show_format",
-            "-show_streams",
-            "-show_chapters",
-            "-of",
-            "json",
-            *args,
-            path,
-        ]
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        out, err = p.communicate()
-        if p.returncode != 0:
-            log.info("ffprobe %s out %s error %s", p.returncode, out, err)
-            if p.returncode == -2:
-                raise KeyboardInterrupt
-            elif p.returncode == 127:  # Cannot open shared object file
-                raise RuntimeError
-            elif p.returncode == -6:  # Too many open files
-                raise OSError
-            else:
-                raise UnplayableFile(out, err)
-        d = strings.safe_json_loads(out.decode("utf-8"))
+        cache_key = ffprobe_cache_key(path, args)
+        out = ffprobe_cache_get(cache_key) if cache_key else None
+        if out is None:
+            out = self.probe(path, *args)
+            if cache_key:
+                ffprobe_cache_set(cache_key, out)
+        d = strings.safe_json_loads(out)
 
         self.path = path
 
@@ -375,6 +564,38 @@ class FFProbe:
             ],
         )
 
+    @staticmethod
+    def probe(path, *args) -> str:
+        args = [
+            "ffprobe",
+            "-hide_banner",
+            "-rw_timeout",
+            "100000000",
+            "-timeout",
+            "45000000",
+            "-show_format",
+            "-show_streams",
+            "-show_chapters",
+            "-of",
+            "json",
+            *args,
+            path,
+        ]
+        p = subprocess_scheduler.run(args, resource="io")
+
+        out, err = p.stdout, p.stderr
+        if p.returncode != 0:
+            log.info("ffprobe %s out %s error %s", p.returncode, out, err)
+            if p.returncode == -2:
+                raise KeyboardInterrupt
+            elif p.returncode == 127:  # Cannot open shared object file
+                raise RuntimeError
+            elif p.returncode == -6:  # Too many open files
+                raise OSError
+            else:
+                raise UnplayableFile(out, err)
+        return out.decode("utf-8")
+
     @staticmethod
     def parse_framerate(string) -> float | None:
         top, bot = string.split("/")
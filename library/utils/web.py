@@ -1,4 +1,5 @@
-import argparse, datetime, functools, os, pathlib, random, re, socket, tempfile, time, urllib.error, urllib.parse, urllib.request
+import argparse, datetime, functools, os, pathlib, random, re, socket, tempfile, threading, time, urllib.error, urllib.parse, urllib.request
+from collections import Counter
 from contextlib import suppress
 from email.message import Message
 from pathlib import Path
@@ -9,7 +10,7 @@ from zoneinfo import ZoneInfo
 import bs4, requests, urllib3
 from idna import encode as puny_encode
 
-from library.data.http_errors import HTTPTooManyRequests, raise_for_status
+from library.data.http_errors import HTTPTooManyRequests, UnrecoverableError, raise_for_status
 from library.utils import consts, db_utils, iterables, nums, path_utils, pd_utils, processes, strings
 from library.utils.log_utils import clamp_index, log
 from library.utils.path_utils import path_tuple_from_url
@@ -374,6 +375,128 @@ def url_to_local_path(url, response=None, output_prefix=None):
     return output_path
 
 
+def parse_content_range(value) -> tuple[int, int] | None:
+    # "bytes 0-499/1234" => (0, 499)
+    m = re.fullmatch(r"\s*bytes\s+(\d+)-(\d+)/(?:\d+|\*)\s*", value or "")
+    if m is None:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+def byte_ranges(size, segments) -> list[tuple[int, int]]:
+    segment_size = -(-size // segments)
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+
+class RangeNotSatisfied(Exception):
+    pass
+
+
+host_connections = Counter()  # host => connections counted against --max-host-downloads
+host_connections_lock = threading.Lock()
+
+
+def reserve_host_connections(url, n, limit) -> int:
+    # up to n more connections to the host of url without going over limit; returns how many were reserved
+    host = path_utils.domain_from_url(url)
+    with host_connections_lock:
+        n = max(0, min(n, limit - host_connections[host]))
+        host_connections[host] += n
+    return n
+
+
+def release_host_connections(url, n) -> None:
+    host = path_utils.domain_from_url(url)
+    with host_connections_lock:
+        host_connections[host] -= n
+
+
+def download_segment(args, url, path, start, end) -> None:
+    # fetch bytes start-end (inclusive) into the same position of path; resumes from the last written byte on error
+    position = start
+    retry_num = 0
+    while position <= end:
+        try:
+            r = session.get(url, headers={"Range": f"bytes={position}-{end}"}, stream=True)  # type: ignore
+            try:
+                if r.status_code != 416 and not 200 <= r.status_code < 400:
+                    raise_for_status(r.status_code)  # 429 pauses the host; 5xx is retried below
+                if r.status_code != 206 or parse_content_range(r.headers.get("Content-Range")) != (position, end):
+                    msg = f"{r.status_code} {r.headers.get('Content-Range')}"
+                    raise RangeNotSatisfied(msg)
+
+                with open(path, "r+b") as f:
+                    f.seek(position)
+                    for chunk in r.iter_content(chunk_size=min(args.download_chunk_size, end - position + 1)):
+                        if chunk:
+                            position += f.write(chunk[: end - position + 1])
+            finally:
+                r.close()
+
+            if position <= end:
+                msg = f"Incomplete segment {start}-{end}: stopped at {position}"
+                raise RuntimeError(msg)
+        except (RangeNotSatisfied, HTTPTooManyRequests, UnrecoverableError):
+            raise
+        except Exception as e:
+            if isinstance(e, OSError) and e.errno in consts.EnvironmentErrors:
+                raise
+            retry_num += 1
+            if retry_num > args.http_download_retries:
+                raise
+            log.debug("Segment %s-%s retry #%s %s: %s", start, end, retry_num, url, e)
+            time.sleep(retry_num)
+
+
+def download_segmented(args, url, output_path, remote_size) -> bool:
+    # split the file into byte ranges which download in parallel into a preallocated sparse file
+    # returns False when the server does not honor Range so the caller can fall back to one stream
+    from concurrent.futures import ThreadPoolExecutor
+
+    # the download already holds one connection to the host; the other segments need their own
+    segments = args.download_segments
+    max_host_downloads = getattr(args, "max_host_downloads", None)
+    extra_connections = 0
+    if max_host_downloads:
+        extra_connections = reserve_host_connections(url, segments - 1, max_host_downloads)
+        segments = 1 + extra_connections
+    try:
+        if segments < 2:
+            log.debug("No free --per-host connections for more segments: %s", url)
+            return False
+
+        ranges = byte_ranges(remote_size, segments)
+        temp_path = output_path + ".part"
+        with open(temp_path, "wb") as f:
+            f.truncate(remote_size)
+
+        log.info("Writing %s \n\tto %s in %s segments", url, output_path, len(ranges))
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [pool.submit(download_segment, args, url, temp_path, start, end) for start, end in ranges]
+                for future in futures:
+                    future.result()
+        except RangeNotSatisfied as e:
+            log.info("Server did not honor Range (%s). Downloading as a single stream: %s", e, url)
+            Path(temp_path).unlink(missing_ok=True)
+            return False
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+    finally:
+        if extra_connections:
+            release_host_connections(url, extra_connections)
+
+    downloaded_size = os.path.getsize(temp_path)
+    if downloaded_size != remote_size:
+        Path(temp_path).unlink(missing_ok=True)
+        msg = f"Incomplete download ({strings.safe_percent(downloaded_size/remote_size)}) {output_path}"
+        raise RuntimeError(msg)
+
+    os.replace(temp_path, output_path)
+    return True
+
+
 def download_url(args, url: str, output_path=None, retry_num=0) -> str | None:
     global session
     if session is None:
@@ -427,6 +550,18 @@ def download_url(args, url: str, output_path=None, retry_num=0) -> str | None:
                         r = session.get(url, stream=True)
             else:
                 p.unlink()
+        elif (
+            (getattr(args, "download_segments", None) or 1) > 1
+            and remote_size
+            and remote_size > args.download_chunk_size * 2
+            and r.headers.get("Accept-Ranges", "").lower() != "none"
+        ):
+            r.close()  # close previous session before opening new ones
+            if download_segmented(args, url, output_path, remote_size):
+                set_timestamp(r.headers, output_path)
+                post_download(args)
+                return output_path
+            r = session.get(url, stream=True)
         else:
             log.info("Writing %s \n\tto %s", url, output_path)
 
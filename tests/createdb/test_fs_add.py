@@ -1,6 +1,11 @@
+import os, shutil
+from pathlib import Path
 from unittest import mock
 
 from library.__main__ import library as lb
+from library.mediadb import db_folders
+from library.utils import consts
+from tests.utils import connect_db_args
 
 
 @mock.patch("library.playback.media_printer.media_printer")
@@ -36,3 +41,100 @@ def test_fsupdate_multi(mocked, temp_db):
     lb(["playlists", db1])
     out = mocked.call_args[0][1]
     assert len(out) == 3
+
+
+def test_fsupdate_journal(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file4.txt": "4"}, "folder2": {"file2.txt": "2"}})
+    for folder in [src1, os.path.join(src1, "folder1"), os.path.join(src1, "folder2")]:
+        os.utime(folder, ns=(0, 0))
+    lb(["fsadd", "--fs", db1, src1])
+
+    args = connect_db_args(db1)
+    assert args.db.pop("select count(*) from fs_journal where mtime_ns is not null") == 3
+
+    Path(src1, "folder1", "file3.txt").write_text("3")
+    Path(src1, "folder1", "file4.txt").unlink()
+    shutil.rmtree(os.path.join(src1, "folder2"))
+    Path(src1, "folder3").mkdir()
+    Path(src1, "folder3", "file5.txt").write_text("5")
+    lb(["fsupdate", db1])
+
+    media = {os.path.basename(d["path"]): d["time_deleted"] for d in args.db.query("select * from media")}
+    assert media == {
+        "file1.txt": 0,
+        "file2.txt": consts.APPLICATION_START,
+        "file3.txt": 0,
+        "file4.txt": consts.APPLICATION_START,
+        "file5.txt": 0,
+    }
+    assert args.db.pop("select count(*) from fs_journal where path like ?", ["%folder2"]) == 0
+
+    # unchanged folders are not listed again
+    os.utime(os.path.join(src1, "folder1"), ns=(0, 0))
+    lb(["fsupdate", db1])
+    Path(src1, "folder1", "file6.txt").write_text("6")
+    os.utime(os.path.join(src1, "folder1"), ns=(0, 0))
+    lb(["fsupdate", db1])
+    assert args.db.pop("select count(*) from media where path like ?", ["%file6.txt"]) == 0
+
+
+def test_fsupdate_journal_scan_signature(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file2.md": "2", "file3.txt": "3"}})
+    for folder in [src1, os.path.join(src1, "folder1")]:
+        os.utime(folder, ns=(0, 0))
+    lb(["fsadd", db1, src1, "--fs", "--ext", "txt", "--exclude", "*file3*"])
+    lb(["fsupdate", db1, "--ext", "txt", "--exclude", "*file3*"])
+
+    args = connect_db_args(db1)
+    assert {os.path.basename(d["path"]) for d in args.db.query("select path from media")} == {"file1.txt"}
+
+    # unchanged folders are listed again when the extensions are different; --exclude is saved with the playlist
+    lb(["fsupdate", db1, "--ext", "txt,md"])
+    media = {os.path.basename(d["path"]) for d in args.db.query("select path from media")}
+    assert media == {"file1.txt", "file2.md"}
+
+
+def test_fsupdate_folders(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file4.txt": "4444"}, "folder2": {"sub": {"file2.txt": "22"}}})
+    lb(["fsadd", "--fs", db1, src1])
+
+    args = connect_db_args(db1)
+    folders = {d["path"]: d for d in args.db.query("select * from folders")}
+    root = src1 + os.sep
+    assert folders[root]["count"] == 3
+    assert folders[root]["size"] == 7
+    assert folders[root]["direct_count"] == 0
+    assert folders[os.path.join(src1, "folder2", "sub") + os.sep]["direct_size"] == 2
+
+    Path(src1, "folder1", "file4.txt").unlink()
+    Path(src1, "folder3").mkdir()
+    Path(src1, "folder3", "file5.txt").write_text("55555")
+    lb(["fsupdate", db1])
+    with args.db.conn:
+        args.db.conn.execute("update media set size = 10 where path like ?", ["%file1.txt"])
+        args.db.conn.execute("delete from media where path like ?", ["%file2.txt"])
+
+    db_folders.refresh(args)
+    refreshed = list(args.db.query("select * from folders order by path"))
+    db_folders.rebuild(args)
+    assert refreshed == list(args.db.query("select * from folders order by path"))
+
+    folders = {d["path"]: d for d in refreshed}
+    assert folders[root]["count"] == 2
+    assert folders[root]["size"] == 15
+    assert folders[root]["deleted"] == 1
+    assert folders[root]["deleted_size"] == 4
+    assert os.path.join(src1, "folder2") + os.sep not in folders
+
+
+def test_fsadd_captions(temp_db):
+    db1 = temp_db()
+    lb(["fsadd", db1, "--scan-subtitles", "tests/data/", "-E", "Youtube"])
+
+    args = connect_db_args(db1)
+    captions = list(args.db.query("select path, text from captions join media on media.id = media_id"))
+    assert len(captions) == 6
+    assert all(d["path"] for d in captions)
@@ -1,4 +1,11 @@
+import asyncio, queue, sqlite3
+from unittest import mock
+
+import pytest
+
 from library.__main__ import library as lb
+from library.createdb import hn_add
+from library.utils.objects import NoneSpace
 from tests.utils import connect_db_args
 
 
@@ -8,3 +15,45 @@ def test_lb_hn_add(temp_db):
 
     args = connect_db_args(db1)
     assert args.db.pop("SELECT COUNT(*) FROM hn_story") == 3
+
+
+def test_hn_db_worker(temp_db):
+    db1 = temp_db()
+    args = NoneSpace(database=db1, verbose=0, batch_size=2)
+
+    q = queue.Queue()
+    q.put(("story", {"id": 1, "title": "a", "kids": [3]}))
+    q.put(("comment", {"id": 3, "text": "b"}))
+    q.put(("story", {"id": 2, "title": "c", "score": 5}))
+    q.put(("story", {"id": 1, "title": "a2", "kids": [3]}))  # resumed run overlapping the gap
+    q.put(None)
+    errors = []
+    hn_add.db_worker(args, q, errors)
+
+    assert errors == []
+    args = connect_db_args(db1)
+    assert list(args.db.query("SELECT id, title, kids, score FROM hn_story")) == [
+        {"id": 1, "title": "a2", "kids": "[3]", "score": None},
+        {"id": 2, "title": "c", "kids": None, "score": 5},
+    ]
+    assert args.db.pop("SELECT COUNT(*) FROM hn_comment") == 1
+
+
+def test_hn_run_stops_after_db_error():
+    pytest.importorskip("aiohttp")
+    args = NoneSpace(oldest=True, oldest_id=0, latest_id=1000)
+    db_errors = []
+    fetched = []
+
+    async def get_hn_item(session, db_queue, sem, hn_id):
+        try:
+            fetched.append(hn_id)
+            if hn_id == 5:
+                db_errors.append(sqlite3.OperationalError("disk I/O error"))
+            await asyncio.sleep(0.01)
+        finally:
+            sem.release()
+
+    with mock.patch.object(hn_add, "get_hn_item", get_hn_item):
+        asyncio.run(hn_add.run(args, queue.Queue(), db_errors))
+    assert len(fetched) < 100
@@ -70,3 +70,25 @@ def test_dedupe(db1, flags, expected):
 
     assert len(media) == len(expected)
     assert media == expected
+
+
+def test_dedupe_upsert(temp_db):
+    db1 = temp_db()
+    args = connect_db_args(db1)
+    args.db["media"].insert_all(
+        [
+            {"id": 1, "path": "path1", "title": None, "size": 0},
+            {"id": 2, "path": "path1", "title": "title1", "size": 2},
+            {"id": 3, "path": "path1", "title": "title2", "size": None},
+            {"id": 4, "path": "path2", "title": None, "size": 4},
+        ],
+        pk="id",
+    )
+
+    lb(["dedupe-dbs", db1, "media", "--bk=path", "--skip-0"])
+
+    args = connect_db_args(db1)
+    assert list(args.db.query("SELECT * FROM media")) == [
+        {"id": 1, "path": "path1", "title": "title2", "size": 2},
+        {"id": 4, "path": "path2", "title": None, "size": 4},
+    ]
@@ -1 +1,25 @@
-#
+import json
+
+from library.__main__ import library as lb
+from tests.utils import connect_db_args
+
+POSTS = [
+    {"url": "https://i.redd.it/a.jpg", "title": "a", "subreddit": "pics", "created_utc": 1},
+    {"url": "https://www.reddit.com/r/test/1", "selftext": "hello", "title": "b", "subreddit": "test"},
+    {"url": "https://www.reddit.com/r/test/2", "selftext": "[removed]", "title": "c", "subreddit": "test"},
+]
+
+
+def test_pushshift_files(temp_db, tmp_path):
+    db1 = temp_db()
+    jsonl = tmp_path / "RS_2005-07.jsonl"
+    jsonl.write_text("\n".join(json.dumps(d) for d in POSTS) + "\nnot json\n\n")
+
+    lb(["pushshift", db1, str(jsonl), "--batch-size=1", "--threads=2"])
+
+    args = connect_db_args(db1)
+    assert [d["title"] for d in args.db.query("SELECT title FROM reddit_posts")] == ["b"]
+    assert [d["path"] for d in args.db.query("SELECT path FROM media")] == [
+        "https://i.redd.it/a.jpg",
+        "https://www.reddit.com/r/test/2",
+    ]
@@ -0,0 +1,56 @@
+import random, time
+
+import pytest
+
+from library.files import similar_files
+from library.utils.objects import NoneSpace
+from tests.utils import benchmark
+
+
+def cluster_by_size_naive(args, media):
+    groups = []
+    media_groups = []
+    for m in media:
+        for i, m0 in enumerate(groups):
+            if similar_files.is_same_size_group(args, m0, m):
+                media_groups.append(i)
+                break
+        else:
+            media_groups.append(len(groups))
+            groups.append(m)
+    return media_groups
+
+
+@pytest.mark.parametrize("filter_sizes", [True, False])
+@pytest.mark.parametrize("filter_durations", [True, False])
+@pytest.mark.parametrize("delta", [0.5, 5, 10, 150, 250])
+def test_cluster_by_size_matches_naive(filter_sizes, filter_durations, delta):
+    args = NoneSpace(
+        filter_sizes=filter_sizes, filter_durations=filter_durations, sizes_delta=delta, durations_delta=delta
+    )
+    rng = random.Random(delta)
+    media = [
+        {
+            "size": rng.choice([0, rng.randint(1, 50), rng.randint(1, 5_000_000)]),
+            "duration": rng.choice([None, 0, rng.randint(1, 10), rng.uniform(1, 7200)]),
+        }
+        for _ in range(2000)
+    ]
+    assert similar_files.cluster_by_size(args, media) == cluster_by_size_naive(args, media)
+
+
+@benchmark
+def test_cluster_by_size_benchmark():
+    args = NoneSpace(filter_sizes=True, filter_durations=True, sizes_delta=10.0, durations_delta=10.0)
+    rng = random.Random(0)
+    media = [
+        {"size": int(rng.lognormvariate(18, 2)), "duration": rng.choice([None, rng.lognormvariate(6, 1.5)])}
+        for _ in range(1_000_000)
+    ]
+
+    start = time.perf_counter()
+    media_groups = similar_files.cluster_by_size(args, media)
+    elapsed = time.perf_counter() - start
+
+    assert len(media_groups) == len(media)
+    assert elapsed < 60, f"clustering 1M files took {elapsed:.1f}s"
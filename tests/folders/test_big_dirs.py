@@ -0,0 +1,117 @@
+import random, time
+from unittest import mock
+
+import pytest
+
+from library.__main__ import library as lb
+from library.folders import big_dirs
+from library.mediadb import db_folders
+from library.utils.objects import NoneSpace
+from tests.utils import benchmark, connect_db_args
+
+
+def generate_media(n, seed=0):
+    rng = random.Random(seed)
+    folders = [
+        f"/{rng.randint(0, 9)}/{rng.randint(0, 30)}" + f"/{rng.randint(0, 5)}" * rng.randint(0, 3) for _ in range(500)
+    ]
+    return [
+        {
+            "path": f"{rng.choice(folders)}/{i}.mkv",
+            "size": rng.choice([None, 0, rng.randint(1, 5_000_000_000)]),
+            "duration": rng.choice([None, 0, rng.randint(1, 7200)]),
+            "time_deleted": rng.choice([None, 0, 0, 0, 1700000000]),
+            "time_last_played": rng.choice([None, 0, 1700000000]),
+        }
+        for i in range(n)
+    ]
+
+
+def normalize(folders):
+    return sorted(
+        ({k: (round(v, 6) if isinstance(v, float) else v) for k, v in d.items()} for d in folders),
+        key=lambda d: d["path"],
+    )
+
+
+@pytest.mark.parametrize("fn_name", ["group_files_by_parent", "group_files_by_parents"])
+def test_group_files_columnar(fn_name):
+    fn = getattr(big_dirs, fn_name)
+    media = generate_media(500)
+    expected = fn(NoneSpace(columnar=False), media)
+    assert normalize(fn(NoneSpace(columnar=True), media)) == normalize(expected)
+
+
+@benchmark
+@pytest.mark.parametrize("fn_name", ["group_files_by_parent", "group_files_by_parents"])
+def test_group_files_columnar_benchmark(fn_name):
+    fn = getattr(big_dirs, fn_name)
+    media = generate_media(1_000_000)
+
+    start = time.perf_counter()
+    fn(NoneSpace(columnar=False), media)
+    python_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fn(NoneSpace(columnar=True), media)
+    columnar_elapsed = time.perf_counter() - start
+
+    assert columnar_elapsed < python_elapsed, f"python {python_elapsed:.2f}s columnar {columnar_elapsed:.2f}s"
+
+
+@pytest.mark.parametrize(
+    "flags",
+    [
+        [],
+        ["--to-json"],
+        ["-p", "f"],
+        ["-p", "f", "--sort-groups-by", "size"],
+        ["-p", "f", "--folder-counts", "+1"],
+        ["-p", "f", "--sort-groups-by", "deleted desc"],
+        ["-p", "f", "--cols", "path,size,exists"],
+        ["-p", "f", "--parents"],
+    ],
+)
+def test_big_dirs_folders_table(temp_file_tree, temp_db, capsys, flags):
+    db1 = temp_db()
+    src1 = temp_file_tree(
+        {
+            "folder1": {"file1.txt": "1" * 3000, "file2.txt": "22", "file3.txt": "333"},
+            "folder2": {"sub": {"file4.txt": "4444", "file5.txt": "5", "file6.txt": "66"}, "file7.txt": "7"},
+        }
+    )
+    lb(["fsadd", "--fs", db1, src1])
+    args = connect_db_args(db1)
+    with args.db.conn:
+        args.db.conn.execute("UPDATE media SET time_deleted = 1 WHERE path LIKE ?", ["%file2.txt"])
+    db_folders.refresh(args)
+    capsys.readouterr()
+
+    def big_dirs_output(folders_table_usable):
+        with (
+            mock.patch.object(big_dirs.db_folders, "usable", return_value=folders_table_usable),
+            mock.patch.object(
+                big_dirs, "group_files_from_folders_table", wraps=big_dirs.group_files_from_folders_table
+            ) as from_folders_table,
+        ):
+            lb(["big-dirs", db1, "--folder-sizes", "+0", *flags])
+        return capsys.readouterr().out, from_folders_table.called
+
+    output, used_folders_table = big_dirs_output(True)
+    assert output.strip()
+    assert used_folders_table == (flags[:2] == ["-p", "f"] and "--parents" not in flags)
+    assert output == big_dirs_output(False)[0]
+
+
+def test_big_dirs_folders_table_read_only(temp_file_tree, temp_db):
+    db1 = temp_db()
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1", "file2.txt": "22", "file3.txt": "333"}})
+    lb(["fsadd", "--fs", db1, src1])
+    args = connect_db_args(db1)
+    with args.db.conn:
+        args.db.conn.execute("UPDATE media SET size = 10 WHERE path LIKE ?", ["%file1.txt"])
+
+    with mock.patch.object(big_dirs.media_printer, "media_printer") as printer:
+        lb(["big-dirs", db1, "--folder-sizes", "+0"])
+    assert printer.call_args[0][1][0]["size"] == 15  # stale rollup is not used
+    assert args.db.pop("SELECT COUNT(*) FROM folders_dirty") == 1
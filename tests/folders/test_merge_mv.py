@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from unittest import mock
 
 import pytest
 
@@ -333,3 +334,33 @@ def test_relmv(temp_file_tree, src, use_parent, relative_to):
         expected_results = {Path(target).name: src1_inodes["file4.txt"]}
 
     assert generate_file_tree_dict(target) == expected_results
+
+
+def test_merge_mv_limit_threads(temp_file_tree):
+    src1 = temp_file_tree({f"file{i}.txt": str(i) for i in range(10)})
+    dest = temp_file_tree({})
+
+    with pytest.raises(SystemExit):
+        lb(["merge-mv", "--threads=4", "--limit=3", src1, dest])
+
+    assert len(generate_file_tree_dict(dest, inodes=False)) == 3
+    assert len(generate_file_tree_dict(src1, inodes=False)) == 7
+
+
+def test_merge_mv_threads_same_dest(temp_file_tree):
+    sources = [temp_file_tree({"file4.txt": str(i)}) for i in range(4)]
+    dest = temp_file_tree({})
+
+    lb(["merge-mv", "--threads=4", "--file-over-file", "rename-src", *sources, dest])
+
+    assert sorted(generate_file_tree_dict(dest, inodes=False).values()) == ["0", "1", "2", "3"]
+
+
+def test_merge_mv_serial_by_default(temp_file_tree):
+    src1 = temp_file_tree({f"file{i}.txt": str(i) for i in range(3)})
+    dest = temp_file_tree({})
+
+    with mock.patch("concurrent.futures.ThreadPoolExecutor") as executor:
+        lb(["merge-mv", src1, dest])
+    executor.assert_not_called()
+    assert len(generate_file_tree_dict(dest, inodes=False)) == 3
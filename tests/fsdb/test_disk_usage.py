@@ -1,6 +1,10 @@
 import json
+from unittest import mock
+
+import pytest
 
 from library.__main__ import library as lb
+from library.fsdb import disk_usage
 from library.utils import consts
 from tests.utils import v_db
 
@@ -17,3 +21,28 @@ def test_disk_usage(assert_unchanged, capsys):
     assert_unchanged(
         [json.loads(line) for line in captured.strip().split("\n")], basename=f"test_disk_usage.{platform}"
     )
+
+
+@pytest.mark.parametrize("flags", [[], ["--depth", "4"], ["--files-only"]])
+def test_disk_usage_folders_table(temp_file_tree, temp_db, flags):
+    db1 = temp_db()
+    src1 = temp_file_tree(
+        {
+            "folder1": {"file1.txt": "1" * 3000, "file2.txt": "22", "file3.txt": "333"},
+            "folder2": {"sub": {"file4.txt": "4444", "file5.txt": "5"}, "file7.txt": "7"},
+            "file8.txt": "88",
+        }
+    )
+    lb(["fsadd", "--fs", db1, src1])
+
+    def disk_usage_output(use_folders_table):
+        with (
+            mock.patch.object(disk_usage.db_folders, "usable", return_value=use_folders_table),
+            mock.patch.object(disk_usage.media_printer, "media_printer") as printer,
+        ):
+            lb(["disk-usage", db1, *flags])
+        return [{k: d.get(k) for k in ["path", "size", "count"]} for d in printer.call_args[0][1]]
+
+    paths = disk_usage_output(True)
+    assert paths
+    assert paths == disk_usage_output(False)
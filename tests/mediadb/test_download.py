@@ -1,9 +1,12 @@
-import os
+import os, threading, time
+from types import SimpleNamespace
 
 import pytest
 
 from library.__main__ import library as lb
 from library.createdb.tube_add import tube_add
+from library.data.http_errors import HTTPTooManyRequests
+from library.mediadb import download
 from library.utils import consts
 from tests.utils import connect_db_args
 
@@ -38,3 +41,45 @@ def test_yt():
     video_id = "BaW_jenozKc"
     thumbnail_path = os.path.join(STORAGE_PREFIX, "Youtube", "Philipp Hagemeister", f"{video_id}.jpg")
     assert os.path.exists(thumbnail_path), "Thumbnail file does not exist"
+
+
+def test_schedule_downloads_per_host(monkeypatch):
+    lock = threading.Lock()
+    active = {}
+    max_active = {}
+    throttled = set()
+
+    def fetch_path(args, m, get_inner_urls):
+        host = m["path"].split("/")[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            max_active[host] = max(max_active.get(host, 0), active[host])
+        try:
+            time.sleep(0.01)
+            if m["path"].endswith("/0") and m["path"] not in throttled:
+                throttled.add(m["path"])
+                raise HTTPTooManyRequests
+            return [{"webpath": m["path"]}]
+        finally:
+            with lock:
+                active[host] -= 1
+
+    saved = []
+    monkeypatch.setattr(download, "fetch_path", fetch_path)
+    monkeypatch.setattr(download.db_media, "download_add", lambda args, **kwargs: saved.append(kwargs["webpath"]))
+    monkeypatch.setattr(download.time, "sleep", lambda s: None)
+
+    media = [{"path": f"https://host{h}.example.com/{i}"} for i in range(10) for h in range(4)]
+    args = SimpleNamespace(
+        verbose=0,
+        threads=8,
+        max_host_downloads=2,
+        sleep_interval_requests=0,
+        http_download_retries=3,
+        database="",
+    )
+    download.schedule_downloads(args, media, None)
+
+    assert sorted(saved) == sorted(m["path"] for m in media)
+    assert max(max_active.values()) <= 2
+    assert len(throttled) == 4
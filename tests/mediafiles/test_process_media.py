@@ -1,6 +1,12 @@
+import argparse, os, threading, time
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
 import pytest
 
 from library.__main__ import library as lb
+from library.mediafiles import process_media
 from library.utils import devices
 
 
@@ -13,3 +19,69 @@ def test_shrink(temp_db, capsys):
     captured = capsys.readouterr().out
     assert "Video: mp4" in captured.replace("\n", "")
     assert len(captured) > 150
+
+
+def test_run_jobs_limits(tmp_path):
+    media = []
+    for i in range(8):
+        p = tmp_path / f"{i}.jpg"
+        p.write_bytes(b"0" * 100)
+        media_type, duration = ("Video", 2) if i % 2 else ("Image", None)
+        media.append(
+            {
+                "path": str(p),
+                "ext": "jpg",
+                "size": 100,
+                "duration": duration,
+                "future_size": 10,
+                "media_type": media_type,
+            }
+        )
+
+    lock = threading.Lock()
+    running = Counter()
+    most_running = Counter()
+    started = []
+
+    def fake_process_path(args, m):
+        with lock:
+            started.append(m["path"])
+            running[m["media_type"]] += 1
+            most_running[m["media_type"]] = max(most_running[m["media_type"]], running[m["media_type"]])
+        time.sleep(0.02)
+        with lock:
+            running[m["media_type"]] -= 1
+        os.unlink(m["path"])
+        return {**m, "new_path": m["path"] + ".avif", "new_size": 10, "elapsed": 0.02}
+
+    args = argparse.Namespace(
+        simulate=False,
+        database=None,
+        threads=None,
+        max_savings=None,
+        video_threads=1,
+        audio_threads=1,
+        image_threads=3,
+        text_threads=1,
+        stats_db=str(tmp_path / "stats.db"),
+    )
+    with mock.patch.object(process_media, "process_path", side_effect=fake_process_path):
+        process_media.run_jobs(args, media)
+    assert sorted(started) == sorted(m["path"] for m in media)
+    assert most_running["Video"] == 1
+    assert 1 < most_running["Image"] <= 3
+
+    rates = process_media.load_processing_rates(args)
+    assert rates["Video"] == pytest.approx(0.01)  # 0.02s per 2s of video
+    assert rates[("Image", "jpg")] == pytest.approx(0.0002)  # 0.02s per 100 bytes
+    args.processing_rates = rates
+    assert process_media.estimate_processing_time(args, {**media[1], "duration": 100}, 60) == pytest.approx(1)
+    assert process_media.estimate_processing_time(args, {**media[0], "media_type": "Text"}, 60) == 60
+
+    args.max_savings = 150
+    for m in media:
+        Path(m["path"]).write_bytes(b"0" * 100)
+    started.clear()
+    with mock.patch.object(process_media, "process_path", side_effect=fake_process_path):
+        process_media.run_jobs(args, media)
+    assert 2 <= len(started) < len(media)
@@ -0,0 +1,42 @@
+from library.__main__ import library as lb
+from library.mediadb import db_history
+from tests.utils import connect_db_args
+
+
+def test_copy_play_counts(temp_db):
+    source_db, target_db = temp_db(), temp_db()
+
+    s = connect_db_args(source_db)
+    s.db["media"].insert_all([{"id": i, "path": f"/old/{i}.mp4"} for i in range(1, 6)], pk="id")
+    db_history.create(s)
+    db_history.add(s, ["/old/1.mp4", "/old/2.mp4", "/old/3.mp4"], time_played=100, playhead=5, mark_done=True)
+    s.db["history"].insert({"media_id": 4, "time_played": 0, "playhead": 0})  # not played
+
+    t = connect_db_args(target_db)
+    t.db["media"].insert_all([{"id": i, "path": f"/new/{i}.mp4"} for i in range(10, 13)], pk="id")
+    t.db["media"].create_index(["path"], unique=True)
+
+    lb(["copy-play-counts", source_db, target_db, "--source-prefix", "/old/", "--target-prefix", "/new/"])
+
+    t = connect_db_args(target_db)
+    assert t.db.pop("SELECT COUNT(*) FROM history") == 0  # no matching paths
+
+    t.db["media"].insert_all([{"id": i, "path": f"/new/{i}.mp4"} for i in range(1, 5)], pk="id")
+    lb(["copy-play-counts", source_db, target_db, "--source-prefix", "/old/", "--target-prefix", "/new/"])
+    lb(["copy-play-counts", source_db, target_db, "--source-prefix", "/old/", "--target-prefix", "/new/"])
+
+    t = connect_db_args(target_db)
+    rows = list(t.db.query("SELECT media_id, time_played, playhead, done FROM history ORDER BY media_id"))
+    assert rows == [{"media_id": i, "time_played": 100, "playhead": 5, "done": 1} for i in range(1, 4)]
+
+    db_history.remove(t, paths=["/new/1.mp4"], media_ids=[2])
+    assert [d["media_id"] for d in t.db.query("SELECT media_id FROM history")] == [3]
+
+
+def test_history_add_duplicate_path(temp_db):
+    args = connect_db_args(temp_db())
+    args.db["media"].insert_all(
+        [{"id": 1, "playlists_id": 1, "path": "/a.mp4"}, {"id": 2, "playlists_id": 2, "path": "/a.mp4"}], pk="id"
+    )
+    db_history.add(args, ["/a.mp4", "/b.mp4"], time_played=100)
+    assert [d["media_id"] for d in args.db.query("SELECT media_id FROM history")] == [1]
@@ -1,3 +1,5 @@
+import pytest
+
 from library.__main__ import library as lb
 from tests.utils import connect_db_args, links_db, v_db
 
@@ -16,3 +18,43 @@ def test_split(temp_db):
 
     args = connect_db_args(db1)
     assert args.db.pop("SELECT COUNT(*) FROM media") == 10
+
+
+def test_merge_upsert_keeps_values(temp_db):
+    db1, db2 = temp_db(), temp_db()
+    s = connect_db_args(db1)
+    s.db["media"].insert_all([{"path": "a", "size": None, "title": "new"}, {"path": "b", "size": 2, "title": None}])
+    t = connect_db_args(db2)
+    t.db["media"].insert_all([{"path": "a", "size": 1, "title": "old"}], pk="path")
+
+    lb(["merge-dbs", "--pk", "path", "--upsert", "--ignore", db1, db2])
+
+    t = connect_db_args(db2)
+    assert list(t.db.query("SELECT path, size, title FROM media ORDER BY path")) == [
+        {"path": "a", "size": 1, "title": "new"},
+        {"path": "b", "size": 2, "title": None},
+    ]
+
+
+@pytest.mark.parametrize("flags", [[], ["--ignore"], ["--upsert"]])
+def test_merge_bulk_load(temp_db, flags):
+    src1, src2, db1, expected_db = temp_db(), temp_db(), temp_db(), temp_db()
+    s = connect_db_args(src1)
+    s.db["media"].insert_all(
+        [{"path": p, "size": i, "title": None if i % 2 else f"t{i}"} for i, p in enumerate("dbeac")], pk="path"
+    )
+    s = connect_db_args(src2)
+    s.db["media"].insert_all([{"path": p, "size": i * 10, "title": f"u{i}"} for i, p in enumerate("xbz")], pk="path")
+    for target_db in [db1, expected_db]:
+        t = connect_db_args(target_db)
+        t.db["media"].insert_all([{"path": "a", "size": 100, "title": "old"}, {"path": "z", "size": 1}], pk="path")
+        t.db["media"].create_index(["size"])
+
+    lb(["merge-dbs", *flags, src1, src2, expected_db])
+    lb(["merge-dbs", *flags, "--bulk-load", src1, src2, db1])
+
+    expected, t = connect_db_args(expected_db), connect_db_args(db1)
+    assert sorted(t.db.table_names()) == sorted(expected.db.table_names())
+    for table in expected.db.table_names():
+        assert sorted(map(repr, t.db[table].rows)) == sorted(map(repr, expected.db[table].rows))
+    assert [o.columns for o in t.db["media"].indexes if not o.unique] == [["size"]]
@@ -1,4 +1,4 @@
-import tempfile, unittest
+import tempfile, threading, unittest
 from pathlib import Path
 from types import SimpleNamespace
 from unittest import mock
@@ -77,6 +77,30 @@ def test_prefetch(media):
     assert prep.remaining == 0
 
 
+def test_prefetch_does_not_block(media):
+    args = NoneSpace(prefetch=2, database=":memory:", action=consts.SC.watch)
+    first = media[0]
+    prep = MediaPrefetcher(args, media)
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_prep_media(m):
+        started.set()
+        release.wait(timeout=10)
+        return m
+
+    with mock.patch.object(prep, "prep_media", side_effect=slow_prep_media):
+        prep.fetch()  # returns while media are still being prepared
+        assert started.wait(timeout=10)
+        assert not prep.futures[0].done()
+        assert len(prep.futures) == 2
+
+        release.set()
+        assert prep.get_m() == first
+    prep.close()
+
+
 def test_wt_help(capsys):
     wt_help_text = "usage:,where,sort,--duration".split(",")
 
@@ -71,6 +71,7 @@ media_flags = [
     ("-RR", 4, "corrupt.mp4"),
     ("-B --sort-groups-by size", 4, "corrupt.mp4"),
     ("-B --parents", 4, "corrupt.mp4"),
+    ("-B -L inf", 4, "corrupt.mp4"),
     ("-u duration", 5, "corrupt.mp4"),
     ("--portrait", 5, "corrupt.mp4"),
     ("--fetch-siblings if-audiobook", 5, "corrupt.mp4"),
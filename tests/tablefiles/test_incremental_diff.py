@@ -25,3 +25,82 @@ def test_lb_incremental_diff(args, stdout, capsys):
     lb(["incremental-diff", *args])
     captured = capsys.readouterr().out
     assert all(l in captured for l in stdout)
+
+
+def test_lb_incremental_diff_sorted_chunks(tmp_path, capsys):
+    path1 = tmp_path / "a.csv"
+    path2 = tmp_path / "b.csv"
+    path1.write_text("id,v\n" + "".join(f"{i},{i}\n" for i in range(10)))
+    path2.write_text("id,v\n" + "".join(f"{i},{i if i != 7 else 70}\n" for i in range(10) if i != 3))
+
+    lb(["incremental-diff", "--batch-size=2", "--join-keys=id,v", str(path1), str(path2)])
+    captured = capsys.readouterr().out
+    assert captured.count("left_only") == 2  # 3 is only in the left file; 7 changed
+    assert captured.count("right_only") == 1
+    assert "70" in captured
+
+
+def test_lb_incremental_diff_sqlite_keyset(tmp_path, capsys):
+    from sqlite_utils import Database
+
+    path1 = str(tmp_path / "a.db")
+    path2 = str(tmp_path / "b.db")
+    Database(path1)["t"].insert_all({"id": i, "v": i} for i in range(10))
+    Database(path2)["t"].insert_all({"id": i, "v": i if i != 4 else 40} for i in range(10))
+
+    lb(["incremental-diff", "--batch-size=3", path1, path2])
+    captured = capsys.readouterr().out
+    assert captured.count("left_only") == 1
+    assert captured.count("right_only") == 1
+    assert "40" in captured
+
+
+def test_lb_incremental_diff_partitions(tmp_path, capsys):
+    path1 = tmp_path / "a.csv"
+    path2 = tmp_path / "b.csv"
+    path1.write_text("id,v\n" + "".join(f"{i},{i}\n" for i in [5, 2, 9, 0, 7, 3, 1, 8, 4, 6]))
+    path2.write_text("id,v\n" + "".join(f"{i},{i if i != 7 else 70}\n" for i in [0, 1, 2, 4, 5, 6, 7, 8, 9][::-1]))
+
+    lb(["incremental-diff", "--batch-size=2", "--partitions=3", "--join-keys=id,v", str(path1), str(path2)])
+    captured = capsys.readouterr().out
+    assert captured.count("left_only") == 2  # 3 is only in the left file; 7 changed
+    assert captured.count("right_only") == 1
+    assert "70" in captured
+
+
+def test_lb_incremental_diff_null_keys(tmp_path, capsys):
+    from sqlite_utils import Database
+
+    path1 = str(tmp_path / "a.db")
+    path2 = str(tmp_path / "b.db")
+    Database(path1)["t"].insert_all({"id": i, "v": i} for i in [None, None, *range(6)])
+    Database(path2)["t"].insert_all({"id": i, "v": i if i != 4 else 40} for i in [None, *range(6)])
+
+    lb(["incremental-diff", "--batch-size=2", "--join-keys=id,v", path1, path2])
+    captured = capsys.readouterr().out
+    assert captured.count("left_only") == 1
+    assert captured.count("right_only") == 1
+    assert "40" in captured
+
+
+def test_lb_incremental_diff_nan_keys(tmp_path, capsys):
+    path1 = tmp_path / "a.csv"
+    path2 = tmp_path / "b.csv"
+    path1.write_text("id,v\n,a\n,b\n" + "".join(f"{i},v{i}\n" for i in range(6)))
+    path2.write_text("id,v\n,a\n" + "".join(f"{i},v{i if i != 2 else 20}\n" for i in range(6)))
+
+    lb(["incremental-diff", "--batch-size=2", "--join-keys=id,v", str(path1), str(path2)])
+    captured = capsys.readouterr().out
+    assert captured.count("left_only") == 2  # ,b is only in the left file; 2 changed
+    assert captured.count("right_only") == 1
+    assert "20" in captured
+
+
+def test_lb_incremental_diff_partitions_mixed_dtypes(tmp_path, capsys):
+    path1 = tmp_path / "a.csv"
+    path2 = tmp_path / "b.csv"
+    path1.write_text("id,v\n,x\n5,a\n1,b\n2,c\n3,d\n")  # first chunk of ids is read as float
+    path2.write_text("id,v\n1,b\n5,a\n2,c\n3,d\n,x\n")
+
+    lb(["incremental-diff", "--batch-size=2", "--partitions=3", "--join-keys=id", str(path1), str(path2)])
+    assert "_merge" not in capsys.readouterr().out
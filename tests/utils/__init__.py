@@ -1,10 +1,15 @@
+import os
 from datetime import datetime, timezone
 from pathlib import Path
 
+import pytest
+
 from library.__main__ import library as lb
 from library.utils import argparse_utils, consts, db_utils
 from library.utils.objects import NoneSpace
 
+benchmark = pytest.mark.skipif(not os.environ.get("LIBRARY_BENCHMARKS"), reason="set LIBRARY_BENCHMARKS=1 to run")
+
 
 def take5():
     num = 0
@@ -0,0 +1,86 @@
+import errno, os
+from unittest import mock
+
+import pytest
+
+from library.utils import consts, file_utils
+
+
+def make_sparse_file(path):
+    with open(path, "wb") as f:
+        f.write(b"start")
+        f.seek(4 * 1024 * 1024)
+        f.write(b"middle")
+        f.truncate(12 * 1024 * 1024)
+    os.utime(path, (1_000_000, 1_000_000))
+
+
+def test_fast_copy(tmp_path):
+    src = str(tmp_path / "src")
+    make_sparse_file(src)
+
+    dest = file_utils.fast_copy(src, str(tmp_path / "dest"))
+    with open(src, "rb") as f1, open(dest, "rb") as f2:
+        assert f1.read() == f2.read()
+    assert os.stat(dest).st_mtime == 1_000_000
+    if consts.IS_LINUX:
+        assert os.stat(dest).st_blocks <= os.stat(src).st_blocks + 8
+
+
+def test_fast_copy_into_folder(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"data")
+    (tmp_path / "folder").mkdir()
+
+    assert file_utils.fast_copy(str(src), str(tmp_path / "folder")) == str(tmp_path / "folder" / "src")
+    with pytest.raises(file_utils.shutil.SameFileError):
+        file_utils.fast_copy(str(src), str(src))
+
+
+@pytest.mark.skipif(not consts.IS_LINUX, reason="Linux copy syscalls")
+def test_fast_copy_fallback(tmp_path):
+    src = str(tmp_path / "src")
+    make_sparse_file(src)
+
+    def unsupported(*_args, **_kwargs):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    with mock.patch("fcntl.ioctl", unsupported), mock.patch.object(os, "copy_file_range", unsupported, create=True):
+        with open(src, "rb") as fsrc, open(tmp_path / "dest", "wb") as fdest:
+            assert file_utils.copy_file_data(fsrc.fileno(), fdest.fileno()) == "sendfile"
+        with mock.patch.object(os, "sendfile", unsupported):
+            with open(src, "rb") as fsrc, open(tmp_path / "dest2", "wb") as fdest:
+                assert file_utils.copy_file_data(fsrc.fileno(), fdest.fileno()) == "buffered"
+
+    with open(src, "rb") as f1:
+        data = f1.read()
+    assert (tmp_path / "dest").read_bytes() == data
+    assert (tmp_path / "dest2").read_bytes() == data
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/fd"), reason="requires procfs")
+def test_is_file_open(tmp_path):
+    path = str(tmp_path / "file")
+    with open(path, "w"):
+        assert file_utils.is_file_open(path)
+        assert file_utils.is_file_open(path, max_age=60)  # cached
+    assert file_utils.is_file_open(path, max_age=60)  # stale
+    assert not file_utils.is_file_open(path)
+
+
+@pytest.mark.skipif(not consts.IS_LINUX, reason="Linux copy syscalls")
+def test_fast_copy_zero_return(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(os.urandom(11000))
+
+    def unsupported(*_args, **_kwargs):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    with (
+        mock.patch("fcntl.ioctl", unsupported),
+        mock.patch.object(os, "copy_file_range", return_value=0, create=True),
+        mock.patch.object(os, "sendfile", return_value=0),
+    ):
+        with open(src, "rb") as fsrc, open(tmp_path / "dest", "wb") as fdest:
+            assert file_utils.copy_file_data(fsrc.fileno(), fdest.fileno()) == "buffered"
+    assert (tmp_path / "dest").read_bytes() == src.read_bytes()
@@ -0,0 +1,114 @@
+import asyncio, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from library.utils import processes
+
+
+def test_ffprobe_cache():
+    probe = processes.FFProbe("tests/data/test.mp4")
+    assert probe.has_video
+
+    with mock.patch.object(subprocess, "Popen", side_effect=AssertionError("ffprobe was not cached")):
+        cached_probe = processes.FFProbe("tests/data/test.mp4")
+    assert cached_probe.streams == probe.streams
+    assert cached_probe.duration == probe.duration
+
+    key = processes.ffprobe_cache_key("tests/data/test.mp4", ("-count_frames",))
+    assert processes.ffprobe_cache_get(key) is None
+
+
+def test_imap_unordered_streaming():
+    events = {i: threading.Event() for i in range(4)}
+    pulled = []
+
+    def items():
+        for i in events:
+            pulled.append(i)
+            yield i
+
+    def fn(i):
+        assert events[i].wait(5)
+        return i * 10
+
+    with ThreadPoolExecutor(2) as executor:
+        results = processes.imap_unordered(executor, fn, items(), max_in_flight=2)
+        events[1].set()
+        assert next(results) == (1, 10)
+        assert pulled == [0, 1, 2]  # the next item is only pulled when a slot frees up
+
+        events[2].set()
+        assert next(results) == (2, 20)
+        assert pulled == [0, 1, 2, 3]
+
+        for event in events.values():
+            event.set()
+        assert sorted(results) == [(0, 0), (3, 30)]
+
+
+def test_priority_semaphore_order():
+    async def main():
+        sem = processes.PrioritySemaphore(1)
+        order = []
+
+        async def worker(priority):
+            async with sem.slot(priority):
+                order.append(priority)
+
+        await sem.acquire()
+        tasks = [asyncio.create_task(worker(p)) for p in [5, 1, 3, 1]]
+        await asyncio.sleep(0)  # all workers are waiting
+        sem.release()
+        await asyncio.gather(*tasks)
+        return order, sem.value
+
+    assert asyncio.run(main()) == ([1, 1, 3, 5], 1)
+
+
+def test_priority_semaphore_cancel():
+    async def main():
+        sem = processes.PrioritySemaphore(1)
+        await sem.acquire()
+        cancelled = asyncio.create_task(sem.acquire(0))
+        waiting = asyncio.create_task(sem.acquire(1))
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        sem.release()
+        await asyncio.wait_for(waiting, 1)  # the cancelled waiter's slot is passed on
+        sem.release()
+        return sem.value
+
+    assert asyncio.run(main()) == 1
+
+
+def test_subprocess_scheduler_limits():
+    scheduler = processes.SubprocessScheduler({"one": 1, "two": 2})
+    sleep = [sys.executable, "-c", "import time; time.sleep(0.3)"]
+
+    start = time.monotonic()
+    results = scheduler.run_many([sleep] * 3, resource="one")
+    assert time.monotonic() - start >= 0.9  # one at a time
+    assert [r.returncode for r in results] == [0, 0, 0]
+
+    start = time.monotonic()
+    scheduler.run_many([sleep] * 4, resource="two")
+    assert time.monotonic() - start >= 0.6  # at most two at a time
+    assert scheduler.semaphores["one"].value == 1
+    assert scheduler.semaphores["two"].value == 2
+
+
+def test_subprocess_scheduler_failure_releases_slot():
+    scheduler = processes.SubprocessScheduler({"cpu": 1})
+    assert scheduler.run([sys.executable, "-c", "raise SystemExit(3)"]).returncode == 3
+    with pytest.raises(FileNotFoundError):
+        scheduler.run(["/nonexistent/command"])
+    assert scheduler.semaphores["cpu"].value == 1
+
+    with mock.patch.object(processes, "subprocess_scheduler", scheduler):
+        with pytest.raises(subprocess.CalledProcessError):
+            processes.cmd(sys.executable, "-c", "raise SystemExit(1)", resource="cpu")
+        assert processes.cmd(sys.executable, "-c", "print('ok')", resource="cpu").stdout.strip() == "ok"
+    assert scheduler.semaphores["cpu"].value == 1
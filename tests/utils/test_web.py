@@ -1,9 +1,10 @@
-import pathlib
+import argparse, http.server, pathlib, threading
 
-import pytest
+import pytest, requests
 from bs4 import BeautifulSoup
 
-from library.utils import web
+from library.data.http_errors import HTTPTooManyRequests
+from library.utils import path_utils, web
 from library.utils.path_utils import safe_unquote
 from library.utils.web import WebPath, construct_absolute_url, extract_nearby_text, url_encode, url_to_local_path
 from tests.utils import p
@@ -281,3 +282,117 @@ def test_construct_absolute_url(base_url, href, expected):
 def test_is_subpath(parent_url, child_url, expected):
     result = web.is_subpath(parent_url, child_url)
     assert result is expected
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    data = bytes(range(256)) * 4096
+    honor_range = True
+
+    def do_GET(self):
+        start, end = 0, len(self.data) - 1
+        range_header = self.headers.get("Range")
+        if self.honor_range and range_header:
+            start, end = (int(s) if s else len(self.data) - 1 for s in range_header.split("=")[1].split("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.write(self.data[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("honor_range", [True, False])
+def test_download_url_segments(tmp_path, honor_range):
+    handler = type("Handler", (RangeHandler,), {"honor_range": honor_range})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        args = argparse.Namespace(
+            prefix=str(tmp_path),
+            download_chunk_size=64 * 1024,
+            download_segments=5,
+            http_download_retries=2,
+            allow_insecure=False,
+        )
+        output_path = str(tmp_path / "file.bin")
+        url = f"http://127.0.0.1:{server.server_port}/file.bin"
+        assert web.download_url(args, url, output_path=output_path) == output_path
+        assert pathlib.Path(output_path).read_bytes() == RangeHandler.data
+        assert not pathlib.Path(output_path + ".part").exists()
+    finally:
+        server.shutdown()
+
+
+def test_byte_ranges():
+    assert web.byte_ranges(10, 3) == [(0, 3), (4, 7), (8, 9)]
+    assert web.byte_ranges(10, 1) == [(0, 9)]
+    assert web.parse_content_range("bytes 4-7/10") == (4, 7)
+    assert web.parse_content_range(None) is None
+
+
+class TooManyRequestsHandler(RangeHandler):
+    def do_GET(self):
+        if self.headers.get("Range"):
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            super().do_GET()
+
+
+class CountingRangeHandler(RangeHandler):
+    ranges = []
+
+    def do_GET(self):
+        if self.headers.get("Range"):
+            self.ranges.append(self.headers["Range"])
+        super().do_GET()
+
+
+def serve(handler):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_download_url_segments_too_many_requests(tmp_path, monkeypatch):
+    monkeypatch.setattr(web, "session", requests.Session())  # without urllib3 Retry backoff
+    server = serve(TooManyRequestsHandler)
+    try:
+        args = argparse.Namespace(
+            prefix=str(tmp_path), download_chunk_size=64 * 1024, download_segments=5, http_download_retries=2
+        )
+        output_path = str(tmp_path / "file.bin")
+        with pytest.raises(HTTPTooManyRequests):
+            web.download_url(args, f"http://127.0.0.1:{server.server_port}/file.bin", output_path=output_path)
+        assert not pathlib.Path(output_path + ".part").exists()
+    finally:
+        server.shutdown()
+
+
+def test_download_url_segments_per_host(tmp_path):
+    server = serve(CountingRangeHandler)
+    url = f"http://127.0.0.1:{server.server_port}/file.bin"
+    host = path_utils.domain_from_url(url)
+    web.host_connections[host] += 1  # held by the download scheduler for this file
+    try:
+        args = argparse.Namespace(
+            prefix=str(tmp_path),
+            download_chunk_size=64 * 1024,
+            download_segments=5,
+            http_download_retries=2,
+            max_host_downloads=2,
+        )
+        output_path = str(tmp_path / "file.bin")
+        assert web.download_url(args, url, output_path=output_path) == output_path
+        assert pathlib.Path(output_path).read_bytes() == RangeHandler.data
+        assert len(CountingRangeHandler.ranges) == 2
+        assert web.host_connections[host] == 1
+    finally:
+        web.host_connections[host] -= 1
+        server.shutdown()